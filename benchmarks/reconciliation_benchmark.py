@@ -0,0 +1,163 @@
+"""
+Сравнение вычисления расхождений в памяти (monitoring_data/vectorized_checks.py) с запросом сверки в базе
+мониторинга (monitoring_data/reconciliation.py) на синтетических данных закрытых лицевых счетов.
+
+Запуск из корня проекта:
+    python -m benchmarks.reconciliation_benchmark --rows 10000000
+    python -m benchmarks.reconciliation_benchmark --rows 10000000 --sql   # с загрузкой в базу мониторинга (config.ini)
+"""
+import argparse
+import locale
+import logging
+import shutil
+import tempfile
+import time
+from os import makedirs, path
+import numpy as np
+import pandas as pd
+from database.db_schema import get_table_spec
+from monitoring_data.reconciliation import build_reconciliation_query
+from monitoring_data.vectorized_checks import run_vectorized_reconciliation
+
+ACCOUNT_TYPE = 'closing'
+VALID_STATUSES = [3, 4]
+INVALID_STATUS = 1
+REGIONS = np.array([f'{region:03d}000' for region in range(1, 90)])
+
+
+def generate_data(rows, mismatch_rate, seed):
+    """
+    Синтетические данные мастер-системы и исторической системы с заданной долей расхождений каждого вида.
+    :return: Кортеж (данные мастер-системы, данные исторической системы, ожидаемое количество расхождений).
+    """
+    rng = np.random.default_rng(seed)
+    acc_ids = rng.permutation(rows).astype(np.int64) + 1_000_000_000
+    death_dates = np.datetime64('2024-05-12') + rng.integers(0, 800, rows).astype('timedelta64[D]')
+    master = pd.DataFrame({
+        'snils': np.char.zfill((acc_ids % 100_000_000_000).astype(str), 11),
+        'acc_id': acc_ids,
+        'death_date': death_dates,
+        'closing_region': rng.choice(REGIONS, rows),
+        'closing_reason': rng.choice(['Смерть', 'Упразднение'], rows),
+    })
+
+    kind = rng.random(rows)
+    missing = kind < mismatch_rate
+    status = (kind >= mismatch_rate) & (kind < 2 * mismatch_rate)
+    region = (kind >= 2 * mismatch_rate) & (kind < 3 * mismatch_rate)
+    death_date = (kind >= 3 * mismatch_rate) & (kind < 4 * mismatch_rate)
+
+    historical = pd.DataFrame({
+        'acc_id': acc_ids,
+        'acc_sts': np.where(status, INVALID_STATUS, rng.choice(VALID_STATUSES, rows)).astype(np.int8),
+        'death_date': np.where(death_date, death_dates + np.timedelta64(1, 'D'), death_dates),
+        'closing_region': np.where(region, np.roll(master['closing_region'].to_numpy(), 1),
+                                   master['closing_region'].to_numpy()),
+    })[~missing]
+    # Сдвиг региона может совпасть с исходным значением
+    region &= np.roll(master['closing_region'].to_numpy(), 1) != master['closing_region'].to_numpy()
+    expected = {'missing_in_historical': int(missing.sum()), 'status_mismatch': int(status.sum()),
+                'region_mismatch': int(region.sum()), 'death_date_mismatch': int(death_date.sum())}
+    return master, historical.sample(frac=1, random_state=seed), expected
+
+
+def write_files(directory, master, historical, portion_rows):
+    """
+    Запись данных в формате файлов temp_data: файл мастер-системы и файлы порций исторической системы
+    (с заголовком в верхнем регистре, как во внешних таблицах Netezza).
+    """
+    encoding = locale.getpreferredencoding(False)
+    master.to_csv(path.join(directory, f'master_{ACCOUNT_TYPE}_ils.csv'), sep=';', index=False,
+                  date_format='%Y-%m-%d', encoding=encoding)
+    portions_directory = path.join(directory, f'vlg_mic_historical_{ACCOUNT_TYPE}_ils')
+    makedirs(portions_directory, exist_ok=True)
+    for number, start in enumerate(range(0, len(historical), portion_rows)):
+        historical.iloc[start:start + portion_rows].rename(columns=str.upper).to_csv(
+            path.join(portions_directory, f'vlg_mic_historical_{ACCOUNT_TYPE}_ils_{number}.csv'), sep=';',
+            index=False, date_format='%Y-%m-%d', encoding=encoding)
+    return portions_directory
+
+
+def run_sql(directory, portions_directory):
+    """
+    Загрузка файлов в таблицы bench_* базы мониторинга и выполнение запроса сверки.
+    :return: Словарь {этап: длительность в секундах} и количество строк с расхождениями.
+    """
+    from config import load_db_config
+    from database.connection_pool import get_connection
+    from database.db_operations import DBOperations
+    from os import listdir
+
+    config = load_db_config()
+    connection = get_connection(config, 'monitoring_db')
+    db_ops = DBOperations(connection, db_type=config['monitoring_db']['type'])
+    tables = {f'master_{ACCOUNT_TYPE}_ils': [path.join(directory, f'master_{ACCOUNT_TYPE}_ils.csv')],
+              f'historical_{ACCOUNT_TYPE}_ils': [path.join(portions_directory, f)
+                                                 for f in sorted(listdir(portions_directory))]}
+    timings = {}
+    with connection:
+        start_time = time.time()
+        for base_name, files in tables.items():
+            spec = get_table_spec(base_name)
+            table_name = f'bench_{base_name}'
+            db_ops.drop_table(table_name)
+            db_ops.ensure_table(spec, table_name)
+            with connection.get_cursor() as cur:
+                for file_path in files:
+                    with open(file_path, encoding=locale.getpreferredencoding(False)) as f:
+                        f.readline()  # Заголовок
+                        cur.copy_expert(spec.copy_from_stdin_query(table_name), f)
+            connection.commit()
+        timings['sql_load'] = time.time() - start_time
+
+        start_time = time.time()
+        _, rows = db_ops.fetch_query(build_reconciliation_query(
+            ACCOUNT_TYPE, VALID_STATUSES, master_table=f'bench_master_{ACCOUNT_TYPE}_ils',
+            historical_table=f'bench_historical_{ACCOUNT_TYPE}_ils'))
+        timings['sql_reconciliation'] = time.time() - start_time
+
+        for base_name in tables:
+            db_ops.drop_table(f'bench_{base_name}')
+    return timings, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение вычисления расхождений в памяти и в базе мониторинга")
+    parser.add_argument('--rows', type=int, default=10_000_000, help="Количество лицевых счетов")
+    parser.add_argument('--mismatch-rate', type=float, default=0.01, help="Доля расхождений каждого вида")
+    parser.add_argument('--portion-rows', type=int, default=1_000_000, help="Строк в файле порции")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sql', action='store_true', help="Выполнить сверку в базе мониторинга (config.ini)")
+    parser.add_argument('--directory', help="Каталог для файлов (по умолчанию временный, удаляется)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    directory = args.directory or tempfile.mkdtemp(prefix='reconciliation_benchmark_')
+    makedirs(directory, exist_ok=True)
+    try:
+        start_time = time.time()
+        master, historical, expected = generate_data(args.rows, args.mismatch_rate, args.seed)
+        portions_directory = write_files(directory, master, historical, args.portion_rows)
+        del master, historical
+        logging.info(f"Данные сформированы ({args.rows} строк): {time.time() - start_time:.2f} секунд.")
+
+        start_time = time.time()
+        discrepancies = run_vectorized_reconciliation(directory, ACCOUNT_TYPE, VALID_STATUSES)
+        engine_time = time.time() - start_time
+        counts = {flag: len(frame) for flag, frame in discrepancies.items()}
+        if counts != expected:
+            raise AssertionError(f"Количество расхождений {counts} не совпадает с ожидаемым {expected}")
+        del discrepancies
+        logging.info(f"В памяти (чтение файлов и вычисление): {engine_time:.2f} секунд, расхождения: {counts}.")
+
+        if args.sql:
+            timings, sql_rows = run_sql(directory, portions_directory)
+            logging.info(f"В базе мониторинга: загрузка {timings['sql_load']:.2f} секунд, запрос сверки "
+                         f"{timings['sql_reconciliation']:.2f} секунд ({sql_rows} строк с расхождениями).")
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
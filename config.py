@@ -40,6 +40,127 @@ def load_db_config(filename='config.ini'):
         },
         'ip_for_dashboard': {
             'ip_address': config.get('ip_for_dashboard', 'ip_address'),
+        },
+        'pool': {
+            # Максимальное количество одновременных подключений к каждой базе данных
+            'max_connections': {
+                'master_db': config.getint('pool', 'max_connections_master', fallback=4),
+                'historical_db': config.getint('pool', 'max_connections_historical', fallback=10),
+                'monitoring_db': config.getint('pool', 'max_connections_monitoring', fallback=12),
+                'integrating_db': config.getint('pool', 'max_connections_integrating', fallback=4),
+            },
+            # Время ожидания свободного подключения (секунды)
+            'acquire_timeout': config.getint('pool', 'acquire_timeout', fallback=600),
+            # Подключение, простаивавшее дольше указанного времени (секунды), проверяется перед выдачей
+            'health_check_idle': config.getint('pool', 'health_check_idle', fallback=60),
+        },
+        'retry': {
+            # Политики повторов по типам операций: количество попыток, начальная и максимальная пауза (секунды).
+            # Пауза растет экспоненциально и выбирается случайно в пределах текущего значения
+            'read': {
+                'attempts': config.getint('retry', 'read_attempts', fallback=5),
+                'initial_delay': config.getfloat('retry', 'read_initial_delay', fallback=1),
+                'max_delay': config.getfloat('retry', 'read_max_delay', fallback=30),
+            },
+            'copy': {
+                'attempts': config.getint('retry', 'copy_attempts', fallback=3),
+                'initial_delay': config.getfloat('retry', 'copy_initial_delay', fallback=2),
+                'max_delay': config.getfloat('retry', 'copy_max_delay', fallback=60),
+            },
+            'ddl': {
+                'attempts': config.getint('retry', 'ddl_attempts', fallback=3),
+                'initial_delay': config.getfloat('retry', 'ddl_initial_delay', fallback=1),
+                'max_delay': config.getfloat('retry', 'ddl_max_delay', fallback=30),
+            },
+            # Выгрузка из исторической системы повторяется при ошибках соединения и временных ошибках Netezza
+            'export': {
+                'attempts': config.getint('processing', 'export_max_retries', fallback=5) + 1,
+                'initial_delay': config.getfloat('processing', 'export_retry_delay', fallback=3),
+                'max_delay': config.getfloat('retry', 'export_max_delay', fallback=120),
+            },
+        },
+        'processing': {
+            # Максимальное количество одновременно выполняемых задач конвейера
+            'max_workers': config.getint('processing', 'max_workers', fallback=2),
+            # Режим передачи данных из мастер-системы в мониторинг: csv (через temp_data), stream, stream_binary
+            'master_transfer_mode': config.get('processing', 'master_transfer_mode', fallback='csv'),
+            # Размер блока и количество блоков канала потоковой передачи
+            'stream_chunk_size': config.getint('processing', 'stream_chunk_size', fallback=1024 * 1024),
+            'stream_max_chunks': config.getint('processing', 'stream_max_chunks', fallback=16),
+            # Количество строк, получаемых с сервера за одно обращение при потоковом чтении результатов запросов
+            'stream_itersize': config.getint('processing', 'stream_itersize', fallback=50000),
+            # Передача идентификаторов в историческую систему: csv (извлечение в файл ids_<type>_ils.csv и загрузка
+            # отдельными этапами) или stream (COPY из мониторинга с загрузкой частей файла во время выгрузки)
+            'ids_transfer_mode': config.get('processing', 'ids_transfer_mode', fallback='csv'),
+            # Количество идентификаторов в одной части файла при передаче в режиме stream
+            'ids_chunk_rows': config.getint('processing', 'ids_chunk_rows', fallback=1000000),
+            # Количество идентификаторов в одном запросе к интеграционной базе и количество одновременных запросов
+            'integrating_batch_size': config.getint('processing', 'integrating_batch_size', fallback=5000),
+            'integrating_concurrency': config.getint('processing', 'integrating_concurrency', fallback=4),
+            # Кэш статусов интеграции: файл и время актуальности записи в секундах (0 - кэш не используется)
+            'integrating_cache_file': config.get('processing', 'integrating_cache_file',
+                                                 fallback='result_data/integrating_cache.sqlite3'),
+            'integrating_cache_ttl': config.getint('processing', 'integrating_cache_ttl', fallback=86400),
+            # Способ выполнения проверок: queries (отдельные запросы check_query1..7), reconciliation (одна таблица
+            # расхождений на тип лицевых счетов, проверки выполняются запросами к ней) или engine (расхождения
+            # вычисляются в памяти по файлам выгрузок в temp_data, данные исторической системы не загружаются
+            # в мониторинг)
+            'check_mode': config.get('processing', 'check_mode', fallback='queries'),
+            # JSON-файл с дополнительными описаниями проверок (см. monitoring_data/check_registry.py)
+            'checks_file': config.get('processing', 'checks_file', fallback=''),
+            # Количество одновременно выполняемых проверок (каждая - на отдельном подключении к базе мониторинга)
+            'check_concurrency': config.getint('processing', 'check_concurrency', fallback=3),
+            # Проверка количества строк запросами COUNT(*) к таблицам мониторинга и исторической системы и сверка
+            # с журналом запуска (по умолчанию количество строк берется из журнала запуска)
+            'verify_counts': config.getboolean('processing', 'verify_counts', fallback=False),
+            # Коды допустимых статусов (acc_sts) исторической системы через запятую для режимов reconciliation и engine:
+            # открытые - 'Актуальный', закрытые - 'Умер', 'Упразднен'
+            'valid_statuses': {
+                'opening': [int(value) for value in
+                            config.get('processing', 'valid_statuses_opening', fallback='').split(',') if value.strip()],
+                'closing': [int(value) for value in
+                            config.get('processing', 'valid_statuses_closing', fallback='').split(',') if value.strip()],
+            },
+            # Режим загрузки: full (полная перезагрузка) или delta (только изменения с прошлого запуска)
+            'load_mode': config.get('processing', 'load_mode', fallback='full'),
+            # Способ выгрузки данных из исторической системы: offset (порциями по номеру строки),
+            # keyset (порциями по acc_id с подбором размера) или partitioned (параллельно по частям)
+            'historical_export_mode': config.get('processing', 'historical_export_mode', fallback='offset'),
+            # Количество частей, способ разбиения (acc_id или dataslice) и число одновременных выгрузок
+            'export_partitions': config.getint('processing', 'export_partitions', fallback=8),
+            'export_partition_by': config.get('processing', 'export_partition_by', fallback='acc_id'),
+            'export_concurrency': config.getint('processing', 'export_concurrency', fallback=4),
+            # Параметры выгрузки порциями по ключу (keyset): начальный, минимальный и максимальный размер порции,
+            # желаемые длительность выгрузки порции (секунды) и размер файла (МБ, 0 - не учитывается)
+            'export_batch_size': config.getint('processing', 'export_batch_size', fallback=20000),
+            'export_min_batch_size': config.getint('processing', 'export_min_batch_size', fallback=5000),
+            'export_max_batch_size': config.getint('processing', 'export_max_batch_size', fallback=1000000),
+            'export_target_seconds': config.getint('processing', 'export_target_seconds', fallback=30),
+            'export_target_file_mb': config.getint('processing', 'export_target_file_mb', fallback=0),
+            # Загрузка порций исторической системы в мониторинг одновременно с их выгрузкой
+            'stream_historical': config.getboolean('processing', 'stream_historical', fallback=False),
+            # Количество загрузчиков (подключений к мониторингу) и размер очереди файлов, ожидающих загрузки
+            'loader_workers': config.getint('processing', 'loader_workers', fallback=2),
+            'loader_queue_size': config.getint('processing', 'loader_queue_size', fallback=4),
+            # Режим фиксации загрузки порций в мониторинг: 'per_file' - по файлам с контрольными точками, 'final' -
+            # каждым загрузчиком после загрузки всех файлов (фиксации загрузчиков не атомарны, см. PortionLoader)
+            'loader_commit_mode': config.get('processing', 'loader_commit_mode', fallback='per_file'),
+            # Действие при ошибочных строках в файлах порций: 'fail' - прервать загрузку, 'reject' - записать строки
+            # в файл отбраковки и продолжить; допустимое количество отбракованных строк в файле (0 - без ограничения)
+            'loader_on_error': config.get('processing', 'loader_on_error', fallback='fail'),
+            'loader_rejects_dir': config.get('processing', 'loader_rejects_dir', fallback='result_data/rejects'),
+            'loader_max_rejected': config.getint('processing', 'loader_max_rejected', fallback=1000),
+            # Загрузка в мониторинг: 'table' - в пересоздаваемую таблицу, 'staging' - в промежуточную таблицу без
+            # индексов (нежурналируемую, если staging_unlogged) с построением индекса и заменой основной таблицы
+            'load_target': config.get('processing', 'load_target', fallback='table'),
+            # Нежурналируемая промежуточная таблица после замены остается нежурналируемой основной таблицей
+            # (PostgreSQL 9.4 не поддерживает SET LOGGED) и очищается при сбое сервера
+            'staging_unlogged': config.getboolean('processing', 'staging_unlogged', fallback=False),
+            # Столбцы с отметкой о последнем изменении для инкрементального режима
+            'delta_columns': {
+                'opening': config.get('processing', 'delta_column_opening', fallback='opening_date'),
+                'closing': config.get('processing', 'delta_column_closing', fallback='death_date'),
+            },
         }
 
     }
@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+from database.db_connection import DatabaseConnection, probe_connection
+from database.db_schema import SchemaCatalog
+
+# Ограничения пулов по умолчанию для баз, не указанных в конфигурации
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_ACQUIRE_TIMEOUT = 600
+DEFAULT_HEALTH_CHECK_IDLE = 60
+
+
+class PoolTimeout(Exception):
+    """Свободное подключение не получено за отведенное время."""
+
+
+class ConnectionPool:
+    """
+    Пул подключений к одной базе данных (PostgreSQL или Netezza).
+    Количество одновременно выданных подключений ограничено max_connections, при исчерпании пула запрос
+    подключения ожидает его возврата. Возвращенные подключения хранятся до следующего запроса; подключение,
+    простаивавшее дольше health_check_idle секунд, перед выдачей проверяется запросом SELECT 1 и при ошибке
+    заменяется новым. Кэш сведений каталога (SchemaCatalog) общий для всех подключений пула.
+    """
+
+    def __init__(self, db_config, max_connections=DEFAULT_MAX_CONNECTIONS, acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT,
+                 health_check_idle=DEFAULT_HEALTH_CHECK_IDLE):
+        """
+        :param db_config: Конфигурация базы данных.
+        :param max_connections: Максимальное количество одновременно выданных подключений.
+        :param acquire_timeout: Время ожидания свободного подключения (секунды).
+        :param health_check_idle: Время простоя (секунды), после которого подключение проверяется перед выдачей.
+        """
+        self.db_config = db_config
+        self.db_type = db_config.get('type')
+        if self.db_type not in ('postgresql', 'netezza'):
+            raise ValueError("Unsupported database type")
+        self.max_connections = max_connections
+        self.acquire_timeout = acquire_timeout
+        self.health_check_idle = health_check_idle
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._idle = []  # Пары (подключение, время возврата)
+        self.catalog = SchemaCatalog()
+
+    def acquire(self):
+        """
+        Получение подключения из пула.
+        :return: Подключение драйвера (psycopg2 или nzpy).
+        """
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolTimeout(f"Нет свободных подключений к базе {self.db_config.get('dbname')} "
+                              f"(ограничение {self.max_connections}) в течение {self.acquire_timeout} секунд.")
+        try:
+            with self._lock:
+                conn, released_at = self._idle.pop() if self._idle else (None, None)
+            if conn is not None and time.time() - released_at > self.health_check_idle and not probe_connection(conn):
+                logging.warning(f"Подключение к базе {self.db_config.get('dbname')} из пула недоступно, "
+                                f"создается новое.")
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._open()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """
+        Возврат подключения в пул. Незавершенная транзакция откатывается.
+        :param conn: Подключение, полученное методом acquire.
+        :param discard: Закрыть подключение вместо возврата в пул (например, после ошибки соединения).
+        """
+        try:
+            if not discard:
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    logging.warning(f"Не удалось откатить транзакцию при возврате подключения в пул: {e}")
+                    discard = True
+            if discard:
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.time()))
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Закрытие всех свободных подключений пула."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+    def _open(self):
+        if self.db_type == 'postgresql':
+            return DatabaseConnection.connect_to_postgresql(self.db_config)
+        return DatabaseConnection.connect_to_netezza(self.db_config)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logging.debug(f"Ошибка при закрытии подключения: {e}")
+
+
+class PooledDatabaseConnection(DatabaseConnection):
+    """
+    Подключение, полученное из пула, с интерфейсом DatabaseConnection.
+    Закрытие подключения (в том числе при выходе из контекстного менеджера) возвращает его в пул.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.db_type = pool.db_type
+        self.db_config = pool.db_config
+        self.catalog = pool.catalog
+        self.conn = None
+        self.connect()
+
+    def connect(self):
+        """Получение подключения из пула (прежнее подключение закрывается как неисправное)."""
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            self.pool.release(conn, discard=True)
+        self.conn = self.pool.acquire()
+
+    def reconnect(self):
+        """Замена текущего соединения новым соединением из пула."""
+        self.connect()
+
+    def close(self):
+        """Возврат подключения в пул."""
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            self.pool.release(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(config, db_name):
+    """
+    Пул подключений к базе данных из реестра процесса (создается при первом обращении).
+    :param config: Конфигурация подключений.
+    :param db_name: Имя базы в конфигурации ('master_db', 'historical_db', 'monitoring_db', 'integrating_db').
+    """
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            pool_config = config.get('pool', {})
+            pool = ConnectionPool(config[db_name],
+                                  max_connections=pool_config.get('max_connections', {}).get(
+                                      db_name, DEFAULT_MAX_CONNECTIONS),
+                                  acquire_timeout=pool_config.get('acquire_timeout', DEFAULT_ACQUIRE_TIMEOUT),
+                                  health_check_idle=pool_config.get('health_check_idle', DEFAULT_HEALTH_CHECK_IDLE))
+            _pools[db_name] = pool
+        return pool
+
+
+def get_connection(config, db_name):
+    """
+    Подключение к базе данных из пула.
+    :param config: Конфигурация подключений.
+    :param db_name: Имя базы в конфигурации.
+    :return: PooledDatabaseConnection.
+    """
+    return PooledDatabaseConnection(get_pool(config, db_name))
+
+
+def close_all_pools():
+    """Закрытие свободных подключений всех пулов и очистка реестра."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+    logging.info("Пулы подключений закрыты.")
@@ -1,18 +1,38 @@
 import logging
 import psycopg2
 import nzpy
+from database.db_schema import SchemaCatalog
+from database.retry_policy import call_with_retry, get_policy
 from utils.logger import setup_logger  # Импортируем функцию настройки логирования
 
 # Настройка логирования
 setup_logger()  # Вызываем функцию для настройки логирования
 
 
+def probe_connection(conn):
+    """Проверка соединения простым запросом (SELECT 1)."""
+    try:
+        if conn is None or getattr(conn, 'closed', 0):
+            return False
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
 class DatabaseConnection:
     def __init__(self, db_config):
         logging.info(f"Инициализация подключения к базе данных с конфигурацией: {db_config}")
         self.db_type = db_config.get('type')  # Определяем тип базы данных
         self.conn = None
         self.db_config = db_config  # Сохраняем конфигурацию базы данных
+        self.catalog = SchemaCatalog()  # Кэш сведений каталога (таблицы, столбцы, индексы)
         self.connect()  # Устанавливаем соединение при инициализации
 
     def connect(self):
@@ -25,7 +45,8 @@ class DatabaseConnection:
             logging.error(f"Unsupported database type: {self.db_type}")
             raise ValueError("Unsupported database type")
 
-    def connect_to_netezza(self, db_config):
+    @staticmethod
+    def connect_to_netezza(db_config):
         """Подключение к базе данных Netezza."""
         try:
             connection = nzpy.connect(
@@ -42,7 +63,8 @@ class DatabaseConnection:
             logging.error(f"Ошибка при подключении к Netezza: {e}")
             raise
 
-    def connect_to_postgresql(self, db_config):
+    @staticmethod
+    def connect_to_postgresql(db_config):
         """Подключение к базе данных PostgreSQL."""
         try:
             connection = psycopg2.connect(
@@ -58,19 +80,71 @@ class DatabaseConnection:
             logging.error(f"Ошибка при подключении к PostgreSQL: {e}")
             raise
 
-    def get_cursor(self):
-        """Получение курсора, проверяя состояние соединения."""
+    def get_cursor(self, name=None):
+        """
+        Получение курсора, проверяя состояние соединения.
+        :param name: Имя курсора на стороне сервера (именованный курсор PostgreSQL, строки передаются порциями).
+            Для Netezza не используется.
+        """
         if self.conn is None:
             logging.info("Соединение отсутствует, пересоздание соединения.")
             self.connect()  # Пересоздаем соединение
+        cursor_args = {'name': name} if name and self.db_type == 'postgresql' else {}
         try:
-            cursor = self.conn.cursor()
+            cursor = self.conn.cursor(**cursor_args)
             logging.debug("Получение курсора.")
             return cursor
         except Exception as e:
             logging.error(f"Ошибка при получении курсора: {e}")
             self.connect()  # Попробуем пересоздать соединение
-            return self.conn.cursor()  # Попробуем снова получить курсор
+            return self.conn.cursor(**cursor_args)  # Попробуем снова получить курсор
+
+    def is_alive(self):
+        """Проверка соединения простым запросом."""
+        return probe_connection(self.conn)
+
+    def ensure_alive(self):
+        """Проверка соединения и переподключение, если соединение недоступно."""
+        if not self.is_alive():
+            logging.warning("Соединение с базой данных недоступно, переподключение.")
+            self.reconnect()
+
+    def reconnect(self):
+        """Закрытие текущего соединения и установка нового."""
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception as e:
+                logging.debug(f"Ошибка при закрытии соединения: {e}")
+        self.connect()
+
+    def run_with_retry(self, operation, policy='read', cursor_name=None):
+        """
+        Выполнение операции с повторами по политике (см. database/retry_policy.py).
+        Операция получает новый курсор при каждой попытке; перед повторной попыткой незавершенная транзакция
+        откатывается, а соединение проверяется и при необходимости пересоздается. Операция должна быть
+        законченной единицей работы, так как при переподключении незафиксированные изменения теряются.
+        Фиксацию транзакции включают в операцию, только если ее повтор безопасен (DDL, замена строк по ключу);
+        неидемпотентные вставки и загрузки фиксируются после run_with_retry без повторов.
+        :param operation: Функция, принимающая курсор.
+        :param policy: Имя политики повторов ('read', 'copy', 'ddl', 'export').
+        :param cursor_name: Имя курсора на стороне сервера (см. get_cursor).
+        :return: Результат операции.
+        """
+        def attempt():
+            with self.get_cursor(name=cursor_name) as cur:
+                return operation(cur)
+
+        def before_retry():
+            try:
+                self.conn.rollback()
+            except Exception as e:
+                logging.debug(f"Ошибка при откате транзакции: {e}")
+            self.ensure_alive()
+
+        if get_policy(policy)['probe']:
+            self.ensure_alive()
+        return call_with_retry(policy, attempt, before_retry=before_retry)
 
     def close(self):
         """Закрытие соединения с базой данных."""
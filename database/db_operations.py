@@ -1,23 +1,130 @@
+import itertools
 import logging
+from psycopg2.extras import execute_values
 from database.db_schema import create_table_if_not_exists, drop_table_if_exists, create_netezza_table, \
-    create_netezza_table_from_select
-from exporting_data.csv_export import export_results_to_csv
+    create_netezza_table_from_select, create_index_if_not_exists, index_name_for, add_columns_if_not_exist
+from exporting_data.csv_export import export_results_to_csv, write_row_chunks_to_csv
+
+# Количество строк, получаемых с сервера за одно обращение при потоковом чтении
+DEFAULT_ITERSIZE = 50000
+
+# Счетчик для уникальных имен курсоров на стороне сервера
+_cursor_numbers = itertools.count(1)
+
+
+def fetch_chunks(cur, itersize=DEFAULT_ITERSIZE):
+    """Получение результата запроса порциями по itersize строк."""
+    while True:
+        rows = cur.fetchmany(itersize)
+        if not rows:
+            break
+        yield rows
 
 
 class DBOperations:
     def __init__(self, connection, db_type=None):
         self.connection = connection
         self.db_type = db_type
+        # Кэш сведений каталога подключения (см. SchemaCatalog)
+        self.catalog = getattr(connection, 'catalog', None)
+
+    def _commit_after(self, func, *args):
+        """Выполнение функции с последующей фиксацией транзакции (для повторяемых операций с повторами)."""
+        func(*args)
+        self.connection.commit()
 
-    def execute_query(self, query, csv_file=None):
-        """Выполнение SQL-запроса и, при необходимости, экспорт результатов в CSV."""
-        with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
+    def _run_then_commit(self, operation, policy='copy'):
+        """
+        Выполнение неидемпотентной операции (вставки, загрузки) с повторами и последующей фиксацией транзакции.
+        Повторяется только операция: при ошибке незафиксированные изменения откатываются. Фиксация выполняется
+        без повторов, так как при обрыве соединения во время фиксации неизвестно, зафиксированы ли строки,
+        и повтор мог бы загрузить их второй раз.
+        :return: Результат операции.
+        """
+        result = self.connection.run_with_retry(operation, policy=policy)
+        self.connection.commit()
+        return result
+
+    def _change_schema(self, table_names, func, *args, **kwargs):
+        """
+        Изменение схемы с последующей фиксацией транзакции.
+        При ошибке сведения кэша каталога об изменяемых таблицах сбрасываются (транзакция будет откачена).
+        """
+        try:
+            result = func(*args, **kwargs)
+            self.connection.commit()
+            return result
+        except Exception:
+            if self.catalog:
+                self.catalog.forget(*table_names)
+            raise
+
+    def execute_query(self, query, csv_file=None, params=None):
+        """
+        Выполнение SQL-запроса и, при необходимости, экспорт результатов в CSV.
+        :param params: Параметры запроса (передаются драйверу отдельно от текста запроса).
+        """
+        def run(cur):
+            if params is None:
+                cur.execute(query)
+            else:
+                cur.execute(query, params)
+            return cur.fetchall()  # Получаем результаты запроса
+
+        results = self.connection.run_with_retry(run, policy='read')
+        if csv_file:
+            # Если указан файл для экспорта, экспортируем данные
+            export_results_to_csv(results, csv_file)
+        return results
+
+    def fetch_query(self, query):
+        """
+        Выполнение SQL-запроса с получением имен столбцов результата.
+        :return: Кортеж (список имен столбцов, список строк).
+        """
+        def run(cur):
             cur.execute(query)
-            results = cur.fetchall()  # Получаем результаты запроса
-            if csv_file:
-                # Если указан файл для экспорта, экспортируем данные
-                export_results_to_csv(results, csv_file)
-            return results
+            return [desc[0] for desc in cur.description], cur.fetchall()
+
+        return self.connection.run_with_retry(run, policy='read')
+
+    def stream_query(self, query, consumer, itersize=DEFAULT_ITERSIZE):
+        """
+        Потоковое выполнение SQL-запроса: строки получаются с сервера порциями через именованный курсор
+        (для PostgreSQL) и передаются обработчику по мере получения, поэтому результат не загружается в память
+        целиком. При ошибке соединения запрос и обработка повторяются с начала, поэтому обработчик должен
+        начинать работу заново (например, перезаписывать файл).
+        :param query: SQL-запрос.
+        :param consumer: Обработчик результата: consumer(список имен столбцов, итератор порций строк) -> результат.
+        :param itersize: Количество строк, получаемых с сервера за одно обращение.
+        :return: Результат обработчика.
+        """
+        def run(cur):
+            cur.execute(query)
+            # Описание результата именованного курсора доступно после первого получения строк
+            first_rows = cur.fetchmany(itersize)
+            columns = [desc[0] for desc in cur.description]
+            return consumer(columns, itertools.chain([first_rows] if first_rows else [], fetch_chunks(cur, itersize)))
+
+        return self.connection.run_with_retry(run, policy='read',
+                                              cursor_name=f"dbops_stream_{next(_cursor_numbers)}")
+
+    def export_query_to_csv(self, query, csv_file, itersize=DEFAULT_ITERSIZE):
+        """
+        Потоковая выгрузка результата SQL-запроса в CSV файл (без заголовка, как execute_query с csv_file).
+        Строки записываются порциями по мере получения с сервера; при ошибке соединения выгрузка повторяется
+        с начала файла.
+        :param query: SQL-запрос.
+        :param csv_file: Имя CSV файла в каталоге temp_data.
+        :param itersize: Количество строк, получаемых с сервера за одно обращение.
+        :return: Количество выгруженных строк.
+        """
+        def run(cur):
+            cur.execute(query)
+            return write_row_chunks_to_csv(fetch_chunks(cur, itersize), csv_file)
+
+        return self.connection.run_with_retry(run, policy='read',
+                                              cursor_name=f"dbops_stream_{next(_cursor_numbers)}")
 
     def create_postgresql_table(self, table_name, columns, index_columns=None):
         """
@@ -26,9 +133,75 @@ class DBOperations:
         :param columns: Словарь с именами столбцов и их типами данных.
         :param index_columns: Список столбцов для создания индекса (по умолчанию None).
         """
-        with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
-            create_table_if_not_exists(cur, table_name, columns, index_columns)
-            self.connection.commit()
+        self.connection.run_with_retry(
+            lambda cur: self._change_schema([table_name], create_table_if_not_exists, cur, table_name, columns,
+                                            index_columns, catalog=self.catalog),
+            policy='ddl')
+
+    def ensure_table(self, spec, table_name=None):
+        """
+        Создание таблицы по описанию (TableSpec), если она не существует.
+        В существующую таблицу PostgreSQL добавляются отсутствующие в ней столбцы описания.
+        :param spec: Описание таблицы.
+        :param table_name: Имя таблицы (по умолчанию имя из описания).
+        """
+        table_name = table_name or spec.name
+        if spec.db_type == 'netezza':
+            self.create_netezza_table(table_name, spec.columns, spec.distribute_column)
+            return
+
+        def run(cur):
+            create_table_if_not_exists(cur, table_name, spec.columns, spec.index_columns, unlogged=spec.unlogged,
+                                       catalog=self.catalog)
+            add_columns_if_not_exist(cur, table_name, spec.columns, catalog=self.catalog)
+
+        self.connection.run_with_retry(lambda cur: self._change_schema([table_name], run, cur), policy='ddl')
+
+    def create_staging_table(self, table_name, columns, unlogged=False):
+        """
+        Пересоздание промежуточной таблицы для загрузки без индексов.
+        :param table_name: Имя промежуточной таблицы.
+        :param columns: Словарь с именами столбцов и их типами данных.
+        :param unlogged: Создать нежурналируемую таблицу (UNLOGGED): загрузка не пишет WAL, но после сбоя сервера
+            таблица очищается, в том числе после замены основной таблицы (см. swap_staging_table).
+        """
+        def run(cur):
+            drop_table_if_exists(cur, table_name, self.db_type, catalog=self.catalog)
+            create_table_if_not_exists(cur, table_name, columns, unlogged=unlogged, catalog=self.catalog)
+
+        self.connection.run_with_retry(lambda cur: self._change_schema([table_name], run, cur), policy='ddl')
+
+    def swap_staging_table(self, table_name, staging_table_name, index_columns=None):
+        """
+        Замена таблицы загруженной промежуточной таблицей.
+        Индексы строятся и статистика собирается до замены, затем в одной транзакции прежняя таблица удаляется,
+        а промежуточная переименовывается, поэтому читающие запросы видят либо прежние, либо новые данные.
+        :param table_name: Имя заменяемой таблицы.
+        :param staging_table_name: Имя загруженной промежуточной таблицы.
+        :param index_columns: Список столбцов для создания индекса (по умолчанию None).
+        """
+        # Замена не повторяется автоматически: при потере ответа на фиксацию повтор удалил бы новую таблицу
+        self.connection.ensure_alive()
+        with self.connection.get_cursor() as cur:
+            try:
+                if index_columns:
+                    create_index_if_not_exists(cur, staging_table_name, index_columns, catalog=self.catalog)
+                cur.execute(f"ANALYZE {staging_table_name};")
+                self.connection.commit()
+
+                cur.execute(f"DROP TABLE IF EXISTS {table_name};")
+                cur.execute(f"ALTER TABLE {staging_table_name} RENAME TO {table_name};")
+                if index_columns:
+                    cur.execute(f"ALTER INDEX {index_name_for(staging_table_name, index_columns)} "
+                                f"RENAME TO {index_name_for(table_name, index_columns)};")
+                self.connection.commit()
+            except Exception:
+                self.connection.conn.rollback()
+                raise
+            finally:
+                if self.catalog:
+                    self.catalog.forget(table_name, staging_table_name)
+        logging.info(f"Таблица {table_name} заменена загруженной таблицей {staging_table_name}.")
 
     def create_netezza_table(self, table_name, columns, distribute_column):
         """
@@ -37,9 +210,9 @@ class DBOperations:
         :param columns: Словарь с именами столбцов и их типами данных.
         :param distribute_column: Имя столбца для распределения.
         """
-        with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
-            create_netezza_table(cur, table_name, columns, distribute_column)
-            self.connection.commit()
+        self.connection.run_with_retry(
+            lambda cur: self._commit_after(create_netezza_table, cur, table_name, columns, distribute_column),
+            policy='ddl')
 
     def create_netezza_table_from_select(self, select_query, table_name, distribute_column):
         """
@@ -48,37 +221,66 @@ class DBOperations:
         :param table_name: Имя создаваемой таблицы.
         :param distribute_column: Имя столбца для распределения.
         """
-        with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
-            create_netezza_table_from_select(cur, select_query, table_name, distribute_column)
-            self.connection.commit()
+        self.connection.run_with_retry(
+            lambda cur: self._commit_after(create_netezza_table_from_select, cur, select_query, table_name,
+                                           distribute_column),
+            policy='ddl')
 
     def drop_table(self, table_name):
         """
         Удаление таблицы, если она существует.
         :param table_name: Имя таблицы, которую нужно удалить.
         """
-        with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
-            drop_table_if_exists(cur, table_name, self.db_type)
-            self.connection.commit()
+        self.connection.run_with_retry(
+            lambda cur: self._commit_after(drop_table_if_exists, cur, table_name, self.db_type, self.catalog),
+            policy='ddl')
 
     def clear_table(self, table_name):
         """
         Очистка таблицы.
         :param table_name: Имя таблицы, которую нужно очистить.
         """
-        with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
-            cur.execute(f"TRUNCATE {table_name};")
+        self.connection.run_with_retry(lambda cur: self._commit_after(cur.execute, f"TRUNCATE {table_name};"),
+                                       policy='ddl')
+
+    def merge_from_table(self, table_name, source_table, key_column='acc_id', keys_table=None):
+        """
+        Замена строк таблицы строками из промежуточной таблицы по ключу в одной транзакции.
+        Выполняется удалением и вставкой, так как PostgreSQL 9.4 не поддерживает INSERT ... ON CONFLICT.
+        :param table_name: Имя изменяемой таблицы.
+        :param source_table: Имя таблицы с новыми строками (с тем же набором столбцов).
+        :param key_column: Имя ключевого столбца.
+        :param keys_table: Таблица с ключами заменяемых строк (по умолчанию source_table).
+        :return: Количество удаленных и вставленных строк.
+        """
+        keys_table = keys_table or source_table
+
+        def run(cur):
+            cur.execute(f"""
+            DELETE FROM {table_name} AS t
+            USING (SELECT DISTINCT {key_column} FROM {keys_table}) AS k
+            WHERE t.{key_column} = k.{key_column};
+            """)
+            deleted_rows = cur.rowcount
+            cur.execute(f"INSERT INTO {table_name} SELECT * FROM {source_table};")
+            inserted_rows = cur.rowcount
             self.connection.commit()
+            return deleted_rows, inserted_rows
+
+        # Удаление и вставка выполняются в одной транзакции, поэтому операцию можно повторить целиком
+        deleted, inserted = self.connection.run_with_retry(run, policy='copy')
+        logging.info(f"Таблица {table_name} обновлена из {source_table}: удалено {deleted}, добавлено {inserted} строк.")
+        return deleted, inserted
 
     def insert_to_netezza_from_select_external_csv(self, table_name, external_csv):
         """
         Загрузка данных в Netezza из запроса SELECT.
         :param table_name: Имя таблицы, в которую будут загружены данные.
         :param external_csv: Имя внешнего csv-файла.
+        :return: Количество загруженных строк (rowcount команды INSERT) или None при ошибке.
         """
         try:
-            with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
-                insert_query = f"""
+            insert_query = f"""
                 INSERT INTO {table_name}
                 SELECT * FROM 
                 EXTERNAL '{external_csv}'
@@ -90,27 +292,28 @@ class DBOperations:
                     ESCAPECHAR '\\'
                 );
                 """
+            def run(cur):
                 cur.execute(insert_query)
-                self.connection.commit()
-                logging.info(f"Данные успешно загружены в таблицу {table_name} из внешнего файла {external_csv}.")
-                return True
+                return cur.rowcount
+
+            rows_loaded = self._run_then_commit(run)
+            logging.info(f"Данные успешно загружены в таблицу {table_name} из внешнего файла {external_csv} "
+                         f"({rows_loaded} строк).")
+            return rows_loaded
         except Exception as e:
             logging.error(
                 f"Данные не загружены в таблицу {table_name} из внешнего файла {external_csv}. Возникла ошибка - {e}")
-            return False
+            return None
 
     def count_total_records(self, table_name):
         """Подсчет общего количества записей в таблице."""
         query = f"SELECT COUNT(*) FROM {table_name};"
-        with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
+
+        def run(cur):
             cur.execute(query)
             return cur.fetchone()[0]
 
-    def count_records(self, query):
-        """Подсчет количества записей по заданному запросу."""
-        with self.connection.get_cursor() as cur:  # Изменено на get_cursor()
-            cur.execute(query)
-            return cur.rowcount
+        return self.connection.run_with_retry(run, policy='read')
 
     def insert_data(self, table_name, columns, values):
         """Универсальный метод для вставки данных в таблицу."""
@@ -122,6 +325,46 @@ class DBOperations:
             cur.execute(query, values)
             self.connection.commit()  # Подтверждение изменений
 
+    def insert_rows(self, table_name, columns, rows, page_size=1000):
+        """
+        Вставка набора строк в таблицу в одной транзакции.
+        Для PostgreSQL строки передаются многострочными INSERT (execute_values) по page_size строк.
+        :param table_name: Имя таблицы.
+        :param columns: Список столбцов.
+        :param rows: Список кортежей значений в порядке столбцов.
+        :return: Количество вставленных строк.
+        """
+        if not rows:
+            return 0
+        columns_str = ', '.join(columns)
+
+        def run(cur):
+            if self.db_type == 'postgresql':
+                execute_values(cur, f"INSERT INTO {table_name} ({columns_str}) VALUES %s", rows,
+                               page_size=page_size)
+            else:
+                placeholders = ', '.join(['%s'] * len(columns))
+                cur.executemany(f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders})", rows)
+            return len(rows)
+
+        return self._run_then_commit(run)
+
+    def insert_from_select(self, table_name, select_query, columns=None):
+        """
+        Заполнение таблицы результатом запроса (INSERT ... SELECT) в одной транзакции.
+        :param table_name: Имя таблицы.
+        :param select_query: Запрос SELECT.
+        :param columns: Список столбцов таблицы в порядке столбцов запроса (по умолчанию все столбцы).
+        :return: Количество вставленных строк.
+        """
+        columns_str = f" ({', '.join(columns)})" if columns else ''
+
+        def run(cur):
+            cur.execute(f"INSERT INTO {table_name}{columns_str} {select_query};")
+            return cur.rowcount
+
+        return self._run_then_commit(run)
+
     def insert_check_result(self, check_description, record_count):
         """Вставка результата проверки в таблицу data_check_results."""
         self.insert_data("data_check_results", ["check_description", "record_count"], [check_description, record_count])
@@ -1,21 +1,248 @@
 import logging
+import threading
+from database.retry_policy import is_transient_error
 
+# Суффиксы таблиц, производных от зарегистрированных (таблицы изменений и промежуточные таблицы)
+DERIVED_TABLE_SUFFIXES = ('_staging', '_delta')
 
-def create_table_if_not_exists(cur, table_name, columns, index_columns=None):
+
+class TableSpec:
+    """
+    Описание таблицы: столбцы, индекс, ключ распределения (Netezza) и параметры создания.
+    По описанию формируются DDL и список столбцов для COPY.
+    """
+
+    def __init__(self, name, columns, index_columns=None, distribute_column=None, unlogged=False,
+                 db_type='postgresql'):
+        """
+        :param name: Имя таблицы.
+        :param columns: Словарь с именами столбцов и их типами данных (в порядке столбцов CSV-файлов).
+        :param index_columns: Список столбцов индекса (PostgreSQL).
+        :param distribute_column: Столбец распределения (Netezza).
+        :param unlogged: Создавать нежурналируемую таблицу (UNLOGGED).
+        :param db_type: Тип базы данных ('postgresql' или 'netezza').
+        """
+        self.name = name
+        self.columns = dict(columns)
+        self.index_columns = list(index_columns) if index_columns else None
+        self.distribute_column = distribute_column
+        self.unlogged = unlogged
+        self.db_type = db_type
+
+    def column_list(self):
+        """Список столбцов через запятую (для COPY и INSERT)."""
+        return ', '.join(self.columns)
+
+    def copy_from_stdin_query(self, table_name=None):
+        """Запрос COPY ... FROM STDIN для CSV-файла с разделителем ';' и явным списком столбцов."""
+        return (f"COPY public.{table_name or self.name} ({self.column_list()}) "
+                f"FROM STDIN WITH CSV DELIMITER ';'")
+
+
+# Реестр описаний таблиц по именам
+TABLE_SPECS = {}
+
+
+def register_table_spec(spec):
+    """Добавление описания таблицы в реестр."""
+    TABLE_SPECS[spec.name] = spec
+    return spec
+
+
+def get_table_spec(table_name):
+    """
+    Описание таблицы из реестра. Для таблиц изменений (_delta) и промежуточных таблиц (_staging) возвращается
+    описание основной таблицы.
+    :raises KeyError: Таблица не зарегистрирована.
+    """
+    base_name = table_name
+    while base_name not in TABLE_SPECS:
+        suffix = next((suffix for suffix in DERIVED_TABLE_SUFFIXES if base_name.endswith(suffix)), None)
+        if suffix is None:
+            raise KeyError(f"Таблица {table_name} отсутствует в реестре описаний таблиц.")
+        base_name = base_name[:-len(suffix)]
+    return TABLE_SPECS[base_name]
+
+
+# Таблицы с данными мастер-системы в базе мониторинга
+register_table_spec(TableSpec('master_opening_ils', {
+    'snils': 'VARCHAR(14)',
+    'acc_id': 'BIGINT',
+    'opening_date': 'DATE',
+    'opening_region': 'VARCHAR(6)',
+    'registration_reason': 'TEXT',
+}, index_columns=['acc_id']))
+register_table_spec(TableSpec('master_closing_ils', {
+    'snils': 'VARCHAR(14)',
+    'acc_id': 'BIGINT',
+    'death_date': 'DATE',
+    'closing_region': 'VARCHAR(6)',
+    'closing_reason': 'TEXT',
+}, index_columns=['acc_id']))
+
+# Таблицы с данными исторической системы в базе мониторинга
+register_table_spec(TableSpec('historical_opening_ils', {
+    'acc_id': 'BIGINT',
+    'acc_sts': 'INT',
+    'opening_region': 'VARCHAR(6)',
+}, index_columns=['acc_id']))
+register_table_spec(TableSpec('historical_closing_ils', {
+    'acc_id': 'BIGINT',
+    'acc_sts': 'INT',
+    'death_date': 'DATE',
+    'closing_region': 'VARCHAR(6)',
+}, index_columns=['acc_id']))
+
+# Таблица результатов проверок (столбцы duration, run_id и account_type добавляются в существующую таблицу)
+register_table_spec(TableSpec('data_check_results', {
+    'id': 'SERIAL PRIMARY KEY',
+    'check_description': 'TEXT',
+    'record_count': 'INT',
+    'created_at': 'DATE DEFAULT CURRENT_DATE',
+    'duration': 'NUMERIC(12, 3)',
+    'run_id': 'TEXT',
+    'account_type': 'TEXT',
+}, index_columns=['id']))
+
+# Таблицы идентификаторов лицевых счетов в исторической системе
+for _account_type in ('opening', 'closing'):
+    register_table_spec(TableSpec(f'vlg_mic_ids_{_account_type}_ils', {'acc_id': 'BIGINT'},
+                                  distribute_column='acc_id', db_type='netezza'))
+
+# Таблицы расхождений мастер-системы и исторической системы (одна строка на acc_id с признаками расхождений)
+register_table_spec(TableSpec('reconciliation_opening_ils', {
+    'acc_id': 'BIGINT',
+    'snils': 'VARCHAR(14)',
+    'opening_date': 'DATE',
+    'opening_region': 'VARCHAR(6)',
+    'registration_reason': 'TEXT',
+    'historical_acc_sts': 'INT',
+    'historical_opening_region': 'VARCHAR(6)',
+    'missing_in_master': 'BOOLEAN',
+    'missing_in_historical': 'BOOLEAN',
+    'status_mismatch': 'BOOLEAN',
+    'region_mismatch': 'BOOLEAN',
+}, unlogged=True))
+register_table_spec(TableSpec('reconciliation_closing_ils', {
+    'acc_id': 'BIGINT',
+    'snils': 'VARCHAR(14)',
+    'death_date': 'DATE',
+    'closing_region': 'VARCHAR(6)',
+    'closing_reason': 'TEXT',
+    'historical_acc_sts': 'INT',
+    'historical_death_date': 'DATE',
+    'historical_closing_region': 'VARCHAR(6)',
+    'missing_in_master': 'BOOLEAN',
+    'missing_in_historical': 'BOOLEAN',
+    'status_mismatch': 'BOOLEAN',
+    'region_mismatch': 'BOOLEAN',
+    'death_date_mismatch': 'BOOLEAN',
+}, unlogged=True))
+
+# Столбцы таблиц исторической системы по типам лицевых счетов
+HISTORICAL_COLUMNS = {account_type: TABLE_SPECS[f'historical_{account_type}_ils'].columns
+                      for account_type in ('opening', 'closing')}
+
+
+class SchemaCatalog:
+    """
+    Кэш сведений каталога PostgreSQL (таблицы, созданные в текущем запуске, их столбцы и индексы).
+    Сведения о таблице запрашиваются из каталога один раз и обновляются при изменении схемы через функции модуля,
+    поэтому повторные проверки существования таблиц и индексов не обращаются к базе.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = {}  # Имя таблицы -> {'columns': множество или None, 'indexes': множество или None}
+
+    def is_known(self, table_name):
+        """Таблица создана или проверена в текущем запуске."""
+        with self._lock:
+            return table_name in self._tables
+
+    def columns(self, cur, table_name):
+        """Имена столбцов таблицы (из кэша или из information_schema)."""
+        with self._lock:
+            cached = self._tables.get(table_name, {}).get('columns')
+        if cached is not None:
+            return set(cached)
+        cur.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s;
+        """, (table_name,))
+        columns = {row[0] for row in cur.fetchall()}
+        with self._lock:
+            self._entry(table_name)['columns'] = columns
+        return set(columns)
+
+    def indexes(self, cur, table_name):
+        """Имена индексов таблицы (из кэша или из pg_indexes)."""
+        with self._lock:
+            cached = self._tables.get(table_name, {}).get('indexes')
+        if cached is not None:
+            return set(cached)
+        cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s;",
+                    (table_name,))
+        indexes = {row[0] for row in cur.fetchall()}
+        with self._lock:
+            self._entry(table_name)['indexes'] = indexes
+        return set(indexes)
+
+    def table_created(self, table_name):
+        """Отметка о создании таблицы (или о том, что она уже существует)."""
+        with self._lock:
+            self._entry(table_name)
+
+    def columns_added(self, table_name, columns):
+        with self._lock:
+            cached = self._tables.get(table_name, {}).get('columns')
+            if cached is not None:
+                cached.update(columns)
+
+    def index_created(self, table_name, index_name):
+        with self._lock:
+            cached = self._tables.get(table_name, {}).get('indexes')
+            if cached is not None:
+                cached.add(index_name)
+
+    def forget(self, *table_names):
+        """Удаление сведений о таблицах (после удаления, переименования или ошибки изменения схемы)."""
+        with self._lock:
+            for table_name in table_names:
+                self._tables.pop(table_name, None)
+
+    def _entry(self, table_name):
+        return self._tables.setdefault(table_name, {'columns': None, 'indexes': None})
+
+
+def index_name_for(table_name, index_columns):
+    """Имя индекса таблицы по указанным столбцам."""
+    return f"idx_{table_name}_" + "_".join(index_columns)
+
+
+def create_table_if_not_exists(cur, table_name, columns, index_columns=None, unlogged=False, catalog=None):
     """
     Создание таблицы, если она не существует, и индекса по указанным столбцам.
     :param cur: Курсор для выполнения SQL-запросов.
     :param table_name: Имя создаваемой таблицы.
     :param columns: Словарь с именами столбцов и их типами данных.
     :param index_columns: Список столбцов для создания индекса (по умолчанию None).
+    :param unlogged: Создать нежурналируемую таблицу (UNLOGGED).
+    :param catalog: Кэш каталога (SchemaCatalog): таблица, уже созданная в текущем запуске, не создается повторно.
     """
+    if catalog and catalog.is_known(table_name) and (
+            not index_columns or index_name_for(table_name, index_columns) in catalog.indexes(cur, table_name)):
+        logging.debug(f"Таблица {table_name} уже создана в текущем запуске.")
+        return
+
     # Формирование строки с определением столбцов
     columns_definition = ', '.join([f"{col_name} {col_type}" for col_name, col_type in columns.items()])
     # drop_table_if_exists(cur, table_name)
 
     # SQL-запрос для создания таблицы
     create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS {table_name} (
+    CREATE {'UNLOGGED ' if unlogged else ''}TABLE IF NOT EXISTS {table_name} (
         {columns_definition}
     );
     """
@@ -23,40 +250,89 @@ def create_table_if_not_exists(cur, table_name, columns, index_columns=None):
     try:
         cur.execute(create_table_query)
         logging.info(f"Таблица {table_name} создана или уже существует.")
+        if catalog:
+            catalog.table_created(table_name)
 
         # Создание индекса, если указаны столбцы
         if index_columns:
-            index_name = f"idx_{table_name}_" + "_".join(index_columns)
-
-            # Проверка существования индекса
-            check_index_query = f"""
-            SELECT COUNT(*)
-            FROM pg_indexes
-            WHERE schemaname = 'public' AND indexname = '{index_name}';
-            """
-            cur.execute(check_index_query)
-            index_exists = cur.fetchone()[0] > 0
-
-            if not index_exists:
-                create_index_query = f"""
-                CREATE INDEX {index_name} ON {table_name} ({', '.join(index_columns)});
-                """
-                cur.execute(create_index_query)
-                logging.info(f"Индекс по столбцам {', '.join(index_columns)} для таблицы {table_name} создан.")
-            else:
-                logging.info(f"Индекс {index_name} уже существует на таблице {table_name}.")
+            create_index_if_not_exists(cur, table_name, index_columns, catalog=catalog)
 
     except Exception as e:
         logging.error(f"Ошибка при создании таблицы или индекса: {e}")
+        if catalog:
+            catalog.forget(table_name)
+        # Ошибки соединения передаются выше для повтора операции
+        if is_transient_error(e):
+            raise
+
+
+def create_index_if_not_exists(cur, table_name, index_columns, catalog=None):
+    """
+    Создание индекса по указанным столбцам, если он не существует.
+    :param cur: Курсор для выполнения SQL-запросов.
+    :param table_name: Имя таблицы.
+    :param index_columns: Список столбцов индекса.
+    :param catalog: Кэш каталога (SchemaCatalog) для проверки существования индекса.
+    """
+    index_name = index_name_for(table_name, index_columns)
+
+    # Проверка существования индекса
+    if catalog:
+        index_exists = index_name in catalog.indexes(cur, table_name)
+    else:
+        check_index_query = f"""
+        SELECT COUNT(*)
+        FROM pg_indexes
+        WHERE schemaname = 'public' AND indexname = '{index_name}';
+        """
+        cur.execute(check_index_query)
+        index_exists = cur.fetchone()[0] > 0
+
+    if not index_exists:
+        create_index_query = f"""
+        CREATE INDEX {index_name} ON {table_name} ({', '.join(index_columns)});
+        """
+        cur.execute(create_index_query)
+        if catalog:
+            catalog.index_created(table_name, index_name)
+        logging.info(f"Индекс по столбцам {', '.join(index_columns)} для таблицы {table_name} создан.")
+    else:
+        logging.info(f"Индекс {index_name} уже существует на таблице {table_name}.")
+
+
+def add_columns_if_not_exist(cur, table_name, columns, catalog=None):
+    """
+    Добавление в существующую таблицу отсутствующих столбцов (PostgreSQL).
+    :param cur: Курсор для выполнения SQL-запросов.
+    :param table_name: Имя таблицы.
+    :param columns: Словарь с именами столбцов и их типами данных.
+    :param catalog: Кэш каталога (SchemaCatalog) со столбцами таблицы.
+    :return: Список добавленных столбцов.
+    """
+    catalog = catalog or SchemaCatalog()
+    existing_columns = catalog.columns(cur, table_name)
+
+    added_columns = []
+    for col_name, col_type in columns.items():
+        if col_name not in existing_columns:
+            cur.execute(f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type};")
+            added_columns.append(col_name)
+    if added_columns:
+        catalog.columns_added(table_name, added_columns)
+        logging.info(f"В таблицу {table_name} добавлены столбцы: {', '.join(added_columns)}.")
+    return added_columns
 
 
-def drop_table_if_exists(cur, table_name, db_type):
+def drop_table_if_exists(cur, table_name, db_type, catalog=None):
     """
     Удаление таблицы, если она существует.
     :param cur: Курсор для выполнения SQL-запросов.
     :param table_name: Имя таблицы, которую нужно удалить.
     :param db_type: Тип базы данных ('postgresql' или 'netezza').
+    :param catalog: Кэш каталога (SchemaCatalog), из которого удаляются сведения о таблице.
     """
+    if catalog:
+        catalog.forget(table_name)
     try:
         if db_type.lower() == 'postgresql':
             query = f"DROP TABLE IF EXISTS {table_name};"
@@ -69,6 +345,8 @@ def drop_table_if_exists(cur, table_name, db_type):
         logging.info(f"Таблица {table_name} удалена, если существовала.")
     except Exception as e:
         logging.error(f"Ошибка при удалении таблицы {table_name}: {e}")
+        if is_transient_error(e):
+            raise
 
 
 def create_netezza_table(cur, table_name, columns, distribute_column):
@@ -95,6 +373,8 @@ def create_netezza_table(cur, table_name, columns, distribute_column):
         logging.info(f"Таблица {table_name} создана в Netezza.")
     except Exception as e:
         logging.error(f"Ошибка при создании таблицы {table_name} в Netezza: {e}")
+        if is_transient_error(e):
+            raise
 
 
 def create_netezza_table_from_select(cur, select_query, table_name, distribute_column):
@@ -114,3 +394,5 @@ def create_netezza_table_from_select(cur, select_query, table_name, distribute_c
         logging.info(f"Таблица {table_name} создана в Netezza.")
     except Exception as e:
         logging.error(f"Ошибка при создании таблицы {table_name} в Netezza: {e}")
+        if is_transient_error(e):
+            raise
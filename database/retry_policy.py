@@ -0,0 +1,122 @@
+import logging
+import socket
+import threading
+import nzpy
+import psycopg2
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# Политики повторов по типам операций:
+# attempts - количество попыток, initial_delay/max_delay - начальная и максимальная пауза (секунды,
+# экспоненциальный рост со случайной величиной паузы), retry_on - 'transient' (только ошибки соединения)
+# или 'transient_netezza' (ошибки соединения и временные ошибки сервера Netezza, см. TRANSIENT_SQLSTATES),
+# probe - проверка соединения перед выполнением операции
+RETRY_POLICIES = {
+    'read': {'attempts': 5, 'initial_delay': 1, 'max_delay': 30, 'retry_on': 'transient', 'probe': False},
+    'copy': {'attempts': 3, 'initial_delay': 2, 'max_delay': 60, 'retry_on': 'transient', 'probe': True},
+    'ddl': {'attempts': 3, 'initial_delay': 1, 'max_delay': 30, 'retry_on': 'transient', 'probe': True},
+    'export': {'attempts': 6, 'initial_delay': 3, 'max_delay': 120, 'retry_on': 'transient_netezza', 'probe': True},
+}
+
+# Ошибки, после которых операцию можно повторить на новом соединении
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, nzpy.OperationalError, nzpy.InterfaceError,
+                    ConnectionError, socket.timeout)
+
+# Коды SQLSTATE временных ошибок сервера Netezza, после которых операцию можно повторить: конфликт сериализации,
+# взаимная блокировка, превышение количества сеансов, остановка или запуск сервера
+TRANSIENT_SQLSTATES = {'40001', '40P01', '53300', '57P01', '57P03'}
+
+_policies_lock = threading.Lock()
+_metrics = {}
+
+
+def configure_retry_policies(retry_config):
+    """
+    Изменение параметров политик повторов.
+    :param retry_config: Словарь {имя политики: {параметр: значение}} (например, config['retry']).
+    """
+    with _policies_lock:
+        for name, options in (retry_config or {}).items():
+            RETRY_POLICIES.setdefault(name, dict(RETRY_POLICIES['read'])).update(options)
+
+
+def get_policy(name):
+    """Параметры политики повторов."""
+    with _policies_lock:
+        if name not in RETRY_POLICIES:
+            raise ValueError(f"Неизвестная политика повторов: {name}.")
+        return dict(RETRY_POLICIES[name])
+
+
+def is_transient_error(error):
+    """Проверка, что ошибка связана с соединением и операцию можно повторить."""
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def _sqlstate(error):
+    """Код SQLSTATE ошибки сервера (psycopg2 - pgcode, nzpy - поле 'C' сведений об ошибке) или None."""
+    code = getattr(error, 'pgcode', None)
+    if code is None and error.args and isinstance(error.args[0], dict):
+        code = error.args[0].get('C')
+    return code
+
+
+def is_transient_netezza_error(error):
+    """
+    Проверка, что ошибку выгрузки из Netezza можно повторить: ошибка соединения или временная ошибка сервера.
+    Ошибки запроса, прав доступа или записи файла повторяются с тем же результатом, поэтому не повторяются.
+    """
+    return is_transient_error(error) or _sqlstate(error) in TRANSIENT_SQLSTATES
+
+
+def _record(policy_name, key, value=1):
+    with _policies_lock:
+        metrics = _metrics.setdefault(policy_name, {'calls': 0, 'retries': 0, 'failures': 0, 'retry_seconds': 0.0})
+        metrics[key] += value
+
+
+def call_with_retry(policy_name, func, before_retry=None):
+    """
+    Выполнение функции с повторами по политике.
+    :param policy_name: Имя политики повторов ('read', 'copy', 'ddl', 'export').
+    :param func: Функция без аргументов.
+    :param before_retry: Функция, вызываемая перед каждой повторной попыткой (например, переподключение).
+    :return: Результат функции.
+    """
+    policy = get_policy(policy_name)
+    retry_condition = is_transient_netezza_error if policy['retry_on'] == 'transient_netezza' else is_transient_error
+
+    def before(retry_state):
+        if retry_state.attempt_number > 1 and before_retry:
+            before_retry()
+
+    def before_sleep(retry_state):
+        _record(policy_name, 'retries')
+        _record(policy_name, 'retry_seconds', retry_state.upcoming_sleep)
+        logging.warning(f"Ошибка при выполнении операции ({policy_name}, попытка {retry_state.attempt_number} из "
+                        f"{policy['attempts']}): {retry_state.outcome.exception()}. "
+                        f"Повтор через {retry_state.upcoming_sleep:.1f} секунд.")
+
+    _record(policy_name, 'calls')
+    retrying = Retrying(stop=stop_after_attempt(policy['attempts']),
+                        wait=wait_random_exponential(multiplier=policy['initial_delay'], max=policy['max_delay']),
+                        retry=retry_if_exception(retry_condition), before=before, before_sleep=before_sleep,
+                        reraise=True)
+    try:
+        return retrying(func)
+    except Exception:
+        _record(policy_name, 'failures')
+        raise
+
+
+def retry_metrics():
+    """Счетчики повторов по политикам: вызовы, повторы, неуспешные операции и суммарная пауза."""
+    with _policies_lock:
+        return {name: dict(metrics) for name, metrics in _metrics.items()}
+
+
+def log_retry_metrics():
+    """Вывод в лог счетчиков повторов по политикам, по которым были повторы."""
+    for name, metrics in sorted(retry_metrics().items()):
+        if metrics['retries'] or metrics['failures']:
+            logging.info(f"Повторы операций ({name}): вызовов {metrics['calls']}, повторов {metrics['retries']}, "
+                         f"неуспешных {metrics['failures']}, суммарная пауза {metrics['retry_seconds']:.1f} секунд.")
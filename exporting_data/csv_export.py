@@ -3,10 +3,15 @@ import csv
 import pandas as pd
 import time
 from os import path
-from database.db_connection import DatabaseConnection
+from database.connection_pool import get_connection
 from database.queries import master_opening_ils, master_closing_ils, historical_opening_ils, historical_closing_ils, \
     historical_opening_ils_portions, historical_closing_ils_portions
 from utils.file_utils import clear_directory, create_directory
+from utils.run_manifest import STAGE_MASTER_EXPORT, STAGE_IDS_EXPORT, STAGE_HISTORICAL_EXPORT, record_rows, \
+    clear_rows
+from database.db_schema import HISTORICAL_COLUMNS
+from .netezza_export import build_external_table_query, execute_export, resume_exported_portion, \
+    from_netezza_export_to_csv_partitioned, from_netezza_export_to_csv_keyset
 
 # Создание директории temp_data, если она не существует
 temp_data_dir = 'temp_data'
@@ -27,50 +32,65 @@ def export_data_to_csv_with_copy(cur, query, csv_file):
         return False  # Возвращаем False при ошибке
 
 
-def export_data_to_csv(cur, query, csv_file, results=None):
-    """Выгрузка данных из базы данных в CSV файл с ручной записью заголовков и данных."""
-    try:
-        if results:
-            csv_file_path = csv_file  # Полный путь к файлу
-        else:
-            csv_file_path = path.join(temp_data_dir, csv_file)  # Полный путь к файлу
-
-        with open(csv_file_path, 'w', newline='') as csvfile:
-            cur.execute(query)
-            # Получаем названия колонок
-            colnames = [desc[0] for desc in cur.description]
-            # Записываем заголовки в CSV
-            csvfile.write(';'.join(colnames) + '\n')
-            # Записываем данные в CSV
-            for row in cur.fetchall():
-                csvfile.write(';'.join(map(str, row)) + '\n')
-            logging.info(f"Данные выгружены в {csv_file_path}")
-    except Exception as e:
-        logging.error(f"Ошибка при выгрузке данных в CSV: {e}")
-
-
-def load_acc_ids_from_csv(file_path, encoding='utf-8'):
-    """Загрузка acc_id из CSV-файла с указанием кодировки."""
-    df = pd.read_csv(file_path, encoding=encoding, sep=';')
-    return df['acc_id'].tolist()  # Предполагается, что колонка называется 'acc_id'
-
-
-# Объединение двух CSV-файлов по acc_id
-def merge_csv_files(file1, file2, output_file, encoding='utf-8', results=None):
-    """Объединение двух CSV-файлов по acc_id с учетом отсутствующих значений."""
-    df1 = pd.read_csv(file1, encoding=encoding, sep=';')  # Загрузка первого файла
-    df2 = pd.read_csv(file2)  # Загрузка второго файла
+def write_check_rows_to_csv(columns, row_chunks, csv_file_path, encoding='cp1251'):
+    """
+    Запись результата проверки в CSV файл (разделитель ';', с заголовком) по мере получения порций строк.
+    :param columns: Имена столбцов.
+    :param row_chunks: Итератор списков строк (например, порций строк курсора).
+    :param csv_file_path: Полный путь к файлу.
+    :return: Количество записанных строк.
+    """
+    rows_written = 0
+    with open(csv_file_path, 'w', newline='', encoding=encoding, errors='replace') as csvfile:
+        csvfile.write(';'.join(columns) + '\n')
+        for rows in row_chunks:
+            csvfile.writelines(';'.join(map(str, row)) + '\n' for row in rows)
+            rows_written += len(rows)
+    logging.info(f"Данные выгружены в {csv_file_path}")
+    return rows_written
+
+
+def merge_check_rows(check_csv_path, integrating_columns, integrating_rows, output_file_path, encoding='cp1251',
+                     chunk_size=100000):
+    """
+    Объединение результата проверки со статусами интеграции по acc_id (left join) и запись в CSV файл.
+    Файл результата проверки (см. write_check_rows_to_csv) читается порциями по chunk_size строк, значения
+    столбцов, кроме acc_id, переносятся без преобразования.
+    :param check_csv_path: Полный путь к файлу результата проверки.
+    :param integrating_columns: Имена столбцов статусов интеграции.
+    :param integrating_rows: Строки статусов интеграции.
+    :param output_file_path: Полный путь к выходному файлу.
+    """
+    columns = pd.read_csv(check_csv_path, sep=';', encoding=encoding, nrows=0).columns
+    dtypes = {column: str for column in columns}
+    dtypes['acc_id'] = 'Int64'
+    integrating_df = pd.DataFrame.from_records(integrating_rows, columns=integrating_columns)
+    integrating_df = integrating_df.astype({'acc_id': 'Int64'})
+    check_chunks = pd.read_csv(check_csv_path, sep=';', encoding=encoding, dtype=dtypes, keep_default_na=False,
+                               na_values=['None'], chunksize=chunk_size)
+    for number, check_df in enumerate(check_chunks):
+        merged_df = pd.merge(check_df, integrating_df, on='acc_id', how='left')
+        merged_df.to_csv(output_file_path, index=False, sep=';', encoding=encoding, errors='replace',
+                         mode='w' if number == 0 else 'a', header=number == 0)
+    logging.info(f"Объединенные данные сохранены в '{output_file_path}'.")
 
-    # Объединение по acc_id с использованием left join
-    merged_df = pd.merge(df1, df2, on='acc_id', how='left')  # Используем left join
 
-    # Сохранение объединенных данных в новый CSV-файл
-    if results:
-        output_file_path = output_file
-    else:
-        output_file_path = path.join(temp_data_dir, output_file)  # Полный путь к выходному файлу
-    merged_df.to_csv(output_file_path, index=False, sep=';', encoding=encoding)  # Указываем разделитель
-    logging.info(f"Объединенные данные сохранены в '{output_file_path}'.")
+def write_row_chunks_to_csv(row_chunks, csv_file):
+    """
+    Запись строк, получаемых порциями (например, из курсора), в CSV файл без загрузки всех строк в память.
+    :param row_chunks: Итератор списков строк.
+    :param csv_file: Имя CSV файла в каталоге temp_data.
+    :return: Количество записанных строк.
+    """
+    csv_file_path = path.join(temp_data_dir, csv_file)  # Полный путь к файлу
+    rows_written = 0
+    with open(csv_file_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=';')
+        for rows in row_chunks:
+            writer.writerows(rows)
+            rows_written += len(rows)
+    logging.info(f"Результаты выгружены в {csv_file_path} ({rows_written} строк).")
+    return rows_written
 
 
 def export_results_to_csv(results, csv_file):
@@ -86,34 +106,47 @@ def export_results_to_csv(results, csv_file):
         logging.error(f"Ошибка при выгрузке результатов в CSV: {e}")
 
 
-def from_netezza_export_to_csv_with_offset(cur, base_query, directory, output_file_base, batch_size=20000):
-    """Экспорт данных из Netezza в CSV с использованием CREATE EXTERNAL TABLE и смещения."""
+def from_netezza_export_to_csv_with_offset(connection, base_query, directory, output_file_base, batch_size=20000,
+                                           state=None, checkpoint_scope=None, on_portion=None, consumed_files=None):
+    """
+    Экспорт данных из Netezza в CSV с использованием CREATE EXTERNAL TABLE и смещения.
+    :param connection: Подключение к Netezza.
+    :param state: Состояние обработки для сохранения контрольных точек по выгруженным порциям (необязательно).
+    :param checkpoint_scope: Область контрольных точек порций в состоянии обработки.
+    :param on_portion: Обработчик, вызываемый с путем к файлу после выгрузки каждой порции (необязательно).
+    :param consumed_files: Имена файлов, уже загруженных и удаленных обработчиком при предыдущем запуске.
+    """
     try:
         offset = 0
         while True:
+            csv_file_path = path.join(directory, f"{output_file_base}_{offset}.csv")
+            # Пропуск порции, выгруженной при предыдущем запуске
+            checkpoint = state.get_checkpoint(checkpoint_scope, offset) if state else None
+            if resume_exported_portion(checkpoint, consumed_files, on_portion):
+                logging.info(f"Порция (offset: {offset}) выгружена ранее, пропускаем.")
+                offset += batch_size
+                if checkpoint['rows'] < batch_size:
+                    break
+                continue
+
             # Формирование полного SQL-запроса с учетом смещения
-            time.sleep(3)
-            query = f"{base_query} WHERE rn > {offset} AND rn <= {offset + batch_size};"
+            query = f"{base_query} WHERE rn > {offset} AND rn <= {offset + batch_size}"
 
             # Создание внешней таблицы для выгрузки
-            external_table_query = f"""
-            CREATE EXTERNAL TABLE '{directory}\\{output_file_base}_{offset}.csv'
-            USING (
-                IncludeHeader   
-                DELIMITER ';'
-                ENCODING 'internal'
-                REMOTESOURCE 'ODBC'
-                ESCAPECHAR '\\'
-            ) AS
-            {query};
-            """
-
-            # Выполнение запроса на создание внешней таблицы и выгрузку данных
-            cur.execute(external_table_query)
+            external_table_query = build_external_table_query(directory, f"{output_file_base}_{offset}.csv", query)
+
+            # Выполнение запроса на создание внешней таблицы и выгрузку данных (с повтором при ошибках)
+            rows_affected = execute_export(connection, external_table_query)
 
             # Проверка количества выгруженных строк
-            rows_affected = cur.rowcount
             logging.info(f"Выгружено строк: {rows_affected} (offset: {offset})")
+            # Имя файлов порций совпадает с именем выгружаемой таблицы
+            record_rows(STAGE_HISTORICAL_EXPORT, output_file_base, path.basename(csv_file_path), exported=rows_affected)
+            if state:
+                state.mark_checkpoint(checkpoint_scope, offset, {'file': csv_file_path, 'rows': rows_affected,
+                                                                 'size': path.getsize(csv_file_path)})
+            if on_portion:
+                on_portion(csv_file_path)
 
             # Увеличение смещения
             offset += batch_size
@@ -127,13 +160,32 @@ def from_netezza_export_to_csv_with_offset(cur, base_query, directory, output_fi
         return False  # Возвращаем False при ошибке
 
 
-def export_data_from_master(config, account_type):
-    """Выгрузка данных из базы мастер-системы."""
-    master_conn = DatabaseConnection(config['master_db'])
+def build_master_query(account_type, delta_column=None, watermark=None):
+    """
+    Формирование запроса выгрузки данных из мастер-системы.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param delta_column: Столбец с отметкой о последнем изменении (инкрементальный режим).
+    :param watermark: Значение отметки предыдущего запуска. Если не задано, выгружаются все данные.
+    :return: Текст запроса.
+    """
+    query = master_opening_ils if account_type == 'opening' else master_closing_ils
+    if delta_column and watermark:
+        # Граничное значение выгружается повторно, чтобы не пропустить изменения, внесенные после прошлого запуска
+        watermark_literal = str(watermark).replace("'", "''")
+        query = f"SELECT * FROM ({query}) AS m WHERE m.{delta_column} >= '{watermark_literal}'"
+    return query
+
+
+def export_data_from_master(config, account_type, delta_column=None, watermark=None):
+    """
+    Выгрузка данных из базы мастер-системы.
+    В инкрементальном режиме выгружаются только лицевые счета со значением delta_column не меньше watermark.
+    """
+    master_conn = get_connection(config, 'master_db')
     logging.info("Подключение к мастер-системе установлено.")
 
     csv_filename = f'master_{account_type}_ils.csv'
-    query = master_opening_ils if account_type == 'opening' else master_closing_ils
+    query = build_master_query(account_type, delta_column, watermark)
 
     start_time = time.time()
     with master_conn:
@@ -141,11 +193,14 @@ def export_data_from_master(config, account_type):
             export_result = export_data_to_csv_with_copy(cur,
                                                          f"COPY ({query}) TO STDOUT WITH CSV HEADER DELIMITER ';'",
                                                          csv_filename)
+            rows_exported = cur.rowcount
 
     if export_result:
+        record_rows(STAGE_MASTER_EXPORT, f'master_{account_type}_ils', exported=rows_exported)
         end_time = time.time()
         logging.info(
-            f"Выгрузка данных из мастер-системы по {account_type} завершена. Время выполнения: {end_time - start_time:.2f} секунд.")
+            f"Выгрузка данных из мастер-системы по {account_type} завершена ({rows_exported} строк). "
+            f"Время выполнения: {end_time - start_time:.2f} секунд.")
         return csv_filename
     else:
         end_time = time.time()
@@ -154,10 +209,13 @@ def export_data_from_master(config, account_type):
         return None
 
 
-def export_ids_from_monitoring(config):
-    """Извлечение идентификаторов из базы мониторинга."""
+def export_ids_from_monitoring(config, account_types=('opening', 'closing'), delta=False):
+    """
+    Извлечение идентификаторов из базы мониторинга.
+    В инкрементальном режиме (delta=True) извлекаются только идентификаторы измененных лицевых счетов.
+    """
     start_time = time.time()
-    monitoring_conn = DatabaseConnection(config['monitoring_db'])
+    monitoring_conn = get_connection(config, 'monitoring_db')
     logging.info("Подключение к целевой системе мониторинга установлено.")
 
     # Переместите импорт DBOperations сюда
@@ -165,25 +223,36 @@ def export_ids_from_monitoring(config):
     db_ops = DBOperations(monitoring_conn, db_type=config['monitoring_db']['type'])
 
     with monitoring_conn:
-        with monitoring_conn.get_cursor() as cur:
-            for account_type in ['opening', 'closing']:
-                csv_filename = f"ids_{account_type}_ils.csv"  # Имя файла
-                query = f'SELECT DISTINCT acc_id FROM master_{account_type}_ils;'
-                export_result = db_ops.execute_query(query, csv_file=csv_filename)
-
-                if export_result is None:
-                    logging.error(f"Не удалось извлечь идентификаторы для {account_type}.")
-                    return False
+        for account_type in account_types:
+            csv_filename = f"ids_{account_type}_ils.csv"  # Имя файла
+            table_name = f'master_{account_type}_ils' + ('_delta' if delta else '')
+            query = f'SELECT DISTINCT acc_id FROM {table_name};'
+            # Идентификаторы записываются в файл порциями, без загрузки всего результата в память
+            try:
+                rows_exported = db_ops.export_query_to_csv(query, csv_filename,
+                                                           itersize=config['processing']['stream_itersize'])
+            except Exception as e:
+                logging.error(f"Не удалось извлечь идентификаторы для {account_type}: {e}")
+                return False
+            record_rows(STAGE_IDS_EXPORT, f'ids_{account_type}_ils', exported=rows_exported)
+            logging.info(f"Извлечено идентификаторов для {account_type}: {rows_exported}.")
 
     end_time = time.time()
     logging.info(f"Идентификаторы извлечены в csv-файлы. Время выполнения: {end_time - start_time:.2f} секунд.")
     return True
 
 
-def export_data_from_historical(config, cur_dir_path):
-    """Выгрузка данных из исторической системы."""
+def export_data_from_historical(config, cur_dir_path, account_types=('opening', 'closing'), state=None,
+                                on_portion=None, consumed_files=None):
+    """
+    Выгрузка данных из исторической системы.
+    При передаче состояния обработки выгрузка возобновляется с первой невыгруженной порции,
+    а уже выгруженные файлы сохраняются.
+    :param on_portion: Обработчик, вызываемый с путем к файлу после выгрузки каждой порции (необязательно).
+    :param consumed_files: Имена файлов, уже загруженных и удаленных обработчиком при предыдущем запуске.
+    """
     start_time = time.time()
-    historical_conn = DatabaseConnection(config['historical_db'])
+    historical_conn = get_connection(config, 'historical_db')
     logging.info("Подключение к базе исторической системы установлено.")
 
     # Переместите импорт DBOperations сюда
@@ -193,28 +262,65 @@ def export_data_from_historical(config, cur_dir_path):
     prefix_table_name = 'vlg_mic'
 
     with historical_conn:
-        with historical_conn.get_cursor() as cur:
-            for account_type in ['opening', 'closing']:
-                table_historical = f"{prefix_table_name}_historical_{account_type}_ils"
+        for account_type in account_types:
+            table_historical = f"{prefix_table_name}_historical_{account_type}_ils"
+            directory_csv_portions = path.join(cur_dir_path, temp_data_dir, f"{table_historical}")
+            export_mode = config['processing']['historical_export_mode']
+            checkpoint_scope = f"{export_mode}:{account_type}"
+
+            # Таблица пересоздается только при первом запуске, при возобновлении выгрузка продолжается из нее
+            if not (state and state.get_checkpoint('historical_tables', account_type)):
+                if state:
+                    state.clear_checkpoints(checkpoint_scope)
+                clear_rows(STAGE_HISTORICAL_EXPORT, table_historical)
                 db_historical_ops.drop_table(table_historical)
                 db_historical_ops.create_netezza_table_from_select(
                     historical_opening_ils if account_type == 'opening' else historical_closing_ils,
                     table_historical, 'acc_id'
                 )
-
-                directory_csv_portions = path.join(cur_dir_path, temp_data_dir, f"{table_historical}")
                 create_directory(directory_csv_portions)
                 clear_directory(directory_csv_portions)
-
-                export_result = from_netezza_export_to_csv_with_offset(cur,
+                if state:
+                    state.mark_checkpoint('historical_tables', account_type)
+            else:
+                logging.info(f"Таблица {table_historical} создана ранее, возобновляем выгрузку порций.")
+
+            if export_mode == 'partitioned':
+                # Подключение этапа на время выгрузки частей возвращается в пул (при следующем обращении
+                # к базе оно будет получено снова), чтобы не занимать подключение, нужное выгрузкам частей
+                historical_conn.close()
+                export_result = from_netezza_export_to_csv_partitioned(
+                    config, table_historical, list(HISTORICAL_COLUMNS[account_type]), directory_csv_portions,
+                    table_historical, partitions=config['processing']['export_partitions'],
+                    concurrency=config['processing']['export_concurrency'],
+                    partition_by=config['processing']['export_partition_by'],
+                    state=state, checkpoint_scope=checkpoint_scope, on_portion=on_portion,
+                    consumed_files=consumed_files
+                )
+            elif export_mode == 'keyset':
+                processing = config['processing']
+                export_result = from_netezza_export_to_csv_keyset(
+                    historical_conn, table_historical, list(HISTORICAL_COLUMNS[account_type]), directory_csv_portions,
+                    table_historical, batch_size=processing['export_batch_size'],
+                    min_batch_size=processing['export_min_batch_size'],
+                    max_batch_size=processing['export_max_batch_size'],
+                    target_seconds=processing['export_target_seconds'],
+                    target_file_bytes=processing['export_target_file_mb'] * 1024 * 1024,
+                    state=state, checkpoint_scope=checkpoint_scope, on_portion=on_portion,
+                    consumed_files=consumed_files
+                )
+            else:
+                export_result = from_netezza_export_to_csv_with_offset(historical_conn,
                                                                        historical_opening_ils_portions if account_type == 'opening' else historical_closing_ils_portions,
-                                                                       directory_csv_portions, table_historical
+                                                                       directory_csv_portions, table_historical,
+                                                                       state=state, checkpoint_scope=checkpoint_scope,
+                                                                       on_portion=on_portion,
+                                                                       consumed_files=consumed_files
                                                                        )
 
-                if not export_result:
-                    logging.error(f"Не удалось выгрузить данные для {account_type} из исторической системы.")
-                    break
-                    return False
+            if not export_result:
+                logging.error(f"Не удалось выгрузить данные для {account_type} из исторической системы.")
+                return False
 
     end_time = time.time()
     logging.info(
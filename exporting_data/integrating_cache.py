@@ -0,0 +1,127 @@
+import logging
+import os
+import sqlite3
+import time
+from utils.file_utils import create_directory
+from utils.id_set import AccIdSet
+
+# Количество идентификаторов в одном запросе к файлу кэша (ограничение количества параметров SQLite)
+SQLITE_BATCH_SIZE = 500
+
+
+class IntegratingStatusCache:
+    """
+    Локальный кэш статусов интеграции лицевых счетов (SQLite-файл).
+    Для каждого acc_id хранится последний статус (status, error_txt, bsn_ts, ts) и время проверки. Запись
+    считается актуальной в течение ttl секунд. Устаревшие записи обновляются запросом только строк со значением
+    bsn_ts больше сохраненного (отметка bsn_ts записи), поэтому из интеграционной базы передаются только
+    изменившиеся статусы. Идентификаторы, не найденные в интеграционной базе, также сохраняются (без статуса) и
+    повторно запрашиваются после истечения ttl.
+    Объект используется в одном потоке.
+    """
+
+    def __init__(self, file_path, ttl):
+        """
+        :param file_path: Путь к файлу кэша.
+        :param ttl: Время актуальности записи (секунды).
+        """
+        self.file_path = file_path
+        self.ttl = ttl
+        create_directory(os.path.dirname(file_path) or '.')
+        self._conn = sqlite3.connect(file_path, timeout=60)
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS statuses (
+            acc_id INTEGER PRIMARY KEY,
+            found INTEGER NOT NULL,
+            status,
+            error_txt,
+            bsn_ts TEXT,
+            ts TEXT,
+            checked_at REAL NOT NULL
+        )
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _select(self, query, acc_ids):
+        """Выполнение запроса к кэшу по идентификаторам порциями (в запросе {ids} - список параметров)."""
+        for chunk in acc_ids.chunks(SQLITE_BATCH_SIZE):
+            ids = chunk.tolist()
+            yield from self._conn.execute(query.format(ids=', '.join('?' * len(ids))), ids)
+
+    def plan(self, acc_ids):
+        """
+        Разделение идентификаторов по способу получения статуса.
+        :param acc_ids: Идентификаторы (AccIdSet).
+        :return: Кортеж (идентификаторы для полного запроса - новые и ранее не найденные с истекшим ttl,
+            список пар (acc_id, bsn_ts) устаревших записей для запроса изменений в порядке bsn_ts).
+        """
+        expired_before = time.time() - self.ttl
+        fresh_ids, refresh = [], []
+        for acc_id, found, bsn_ts, checked_at in self._select(
+                "SELECT acc_id, found, bsn_ts, checked_at FROM statuses WHERE acc_id IN ({ids})", acc_ids):
+            if checked_at >= expired_before:
+                fresh_ids.append(acc_id)
+            elif found and bsn_ts is not None:
+                refresh.append((acc_id, bsn_ts))
+        refresh.sort(key=lambda item: item[1])
+        known_ids = AccIdSet(fresh_ids + [acc_id for acc_id, _ in refresh])
+        logging.info(f"Кэш статусов интеграции: актуальных записей {len(fresh_ids)}, устаревших {len(refresh)}, "
+                     f"новых идентификаторов {len(acc_ids) - len(known_ids)}.")
+        return acc_ids - known_ids, refresh
+
+    def store(self, rows, requested_ids=None):
+        """
+        Сохранение полученных статусов.
+        :param rows: Строки (acc_id, status, error_txt, bsn_ts, ts).
+        :param requested_ids: Запрошенные идентификаторы: отсутствующие в rows сохраняются как ненайденные
+            (после полного запроса) или отмечаются как проверенные (после запроса изменений, см. touch).
+        """
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO statuses (acc_id, found, status, error_txt, bsn_ts, ts, checked_at) "
+            "VALUES (?, 1, ?, ?, ?, ?, ?)",
+            [(acc_id, status, error_txt, _text(bsn_ts), _text(ts), now)
+             for acc_id, status, error_txt, bsn_ts, ts in rows])
+        if requested_ids is not None:
+            missing_ids = set(requested_ids) - {row[0] for row in rows}
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO statuses (acc_id, found, checked_at) VALUES (?, 0, ?)",
+                [(acc_id, now) for acc_id in missing_ids])
+        self._conn.commit()
+
+    def touch(self, acc_ids):
+        """Отметка о проверке записей, статус которых не изменился."""
+        now = time.time()
+        self._conn.executemany("UPDATE statuses SET checked_at = ? WHERE acc_id = ?",
+                               [(now, acc_id) for acc_id in acc_ids])
+        self._conn.commit()
+
+    def rows(self, acc_ids):
+        """Сохраненные статусы найденных идентификаторов: строки (acc_id, status, error_txt, bsn_ts, ts)."""
+        return self._select("SELECT acc_id, status, error_txt, bsn_ts, ts FROM statuses "
+                            "WHERE found = 1 AND acc_id IN ({ids})", acc_ids)
+
+
+def _text(value):
+    """Значение даты и времени в текстовом виде (как при записи в CSV-файл)."""
+    return str(value) if value is not None else None
+
+
+def open_integrating_cache(config):
+    """
+    Кэш статусов интеграции из конфигурации обработки.
+    :return: IntegratingStatusCache или None, если кэш отключен (integrating_cache_ttl = 0).
+    """
+    processing = config['processing']
+    if not processing['integrating_cache_ttl']:
+        return None
+    return IntegratingStatusCache(processing['integrating_cache_file'], processing['integrating_cache_ttl'])
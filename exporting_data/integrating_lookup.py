@@ -0,0 +1,148 @@
+import csv
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from database.connection_pool import get_connection, get_pool
+from database.queries import part_query_integrating
+
+# Столбцы результата запроса к интеграционной базе
+INTEGRATING_COLUMNS = ['acc_id', 'status', 'error_txt', 'bsn_ts', 'ts']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def build_integrating_query(changed_only=False):
+    """
+    Запрос статусов интеграции по массиву идентификаторов.
+    Идентификаторы передаются одним параметром-массивом (%s::bigint[]), поэтому текст запроса не зависит от их
+    количества.
+    :param changed_only: Запрос только статусов со значением bsn_ts больше второго параметра (обновление кэша).
+    """
+    condition = "rn = 1 AND bsn_ts > %s" if changed_only else "rn = 1"
+    # Знаки % в тексте запроса экранируются, так как запрос выполняется с параметрами
+    return f"""{part_query_integrating.replace('%', '%%')} (SELECT unnest(%s::bigint[])) and datatype = 1) as a
+    WHERE {condition};
+    """
+
+
+def _fetch_batch(config, query, params):
+    """Выполнение запроса по порции идентификаторов на подключении из пула интеграционной базы."""
+    integrating_conn = get_connection(config, 'integrating_db')
+    from database.db_operations import DBOperations
+    db_ops_integrating = DBOperations(integrating_conn, db_type=config['integrating_db']['type'])
+    with integrating_conn:
+        return db_ops_integrating.execute_query(query, params=params)
+
+
+def get_integrating_executor(config, concurrency):
+    """
+    Пул потоков запросов к интеграционной базе, общий для всех проверок процесса (создается при первом обращении).
+    Количество потоков не превышает размер пула подключений интеграционной базы, поэтому проверки, выполняемые
+    одновременно, ожидают своей очереди в пуле потоков, а не подключения (с ограничением acquire_timeout).
+    :param concurrency: Количество потоков (integrating_concurrency).
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = min(concurrency, get_pool(config, 'integrating_db').max_connections)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='integrating')
+        return _executor
+
+
+def run_integrating_batches(config, batches, on_result, concurrency=4):
+    """
+    Одновременное выполнение запросов к интеграционной базе в общем пуле потоков (см. get_integrating_executor).
+    Результаты передаются обработчику в текущем потоке по мере получения (порядок не определен), одновременно
+    в памяти находится не более 2 * concurrency порций одного вызова.
+    :param batches: Итератор кортежей (запрос, параметры, сведения о порции).
+    :param on_result: Обработчик результата порции: on_result(сведения о порции, строки).
+    :return: Количество выполненных запросов.
+    """
+    batches_done = 0
+    executor = get_integrating_executor(config, concurrency)
+    pending = {}
+
+    def handle(done):
+        nonlocal batches_done
+        for future in done:
+            on_result(pending.pop(future), future.result())
+            batches_done += 1
+
+    try:
+        for query, params, context in batches:
+            if len(pending) >= 2 * concurrency:
+                handle(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[executor.submit(_fetch_batch, config, query, params)] = context
+        while pending:
+            handle(wait(pending, return_when=FIRST_COMPLETED).done)
+    except Exception:
+        for future in pending:
+            future.cancel()
+        wait(pending)
+        raise
+    return batches_done
+
+
+def export_integrating_statuses(config, acc_ids, csv_file_path, batch_size=5000, concurrency=4, cache=None):
+    """
+    Выгрузка статусов интеграции по идентификаторам лицевых счетов в CSV-файл.
+    Идентификаторы передаются порциями по batch_size параметром-массивом, порции выполняются одновременно
+    в общем для проверок пуле потоков на подключениях из пула интеграционной базы (см. run_integrating_batches).
+    Без кэша результаты записываются в файл по мере получения. С кэшем (IntegratingStatusCache) запрашиваются
+    только новые идентификаторы и изменения устаревших записей, файл формируется из кэша.
+    :param config: Конфигурация подключений.
+    :param acc_ids: Идентификаторы (AccIdSet).
+    :param csv_file_path: Путь к CSV-файлу результата (разделитель ',', с заголовком).
+    :param cache: Кэш статусов интеграции (необязательно).
+    :return: Список записанных строк (acc_id, status, error_txt, bsn_ts, ts).
+    """
+    start_time = time.time()
+    rows_written = []
+
+    with open(csv_file_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(INTEGRATING_COLUMNS)
+
+        if cache is None:
+            def write_rows(context, rows):
+                writer.writerows(rows)
+                rows_written.extend(rows)
+
+            query = build_integrating_query()
+            batches_done = run_integrating_batches(
+                config, ((query, (chunk.tolist(),), None) for chunk in acc_ids.chunks(batch_size)), write_rows,
+                concurrency=concurrency)
+        else:
+            new_ids, refresh = cache.plan(acc_ids)
+
+            def update_cache(context, rows):
+                mode, ids = context
+                if mode == 'full':
+                    cache.store(rows, requested_ids=ids)
+                else:
+                    cache.store(rows)
+                    cache.touch(set(ids) - {row[0] for row in rows})
+
+            def cache_batches():
+                query = build_integrating_query()
+                for chunk in new_ids.chunks(batch_size):
+                    ids = chunk.tolist()
+                    yield query, (ids,), ('full', ids)
+                # Устаревшие записи упорядочены по bsn_ts, отметкой порции служит наименьшее значение
+                changed_query = build_integrating_query(changed_only=True)
+                for start in range(0, len(refresh), batch_size):
+                    part = refresh[start:start + batch_size]
+                    ids = [acc_id for acc_id, _ in part]
+                    yield changed_query, (ids, part[0][1]), ('refresh', ids)
+
+            batches_done = run_integrating_batches(config, cache_batches(), update_cache, concurrency=concurrency)
+            rows_written = list(cache.rows(acc_ids))
+            writer.writerows(rows_written)
+
+    end_time = time.time()
+    logging.info(f"Статусы интеграции по {len(acc_ids)} идентификаторам выгружены в {csv_file_path} "
+                 f"({len(rows_written)} строк, запросов к интеграционной базе: {batches_done}). "
+                 f"Время выполнения: {end_time - start_time:.2f} секунд.")
+    return rows_written
@@ -0,0 +1,343 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from functools import partial
+from os import path
+from database.connection_pool import get_connection, get_pool
+from utils.processing_state import is_file_checkpoint_valid
+from utils.run_manifest import STAGE_HISTORICAL_EXPORT, record_rows
+
+MANIFEST_FILE = 'manifest.json'
+
+_partition_executor = None
+_partition_executor_lock = threading.Lock()
+
+
+def build_external_table_query(directory, file_name, query):
+    """
+    Формирование запроса выгрузки результата запроса в CSV-файл через внешнюю таблицу Netezza.
+    :param directory: Директория для CSV-файла (на стороне клиента).
+    :param file_name: Имя CSV-файла.
+    :param query: SQL-запрос для выборки данных.
+    """
+    return f"""
+    CREATE EXTERNAL TABLE '{directory}\\{file_name}'
+    USING (
+        IncludeHeader
+        DELIMITER ';'
+        ENCODING 'internal'
+        REMOTESOURCE 'ODBC'
+        ESCAPECHAR '\\'
+    ) AS
+    {query};
+    """
+
+
+def execute_export(connection, query):
+    """
+    Выполнение запроса выгрузки с повторами по политике 'export' (экспоненциальная пауза со случайной величиной).
+    Перед выгрузкой соединение проверяется, при ошибке соединения повтор выполняется на новом соединении.
+    :param connection: Подключение к Netezza.
+    :param query: Запрос выгрузки (CREATE EXTERNAL TABLE ... AS SELECT).
+    :return: Количество выгруженных строк.
+    """
+    def run(cur):
+        cur.execute(query)
+        return cur.rowcount
+
+    return connection.run_with_retry(run, policy='export')
+
+
+def resume_exported_portion(checkpoint, consumed_files=None, on_portion=None):
+    """
+    Проверка порции, выгруженной при предыдущем запуске.
+    Файл, который выгружен, но еще не загружен, повторно передается обработчику on_portion.
+    :param checkpoint: Контрольная точка порции.
+    :param consumed_files: Имена уже загруженных (и удаленных) файлов.
+    :param on_portion: Обработчик выгруженных файлов (необязательно).
+    :return: True, если порцию не нужно выгружать повторно.
+    """
+    if not is_file_checkpoint_valid(checkpoint, consumed_files):
+        return False
+    if on_portion and path.basename(checkpoint['file']) not in (consumed_files or {}):
+        on_portion(checkpoint['file'])
+    return True
+
+
+def plan_partitions(cur, table_name, partitions, partition_by='acc_id'):
+    """
+    Разбиение таблицы Netezza на части для параллельной выгрузки.
+    :param cur: Курсор для выполнения SQL-запросов.
+    :param table_name: Имя таблицы.
+    :param partitions: Количество диапазонов acc_id (для partition_by='acc_id').
+    :param partition_by: Способ разбиения: 'acc_id' (диапазоны acc_id) или 'dataslice' (срезы данных Netezza).
+    :return: Список условий WHERE для частей.
+    """
+    if partition_by == 'dataslice':
+        cur.execute(f"SELECT DISTINCT DATASLICEID FROM {table_name} ORDER BY 1;")
+        return [f"DATASLICEID = {row[0]}" for row in cur.fetchall()]
+    if partition_by != 'acc_id':
+        raise ValueError(f"Неподдерживаемый способ разбиения: {partition_by}. Используйте 'acc_id' или 'dataslice'.")
+
+    cur.execute(f"SELECT MIN(acc_id), MAX(acc_id) FROM {table_name};")
+    min_id, max_id = cur.fetchone()
+    if min_id is None:
+        return []
+    min_id, max_id = int(min_id), int(max_id)
+    step = max((max_id - min_id + 1) // partitions, 1)
+    conditions = []
+    lower = min_id
+    while lower <= max_id:
+        upper = lower + step
+        if upper > max_id or len(conditions) == partitions - 1:
+            conditions.append(f"acc_id >= {lower} AND acc_id <= {max_id}")
+            break
+        conditions.append(f"acc_id >= {lower} AND acc_id < {upper}")
+        lower = upper
+    return conditions
+
+
+def export_partition(config, query, directory, file_name):
+    """
+    Выгрузка одной части таблицы в CSV-файл через отдельное подключение к Netezza из пула.
+    :return: Количество выгруженных строк.
+    """
+    start_time = time.time()
+    connection = get_connection(config, 'historical_db')
+    with connection:
+        rows_affected = execute_export(connection, build_external_table_query(directory, file_name, query))
+    logging.info(f"Выгружено строк: {rows_affected} в файл {file_name}. "
+                 f"Время выполнения: {time.time() - start_time:.2f} секунд.")
+    return rows_affected
+
+
+def get_partition_executor(config, concurrency):
+    """
+    Пул потоков выгрузки частей, общий для выгрузок всех таблиц процесса (создается при первом обращении).
+    Количество потоков не превышает размер пула подключений исторической системы, поэтому одновременные выгрузки
+    таблиц открытых и закрытых лицевых счетов ожидают своей очереди в пуле потоков, а не подключения
+    (с ограничением acquire_timeout).
+    :param concurrency: Количество потоков (export_concurrency).
+    """
+    global _partition_executor
+    with _partition_executor_lock:
+        if _partition_executor is None:
+            workers = min(concurrency, get_pool(config, 'historical_db').max_connections)
+            _partition_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='partition-export')
+        return _partition_executor
+
+
+def from_netezza_export_to_csv_partitioned(config, table_name, columns, directory, output_file_base, partitions=8,
+                                           concurrency=4, partition_by='acc_id', state=None, checkpoint_scope=None,
+                                           on_portion=None, consumed_files=None):
+    """
+    Параллельная выгрузка таблицы Netezza в CSV-файлы по частям (диапазонам acc_id или срезам данных).
+    Каждая часть выгружается через CREATE EXTERNAL TABLE в отдельном подключении в общем пуле потоков выгрузки
+    (см. get_partition_executor), количество одновременных выгрузок ограничено параметром concurrency и размером
+    пула подключений исторической системы. По результатам формируется манифест с файлами и количеством строк.
+    :param config: Конфигурация подключений.
+    :param table_name: Имя выгружаемой таблицы.
+    :param columns: Список выгружаемых столбцов.
+    :param directory: Директория для CSV-файлов.
+    :param output_file_base: Префикс имен CSV-файлов.
+    :param partitions: Количество диапазонов acc_id.
+    :param concurrency: Максимальное количество одновременных выгрузок.
+    :param partition_by: Способ разбиения: 'acc_id' или 'dataslice'.
+    :param state: Состояние обработки для сохранения контрольных точек по частям (необязательно).
+    :param checkpoint_scope: Область контрольных точек частей в состоянии обработки.
+    :param on_portion: Обработчик, вызываемый с путем к файлу после выгрузки каждой части (необязательно).
+    :param consumed_files: Имена файлов, уже загруженных и удаленных обработчиком при предыдущем запуске.
+    :return: True при успешной выгрузке всех частей, иначе False.
+    """
+    start_time = time.time()
+    try:
+        # План разбиения сохраняется, чтобы при возобновлении использовать те же части
+        conditions = state.get_checkpoint(checkpoint_scope, 'plan') if state else None
+        if conditions is None:
+            connection = get_connection(config, 'historical_db')
+            with connection:
+                conditions = connection.run_with_retry(
+                    lambda cur: plan_partitions(cur, table_name, partitions, partition_by), policy='read')
+            if state:
+                state.mark_checkpoint(checkpoint_scope, 'plan', conditions)
+        logging.info(f"Таблица {table_name} разбита на {len(conditions)} частей ({partition_by}).")
+
+        columns_str = ', '.join(columns)
+        manifest = []
+        futures = {}
+        executor = get_partition_executor(config, concurrency)
+        for number, condition in enumerate(conditions):
+            file_name = f"{output_file_base}_p{number}.csv"
+            csv_file_path = path.join(directory, file_name)
+            checkpoint = state.get_checkpoint(checkpoint_scope, number) if state else None
+            if resume_exported_portion(checkpoint, consumed_files, on_portion):
+                logging.info(f"Часть {number} выгружена ранее, пропускаем.")
+                manifest.append({'file': file_name, 'condition': condition, 'rows': checkpoint['rows']})
+                continue
+            query = f"SELECT {columns_str} FROM {table_name} WHERE {condition}"
+            future = executor.submit(export_partition, config, query, directory, file_name)
+            futures[future] = (number, file_name, csv_file_path, condition)
+
+        errors = []
+        try:
+            for future in as_completed(futures):
+                number, file_name, csv_file_path, condition = futures[future]
+                try:
+                    rows_affected = future.result()
+                except Exception as e:
+                    logging.error(f"Ошибка при выгрузке части {number} ({condition}): {e}")
+                    errors.append(e)
+                    continue
+                manifest.append({'file': file_name, 'condition': condition, 'rows': rows_affected})
+                record_rows(STAGE_HISTORICAL_EXPORT, table_name, file_name, exported=rows_affected)
+                if state:
+                    state.mark_checkpoint(checkpoint_scope, number, {'file': csv_file_path, 'rows': rows_affected,
+                                                                     'size': path.getsize(csv_file_path)})
+                if on_portion:
+                    on_portion(csv_file_path)
+        except Exception:
+            # Невыполненные части отменяются, выполняемые завершаются до выхода (как при закрытии пула потоков)
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise
+        if errors:
+            return False
+
+        manifest.sort(key=lambda item: item['file'])
+        total_rows = sum(item['rows'] for item in manifest)
+        with open(path.join(directory, MANIFEST_FILE), 'w') as f:
+            json.dump({'table': table_name, 'partition_by': partition_by, 'total_rows': total_rows,
+                       'files': manifest}, f, ensure_ascii=False, indent=2)
+        end_time = time.time()
+        logging.info(f"Таблица {table_name} выгружена по частям: {total_rows} строк в {len(manifest)} файлах. "
+                     f"Время выполнения: {end_time - start_time:.2f} секунд.")
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка при параллельной выгрузке данных в CSV: {e}")
+        return False
+
+
+def next_batch_size(batch_size, rows, seconds, file_size, min_batch_size, max_batch_size, target_seconds=None,
+                    target_file_bytes=None):
+    """
+    Расчет размера следующей порции по измеренной скорости выгрузки.
+    Размер подбирается так, чтобы порция выгружалась примерно за target_seconds секунд
+    и (если задано) ее файл имел размер около target_file_bytes байт.
+    """
+    if rows <= 0:
+        return batch_size
+    candidates = []
+    if target_seconds and seconds > 0:
+        candidates.append(rows / seconds * target_seconds)
+    if target_file_bytes and file_size > 0:
+        candidates.append(target_file_bytes / (file_size / rows))
+    if not candidates:
+        return batch_size
+    # Ограничение роста, чтобы единичный быстрый замер не увеличил порцию слишком сильно
+    new_batch_size = min(min(candidates), batch_size * 4)
+    return int(max(min_batch_size, min(max_batch_size, new_batch_size)))
+
+
+def fetch_portion_bounds(cur, table_name, key_condition, batch_size):
+    """
+    Определение верхней границы порции по ключу.
+    :return: Максимальный acc_id порции и количество строк в ней.
+    """
+    cur.execute(f"""
+    SELECT MAX(acc_id), COUNT(*) FROM (
+        SELECT acc_id FROM {table_name} WHERE {key_condition} ORDER BY acc_id LIMIT {batch_size}
+    ) AS k;
+    """)
+    return cur.fetchone()
+
+
+def from_netezza_export_to_csv_keyset(connection, table_name, columns, directory, output_file_base, batch_size=20000,
+                                      min_batch_size=5000, max_batch_size=1000000, target_seconds=30,
+                                      target_file_bytes=None, state=None, checkpoint_scope=None, on_portion=None,
+                                      consumed_files=None):
+    """
+    Выгрузка таблицы Netezza в CSV-файлы порциями с постраничной навигацией по ключу (acc_id > последний выгруженный).
+    Границы порции определяются по acc_id без вычисления оконной функции по всей выборке, размер порции
+    подстраивается под измеренную скорость выгрузки. Выгрузка завершается на неполной порции без лишнего запроса.
+    :param connection: Подключение к Netezza.
+    :param table_name: Имя выгружаемой таблицы.
+    :param columns: Список выгружаемых столбцов.
+    :param directory: Директория для CSV-файлов.
+    :param output_file_base: Префикс имен CSV-файлов.
+    :param batch_size: Начальный размер порции.
+    :param min_batch_size: Минимальный размер порции.
+    :param max_batch_size: Максимальный размер порции.
+    :param target_seconds: Желаемая длительность выгрузки одной порции (в секундах).
+    :param target_file_bytes: Желаемый размер файла порции (в байтах, необязательно).
+    :param state: Состояние обработки для сохранения контрольных точек по порциям (необязательно).
+    :param checkpoint_scope: Область контрольных точек порций в состоянии обработки.
+    :param on_portion: Обработчик, вызываемый с путем к файлу после выгрузки каждой порции (необязательно).
+    :param consumed_files: Имена файлов, уже загруженных и удаленных обработчиком при предыдущем запуске.
+    :return: True при успешной выгрузке, иначе False.
+    """
+    start_time = time.time()
+    columns_str = ', '.join(columns)
+    last_seen = None
+    number = 0
+    total_rows = 0
+    try:
+        # Пропуск порций, выгруженных при предыдущем запуске
+        while state:
+            checkpoint = state.get_checkpoint(checkpoint_scope, number)
+            if not resume_exported_portion(checkpoint, consumed_files, on_portion):
+                break
+            last_seen, batch_size = checkpoint['last_acc_id'], checkpoint['next_batch_size']
+            total_rows += checkpoint['rows']
+            number += 1
+            if checkpoint['last']:
+                logging.info(f"Таблица {table_name} выгружена ранее ({total_rows} строк), пропускаем.")
+                return True
+        if number:
+            logging.info(f"Выгружено ранее порций: {number}, продолжаем с acc_id > {last_seen}.")
+
+        while True:
+            key_condition = f"acc_id > {last_seen}" if last_seen is not None else "1 = 1"
+            # Определение верхней границы порции по ключу
+            upper_acc_id, rows_expected = connection.run_with_retry(
+                partial(fetch_portion_bounds, table_name=table_name, key_condition=key_condition,
+                        batch_size=batch_size), policy='read')
+            if not rows_expected:
+                break
+
+            file_name = f"{output_file_base}_k{number}.csv"
+            csv_file_path = path.join(directory, file_name)
+            query = f"SELECT {columns_str} FROM {table_name} WHERE {key_condition} AND acc_id <= {upper_acc_id}"
+            portion_start_time = time.time()
+            rows_affected = execute_export(connection, build_external_table_query(directory, file_name, query))
+            seconds = time.time() - portion_start_time
+            file_size = path.getsize(csv_file_path)
+            is_last = rows_expected < batch_size
+            new_batch_size = next_batch_size(batch_size, rows_affected, seconds, file_size, min_batch_size,
+                                             max_batch_size, target_seconds, target_file_bytes)
+            logging.info(f"Выгружено строк: {rows_affected} (acc_id <= {upper_acc_id}, порция {batch_size}) "
+                         f"за {seconds:.2f} секунд, следующая порция: {new_batch_size}.")
+
+            last_seen = int(upper_acc_id)
+            total_rows += rows_affected
+            record_rows(STAGE_HISTORICAL_EXPORT, table_name, file_name, exported=rows_affected)
+            if state:
+                state.mark_checkpoint(checkpoint_scope, number, {
+                    'file': csv_file_path, 'rows': rows_affected, 'size': file_size, 'last_acc_id': last_seen,
+                    'next_batch_size': new_batch_size, 'last': is_last})
+            if on_portion:
+                on_portion(csv_file_path)
+            number += 1
+            batch_size = new_batch_size
+            if is_last:
+                break
+
+        end_time = time.time()
+        logging.info(f"Таблица {table_name} выгружена: {total_rows} строк в {number} файлах. "
+                     f"Время выполнения: {end_time - start_time:.2f} секунд.")
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка при выгрузке данных в CSV: {e}")
+        return False
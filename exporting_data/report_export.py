@@ -1,40 +1,103 @@
-import pandas as pd
+import os
 from os import path
 from datetime import datetime
-from exporting_data.csv_export import export_data_to_csv, load_acc_ids_from_csv, merge_csv_files
-from database.queries import part_query_integrating
+import numpy as np
+from exporting_data.csv_export import write_check_rows_to_csv, merge_check_rows
+from exporting_data.integrating_cache import open_integrating_cache
+from exporting_data.integrating_lookup import export_integrating_statuses, INTEGRATING_COLUMNS
 from utils.file_utils import create_directory
+from utils.id_set import AccIdSet
 
 
-def perform_check_and_export(db_ops, db_ops_integrating, cur, check_query, check_name, report_lines):
-    """Выполняет проверку, экспортирует данные и обновляет отчет."""
+def perform_check_and_export(db_ops, config, check_query, check_name, report_lines, integrating=True):
+    """
+    Выполняет проверку, экспортирует данные и обновляет отчет.
+    Запрос проверки выполняется один раз: строки читаются порциями через курсор на стороне сервера
+    (DBOperations.stream_query) и сразу записываются в файл <проверка>.csv, количество записей и идентификаторы
+    лицевых счетов получаются за тот же проход по результату (см. write_check_result).
+    :return: Количество записей, найденных проверкой.
+    """
+    csv_file_path = check_result_path(check_name)
+    count, acc_ids = db_ops.stream_query(
+        check_query, lambda columns, row_chunks: write_check_result(columns, row_chunks, csv_file_path),
+        itersize=config['processing']['stream_itersize'])
+    return report_check_result(config, csv_file_path, count, acc_ids, check_name, report_lines,
+                               integrating=integrating)
 
+
+def check_result_path(check_name):
+    """Путь к файлу результата проверки в каталоге result_data текущей даты (каталог создается)."""
     # Создание директории для сохранения результатов
     current_date = datetime.now().strftime("%Y-%m-%d")  # Формат текущей даты
     result_directory = path.join('result_data', current_date)
     create_directory(result_directory)
+    return path.join(result_directory, f'{check_name}.csv')
+
+
+def write_check_result(columns, row_chunks, csv_file_path):
+    """
+    Запись результата проверки в CSV файл с одновременным сбором идентификаторов лицевых счетов.
+    Строки не накапливаются в памяти: из каждой порции сохраняются только идентификаторы (массив int64).
+    :return: Кортеж (количество записей, множество идентификаторов AccIdSet).
+    """
+    acc_id_index = columns.index('acc_id')
+    id_chunks = []
+
+    def collect_ids(chunks):
+        for rows in chunks:
+            id_chunks.append(np.asarray([row[acc_id_index] for row in rows if row[acc_id_index] is not None],
+                                        dtype=np.int64))
+            yield rows
+
+    count = write_check_rows_to_csv(columns, collect_ids(row_chunks), csv_file_path)
+    return count, AccIdSet.from_chunks(id_chunks)
 
-    count = db_ops.count_records(check_query)
+
+def export_check_result(config, columns, row_chunks, check_name, report_lines, integrating=True):
+    """
+    Экспортирует результат проверки, полученный порциями строк, в result_data и обновляет отчет.
+    :param columns: Имена столбцов результата (должен содержать acc_id).
+    :param row_chunks: Итератор порций строк результата.
+    :param integrating: Дополнять результат статусами интеграции (иначе в отчет выводится файл результата).
+    :return: Количество записей, найденных проверкой.
+    """
+    csv_file_path = check_result_path(check_name)
+    count, acc_ids = write_check_result(columns, row_chunks, csv_file_path)
+    return report_check_result(config, csv_file_path, count, acc_ids, check_name, report_lines,
+                               integrating=integrating)
+
+
+def report_check_result(config, csv_file_path, count, acc_ids, check_name, report_lines, integrating=True):
+    """
+    Дополняет записанный результат проверки статусами интеграции и обновляет отчет.
+    Объединение со статусами интеграции выполняется по файлу результата порциями (см. merge_check_rows).
+    Статусы интеграции запрашиваются порциями идентификаторов на подключениях из пула интеграционной базы,
+    с использованием локального кэша статусов (если он включен). Файл пустого результата удаляется.
+    :param csv_file_path: Файл результата проверки (см. write_check_result).
+    :param count: Количество записей результата.
+    :param acc_ids: Идентификаторы лицевых счетов результата (AccIdSet).
+    :param integrating: Дополнять результат статусами интеграции (иначе в отчет выводится файл результата).
+    :return: Количество записей, найденных проверкой.
+    """
+    result_directory = path.dirname(csv_file_path)
     if count > 0:
-        # Обновление путей к файлам
-        csv_file_path = path.join(result_directory, f'{check_name}.csv')
-        export_data_to_csv(cur, check_query, csv_file_path, results=True)
-
-        acc_ids = load_acc_ids_from_csv(csv_file_path, encoding='cp1251')
-
-        if acc_ids:
-            acc_ids_str = ', '.join(map(str, acc_ids))
-            query_integrating = f"""{part_query_integrating} ({acc_ids_str}) and datatype = 1) as a
-            WHERE rn = 1 
-            ORDER BY bsn_ts DESC;
-            """
+        if not integrating:
+            report_lines.append(f"{check_name.replace('_', ' ').capitalize()}:")
+            report_lines.append(f"   - Количество записей: {count}")
+            report_lines.append(f"   - Данные выгружены в '{csv_file_path}'.")
+        elif acc_ids:
             integra_csv_file = path.join(result_directory, f'{check_name}_integra.csv')
-            results = db_ops_integrating.execute_query(query_integrating)
-            results_df = pd.DataFrame(results, columns=['acc_id', 'status', 'error_txt', 'bsn_ts', 'ts'])
-            results_df.to_csv(integra_csv_file, index=False)
+            cache = open_integrating_cache(config)
+            try:
+                integrating_rows = export_integrating_statuses(
+                    config, acc_ids, integra_csv_file, batch_size=config['processing']['integrating_batch_size'],
+                    concurrency=config['processing']['integrating_concurrency'], cache=cache)
+            finally:
+                if cache:
+                    cache.close()
 
             result_csv_file = path.join(result_directory, f'{check_name}_доб_интеграция.csv')
-            merge_csv_files(csv_file_path, integra_csv_file, result_csv_file, encoding='cp1251', results=True)
+            merge_check_rows(csv_file_path, INTEGRATING_COLUMNS, integrating_rows, result_csv_file)
 
             report_lines.append(f"{check_name.replace('_', ' ').capitalize()}:")
             report_lines.append(f"   - Количество записей: {count}")
@@ -44,8 +107,10 @@ def perform_check_and_export(db_ops, db_ops_integrating, cur, check_query, check
             report_lines.append("   - Количество записей: 0")
             report_lines.append("   - Данные не выгружены.")
     else:
+        # Пустой результат не выгружается
+        os.remove(csv_file_path)
         report_lines.append(f"{check_name.replace('_', ' ').capitalize()}:")
         report_lines.append("   - Количество записей: 0")
         report_lines.append("   - Данные не выгружены.")
 
-    db_ops.insert_check_result(check_name.replace('_', ' ').capitalize(), count)
+    return count
@@ -1,55 +1,202 @@
 import logging
 import time
 from os import path, listdir
-from database.db_connection import DatabaseConnection
+from database.connection_pool import get_connection
+from database.db_schema import get_table_spec
 from .data_loader import load_csv_to_table
+from .parallel_loader import PortionLoader, reject_options
+from utils.run_manifest import STAGE_MONITORING_LOAD, STAGE_IDS_EXPORT, STAGE_IDS_LOAD, record_rows, clear_rows, \
+    row_count
 
 # Директория для импорта CSV-файлов
 temp_data_dir = 'temp_data'
 
+# Суффикс таблиц с изменениями для инкрементального режима загрузки
+DELTA_SUFFIX = '_delta'
 
-def import_data_to_monitoring(config, csv_filename, account_type):
-    """Импорт данных в базу системы мониторинга."""
-    monitoring_conn = DatabaseConnection(config['monitoring_db'])
+# Суффикс промежуточных таблиц для загрузки с последующей заменой основной таблицы
+STAGING_SUFFIX = '_staging'
+
+
+def staging_options(config):
+    """
+    Параметры загрузки через промежуточную таблицу из конфигурации обработки.
+    :return: Словарь с ключами staging и unlogged.
+    """
+    return {'staging': config['processing']['load_target'] == 'staging',
+            'unlogged': config['processing']['staging_unlogged']}
+
+
+def prepare_load_table(db_ops, table_name, staging=False, unlogged=False):
+    """
+    Подготовка таблицы для загрузки.
+    Без промежуточной таблицы таблица пересоздается вместе с индексом из описания таблицы (по acc_id). При загрузке
+    через промежуточную таблицу создается таблица <имя>_staging без индексов (нежурналируемая, если unlogged -
+    после замены она остается нежурналируемой основной таблицей), основная таблица остается доступной до замены
+    (см. publish_load_table).
+    :param db_ops: Операции с базой мониторинга.
+    :param table_name: Имя таблицы (зарегистрированной в реестре описаний таблиц или производной от нее).
+    :param staging: Загружать через промежуточную таблицу.
+    :param unlogged: Создать промежуточную таблицу нежурналируемой.
+    :return: Имя таблицы для загрузки.
+    """
+    spec = get_table_spec(table_name)
+    if staging:
+        staging_table_name = table_name + STAGING_SUFFIX
+        db_ops.create_staging_table(staging_table_name, spec.columns, unlogged=unlogged)
+        return staging_table_name
+    db_ops.drop_table(table_name)
+    db_ops.create_postgresql_table(table_name, spec.columns, spec.index_columns)
+    return table_name
+
+
+def publish_load_table(db_ops, table_name, staging=False, unlogged=False):
+    """
+    Завершение загрузки: построение индекса из описания таблицы, сбор статистики и замена таблицы промежуточной
+    таблицей. Без промежуточной таблицы ничего не выполняется.
+    """
+    if staging:
+        db_ops.swap_staging_table(table_name, table_name + STAGING_SUFFIX, get_table_spec(table_name).index_columns)
+
+
+def prepare_master_table(db_ops, account_type, delta=False, staging=False, unlogged=False):
+    """
+    Пересоздание таблицы с данными мастер-системы в базе мониторинга.
+    :param db_ops: Операции с базой мониторинга.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param delta: Пересоздать таблицу изменений (инкрементальный режим) вместо основной таблицы.
+    :param staging: Загружать через промежуточную таблицу (см. prepare_load_table).
+    :param unlogged: Создать промежуточную таблицу нежурналируемой.
+    :return: Имя таблицы для загрузки.
+    """
+    table_name = f'master_{account_type}_ils' + (DELTA_SUFFIX if delta else '')
+    return prepare_load_table(db_ops, table_name, staging=staging, unlogged=unlogged)
+
+
+def prepare_historical_table(db_ops, account_type, delta=False, staging=False, unlogged=False):
+    """
+    Пересоздание таблицы с данными исторической системы в базе мониторинга.
+    :param db_ops: Операции с базой мониторинга.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param delta: Пересоздать таблицу изменений (инкрементальный режим) вместо основной таблицы.
+    :param staging: Загружать через промежуточную таблицу (см. prepare_load_table).
+    :param unlogged: Создать промежуточную таблицу нежурналируемой.
+    :return: Имя таблицы для загрузки.
+    """
+    table_name = f'historical_{account_type}_ils' + (DELTA_SUFFIX if delta else '')
+    return prepare_load_table(db_ops, table_name, staging=staging, unlogged=unlogged)
+
+
+def prepare_historical_load(db_ops, account_type, delta=False, state=None, staging=False, unlogged=False):
+    """
+    Подготовка загрузки файлов порций исторической системы с учетом ранее загруженных файлов.
+    Таблица пересоздается, только если ни один файл еще не был загружен. При возобновлении количество строк
+    в таблице сверяется с контрольными точками: если в таблице нет ранее загруженных строк (например,
+    нежурналируемая таблица очищена после сбоя сервера), контрольные точки сбрасываются и загрузка
+    начинается заново.
+    :return: Имя таблицы, имя таблицы для загрузки, область контрольных точек и загруженные файлы.
+    """
+    table_name = f'historical_{account_type}_ils' + (DELTA_SUFFIX if delta else '')
+    load_table_name = table_name + STAGING_SUFFIX if staging else table_name
+    checkpoint_scope = f"loaded:{table_name}"
+    loaded_files = state.get_checkpoints(checkpoint_scope) if state else {}
+
+    if loaded_files and all(isinstance(info, dict) and 'rows' in info for info in loaded_files.values()):
+        expected_rows = sum(info['rows'] for info in loaded_files.values())
+        try:
+            actual_rows = db_ops.count_total_records(load_table_name)
+        except Exception as e:
+            db_ops.connection.conn.rollback()
+            logging.warning(f"Не удалось проверить таблицу {load_table_name}: {e}")
+            actual_rows = None
+        if actual_rows != expected_rows:
+            logging.warning(f"В таблице {load_table_name} {actual_rows} строк вместо {expected_rows} загруженных "
+                            f"ранее, загрузка начинается заново.")
+            state.clear_checkpoints(checkpoint_scope)
+            loaded_files = {}
+
+    if not loaded_files:
+        prepare_historical_table(db_ops, account_type, delta=delta, staging=staging, unlogged=unlogged)
+        clear_rows(STAGE_MONITORING_LOAD, table_name)
+    else:
+        logging.info(f"В таблицу {load_table_name} ранее загружено файлов: {len(loaded_files)}, "
+                     f"возобновляем загрузку.")
+    return table_name, load_table_name, checkpoint_scope, loaded_files
+
+
+def apply_historical_delta(db_ops, account_type):
+    """
+    Применение изменений из таблицы historical_<type>_ils_delta к таблице historical_<type>_ils.
+    Заменяются строки по всем измененным лицевым счетам, в том числе отсутствующим в исторической системе.
+    """
+    target_table_name = f'historical_{account_type}_ils'
+    db_ops.ensure_table(get_table_spec(target_table_name))
+    deleted, inserted = db_ops.merge_from_table(target_table_name, target_table_name + DELTA_SUFFIX,
+                                                keys_table=f'master_{account_type}_ils{DELTA_SUFFIX}')
+    logging.info(f"Изменения применены к таблице {target_table_name}: удалено {deleted}, добавлено {inserted} строк.")
+
+
+def merge_master_delta(config, account_type, delta_column):
+    """
+    Применение изменений из таблицы master_<type>_ils_delta к таблице master_<type>_ils.
+    :param config: Конфигурация подключений.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param delta_column: Столбец, по которому определяются изменения (отметка о последнем изменении).
+    :return: Новое значение отметки (максимальное значение delta_column среди изменений) или None.
+    """
+    start_time = time.time()
+    monitoring_conn = get_connection(config, 'monitoring_db')
     logging.info("Подключение к целевой системе мониторинга установлено.")
 
     from database.db_operations import DBOperations
     db_ops = DBOperations(monitoring_conn, db_type=config['monitoring_db']['type'])
-    start_time = time.time()
-
-    columns = {
-        'opening': {
-            'snils': 'VARCHAR(14)',
-            'acc_id': 'BIGINT',
-            'opening_date': 'DATE',
-            'opening_region': 'VARCHAR(6)',
-            'registration_reason': 'TEXT',
-        },
-        'closing': {
-            'snils': 'VARCHAR(14)',
-            'acc_id': 'BIGINT',
-            'death_date': 'DATE',
-            'closing_region': 'VARCHAR(6)',
-            'closing_reason': 'TEXT',
-        }
-    }
 
     table_name = f'master_{account_type}_ils'
-    db_ops.drop_table(table_name)
-    db_ops.create_postgresql_table(table_name, columns[account_type], ['acc_id'])
+    delta_table_name = table_name + DELTA_SUFFIX
+    with monitoring_conn:
+        db_ops.ensure_table(get_table_spec(table_name))
+        deleted, inserted = db_ops.merge_from_table(table_name, delta_table_name)
+        watermark = db_ops.execute_query(f"SELECT MAX({delta_column}) FROM {delta_table_name};")[0][0]
+
+    end_time = time.time()
+    logging.info(
+        f"Изменения по {account_type} применены к таблице {table_name}: заменено {deleted}, добавлено {inserted} "
+        f"строк. Время выполнения: {end_time - start_time:.2f} секунд.")
+    return str(watermark) if watermark is not None else None
+
+
+def import_data_to_monitoring(config, csv_filename, account_type, delta=False):
+    """
+    Импорт данных в базу системы мониторинга.
+    В инкрементальном режиме (delta=True) данные загружаются в таблицу изменений master_<type>_ils_delta.
+    """
+    monitoring_conn = get_connection(config, 'monitoring_db')
+    logging.info("Подключение к целевой системе мониторинга установлено.")
+
+    from database.db_operations import DBOperations
+    db_ops = DBOperations(monitoring_conn, db_type=config['monitoring_db']['type'])
+    start_time = time.time()
+
+    table_name = f'master_{account_type}_ils' + (DELTA_SUFFIX if delta else '')
+    staging = staging_options(config)
 
     # Обновленный путь к CSV-файлу
     csv_file_path = path.join(temp_data_dir, csv_filename)
 
     with monitoring_conn:
+        load_table_name = prepare_master_table(db_ops, account_type, delta=delta, **staging)
         with monitoring_conn.get_cursor() as cur:
-            import_result = load_csv_to_table(cur, csv_file_path, table_name)
+            import_result = load_csv_to_table(cur, csv_file_path, load_table_name)
+            rows_loaded = cur.rowcount
 
         if import_result:
             monitoring_conn.commit()
+            record_rows(STAGE_MONITORING_LOAD, table_name, loaded=rows_loaded)
+            publish_load_table(db_ops, table_name, **staging)
             end_time = time.time()
             logging.info(
-                f"Импорт данных по {account_type} завершен. Время выполнения: {end_time - start_time:.2f} секунд.")
+                f"Импорт данных по {account_type} завершен ({rows_loaded} строк). "
+                f"Время выполнения: {end_time - start_time:.2f} секунд.")
             return True
         else:
             end_time = time.time()
@@ -58,10 +205,14 @@ def import_data_to_monitoring(config, csv_filename, account_type):
             return False
 
 
-def import_data_to_historical(config, cur_dir_path):
-    """Загрузка идентификаторов в историческую систему."""
+def import_data_to_historical(config, cur_dir_path, account_types=('opening', 'closing')):
+    """
+    Загрузка идентификаторов в историческую систему.
+    Количество загруженных строк (rowcount команды INSERT) записывается в журнал запуска и сверяется с количеством
+    выгруженных идентификаторов.
+    """
     start_time = time.time()
-    historical_conn = DatabaseConnection(config['historical_db'])
+    historical_conn = get_connection(config, 'historical_db')
     logging.info("Подключение к базе исторической системы установлено.")
 
     from database.db_operations import DBOperations
@@ -70,17 +221,23 @@ def import_data_to_historical(config, cur_dir_path):
 
     with historical_conn:
         with historical_conn.get_cursor() as cur:
-            for account_type in ['opening', 'closing']:
+            for account_type in account_types:
                 table_ids = f'{prefix_table_name}_ids_{account_type}_ils'
                 csv_external_ids = path.join(cur_dir_path, temp_data_dir, f'ids_{account_type}_ils.csv')  # Обновленный путь
                 db_historical_ops.drop_table(table_ids)
-                db_historical_ops.create_netezza_table(table_ids, {'acc_id': 'BIGINT'}, 'acc_id')
-                import_result = db_historical_ops.insert_to_netezza_from_select_external_csv(table_ids,
-                                                                                             csv_external_ids)
+                db_historical_ops.ensure_table(get_table_spec(table_ids))
+                rows_loaded = db_historical_ops.insert_to_netezza_from_select_external_csv(table_ids,
+                                                                                           csv_external_ids)
 
-                if not import_result:
+                if rows_loaded is None:
                     logging.error(f"Не удалось загрузить идентификаторы для {account_type} в историческую систему.")
                     return False
+                record_rows(STAGE_IDS_LOAD, table_ids, loaded=rows_loaded)
+                rows_exported = row_count(STAGE_IDS_EXPORT, f'ids_{account_type}_ils', 'exported')
+                if rows_exported is not None and rows_loaded != rows_exported:
+                    logging.error(f"Количество идентификаторов для {account_type} не совпадает: выгружено "
+                                  f"{rows_exported}, загружено в таблицу {table_ids} {rows_loaded}.")
+                    return False
 
     end_time = time.time()
     logging.info(
@@ -88,46 +245,59 @@ def import_data_to_historical(config, cur_dir_path):
     return True
 
 
-def import_data_from_historical_to_monitoring(config, cur_dir_path):
-    """Загрузка в систему мониторинга, данных полученных из исторической системы."""
+def import_data_from_historical_to_monitoring(config, cur_dir_path, account_types=('opening', 'closing'), delta=False,
+                                              state=None):
+    """
+    Загрузка в систему мониторинга, данных полученных из исторической системы.
+    Файлы порций загружаются параллельно несколькими подключениями (processing.loader_workers).
+    В режиме фиксации 'final' транзакции загрузчиков фиксируются после загрузки всех файлов (каждый загрузчик
+    фиксирует свою транзакцию отдельно, см. PortionLoader), в режиме 'per_file' (по умолчанию) каждый загруженный
+    файл фиксируется отдельной транзакцией и отмечается в состоянии обработки, поэтому при возобновлении
+    загружаются только оставшиеся файлы.
+    В инкрементальном режиме (delta=True) данные загружаются в таблицу historical_<type>_ils_delta,
+    после чего в таблице historical_<type>_ils заменяются строки по измененным лицевым счетам.
+    При загрузке через промежуточную таблицу (processing.load_target = staging) таблица заменяется
+    только после загрузки всех файлов.
+    """
     start_time = time.time()
-    monitoring_conn = DatabaseConnection(config['monitoring_db'])
+    monitoring_conn = get_connection(config, 'monitoring_db')
     logging.info("Подключение к целевой системе мониторинга установлено.")
 
     from database.db_operations import DBOperations
     db_ops = DBOperations(monitoring_conn, db_type=config['monitoring_db']['type'])
 
+    staging = staging_options(config)
     with monitoring_conn:
-        with monitoring_conn.get_cursor() as cur:
-            for account_type in ['opening', 'closing']:
-                directory_csv_portions = path.join(cur_dir_path, temp_data_dir,
-                                                   f"vlg_mic_historical_{account_type}_ils")
-                csv_files_portions = [f for f in listdir(directory_csv_portions) if f.endswith('.csv')]
-
-                columns = {
-                    'opening': {
-                        'acc_id': 'BIGINT',
-                        'acc_sts': 'INT',
-                        'opening_region': 'VARCHAR(6)',
-                    },
-                    'closing': {
-                        'acc_id': 'BIGINT',
-                        'acc_sts': 'INT',
-                        'death_date': 'DATE',
-                        'closing_region': 'VARCHAR(6)',
-                    }
-                }
-
-                table_name = f'historical_{account_type}_ils'
-                db_ops.drop_table(table_name)
-                db_ops.create_postgresql_table(table_name, columns[account_type], ['acc_id'])
+        for account_type in account_types:
+            directory_csv_portions = path.join(cur_dir_path, temp_data_dir, f"vlg_mic_historical_{account_type}_ils")
+            csv_files_portions = sorted(f for f in listdir(directory_csv_portions) if f.endswith('.csv'))
 
+            table_name, load_table_name, checkpoint_scope, loaded_files = prepare_historical_load(
+                db_ops, account_type, delta=delta, state=state, **staging)
+
+            loader = PortionLoader(config, load_table_name, workers=config['processing']['loader_workers'],
+                                   queue_size=config['processing']['loader_queue_size'], delete_loaded=False,
+                                   commit_mode=config['processing']['loader_commit_mode'], state=state,
+                                   checkpoint_scope=checkpoint_scope, manifest_table=table_name,
+                                   **reject_options(config)).start()
+            try:
                 for csv_file in csv_files_portions:
-                    csv_file_path = path.join(directory_csv_portions, csv_file)
-                    load_csv_to_table(cur, csv_file_path, table_name)
+                    if csv_file not in loaded_files:
+                        loader.submit(path.join(directory_csv_portions, csv_file))
+            except RuntimeError as e:
+                logging.error(e)
+            finally:
+                load_result = loader.finish()
+
+            if not load_result:
+                logging.error(f"Не удалось загрузить файлы порций в таблицу {table_name}.")
+                return False
+            loader.log_report()
+            publish_load_table(db_ops, table_name, **staging)
+            logging.info(f"Загружены данные в базу мониторинга в таблицу - {table_name}")
 
-                monitoring_conn.commit()
-                logging.info(f"Загружены данные в базу мониторинга в таблицу - {table_name}")
+            if delta:
+                apply_historical_delta(db_ops, account_type)
 
     end_time = time.time()
     logging.info(f"Время выполнения: {end_time - start_time:.2f} секунд.")
@@ -1,20 +1,136 @@
+import io
+import locale
 import logging
-from database.db_schema import create_netezza_table
+import os
+from database.db_schema import create_netezza_table, get_table_spec
+
+# Количество строк в части файла при загрузке с отбраковкой ошибочных строк
+TOLERANT_CHUNK_ROWS = 50000
+
+
+def copy_query_for(table_name):
+    """
+    Запрос COPY ... FROM STDIN для загрузки CSV-файла в таблицу.
+    Для таблиц из реестра описаний таблиц столбцы перечисляются явно.
+    """
+    try:
+        return get_table_spec(table_name).copy_from_stdin_query(table_name)
+    except KeyError:
+        return f"COPY public.{table_name} FROM STDIN WITH CSV DELIMITER ';'"
+
+
+def copy_csv_to_table(cur, csv_filename, table_name):
+    """
+    Загрузка данных из CSV файла в таблицу (ошибки передаются вызывающей стороне).
+    :return: Количество загруженных строк.
+    """
+    with open(csv_filename, 'r') as f:
+        next(f)  # Пропустить заголовок
+        cur.copy_expert(copy_query_for(table_name), f)
+    logging.info(f"Данные из {csv_filename} загружены в таблицу {table_name}.")
+    return cur.rowcount
 
 
 def load_csv_to_table(cur, csv_filename, table_name):
     """Загрузка данных из CSV файла в таблицу."""
     try:
-        with open(csv_filename, 'r') as f:
-            next(f)  # Пропустить заголовок
-            cur.copy_expert(f"COPY public.{table_name} FROM STDIN WITH CSV DELIMITER ';'", f)
-        logging.info(f"Данные из {csv_filename} загружены в таблицу {table_name}.")
+        copy_csv_to_table(cur, csv_filename, table_name)
         return True
     except Exception as e:
         logging.error(f"Ошибка при загрузке данных из CSV: {e}")
         return False  # Возвращаем False при ошибке
 
 
+class TooManyRejectedRows(Exception):
+    """Количество отбракованных строк превысило допустимое."""
+
+
+def load_csv_to_table_tolerant(cur, csv_filename, table_name, rejects_filename, chunk_rows=TOLERANT_CHUNK_ROWS,
+                               max_rejected=None):
+    """
+    Загрузка данных из CSV файла в таблицу с отбраковкой ошибочных строк.
+    Файл загружается частями по chunk_rows строк, каждая часть - отдельной командой COPY внутри точки сохранения.
+    Часть, загрузка которой завершилась ошибкой, откатывается до точки сохранения и делится пополам до тех пор,
+    пока ошибочные строки не будут найдены. Ошибочные строки записываются в файл отбраковки вместе с номером строки
+    и текстом ошибки, остальные строки загружаются. Строки данных не должны содержать переводов строк внутри полей.
+    :param cur: Курсор для выполнения SQL-запросов.
+    :param csv_filename: Имя CSV-файла.
+    :param table_name: Имя таблицы, в которую будут загружены данные.
+    :param rejects_filename: Имя файла для отбракованных строк (создается только при наличии ошибок).
+    :param chunk_rows: Количество строк в части файла.
+    :param max_rejected: Максимальное количество отбракованных строк (None - без ограничения). При превышении
+        вызывается исключение TooManyRejectedRows, транзакция не откатывается.
+    :return: Кортеж (количество загруженных строк, количество отбракованных строк).
+    """
+    copy_query = copy_query_for(table_name)
+    encoding = locale.getpreferredencoding(False)
+    counts = {'loaded': 0, 'rejected': 0}
+    rejects_file = None
+
+    def reject(line_number, raw_line, error):
+        nonlocal rejects_file
+        if rejects_file is None:
+            rejects_file = open(rejects_filename, 'wb')
+        message = str(error).strip().replace('\n', ' ')
+        prefix = f"{line_number}\t{message}\t".encode(encoding, errors='replace')
+        rejects_file.write(prefix + raw_line.rstrip(b'\r\n') + b'\n')
+        counts['rejected'] += 1
+        if max_rejected is not None and counts['rejected'] > max_rejected:
+            raise TooManyRejectedRows(f"В файле {csv_filename} отбраковано более {max_rejected} строк.")
+
+    def copy_lines(lines):
+        """Загрузка строк [(номер, исходная строка, текст)] с делением пополам при ошибке."""
+        cur.execute("SAVEPOINT tolerant_copy")
+        try:
+            cur.copy_expert(copy_query, io.StringIO(''.join(text for _, _, text in lines)))
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT tolerant_copy")
+            cur.execute("RELEASE SAVEPOINT tolerant_copy")
+            if len(lines) == 1:
+                reject(lines[0][0], lines[0][1], e)
+                return
+            middle = len(lines) // 2
+            copy_lines(lines[:middle])
+            copy_lines(lines[middle:])
+            return
+        cur.execute("RELEASE SAVEPOINT tolerant_copy")
+        counts['loaded'] += len(lines)
+
+    try:
+        with open(csv_filename, 'rb') as f:
+            next(f, None)  # Пропустить заголовок
+            chunk = []
+            for line_number, raw_line in enumerate(f, start=2):
+                try:
+                    text = raw_line.decode(encoding)
+                except UnicodeDecodeError as e:
+                    reject(line_number, raw_line, e)
+                    continue
+                if not text.endswith('\n'):
+                    text += '\n'
+                chunk.append((line_number, raw_line, text))
+                if len(chunk) >= chunk_rows:
+                    copy_lines(chunk)
+                    chunk = []
+            if chunk:
+                copy_lines(chunk)
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+
+    if counts['rejected']:
+        logging.warning(f"Данные из {csv_filename} загружены в таблицу {table_name}: загружено строк - "
+                        f"{counts['loaded']}, отбраковано - {counts['rejected']} (см. {rejects_filename}).")
+    else:
+        logging.info(f"Данные из {csv_filename} загружены в таблицу {table_name}: {counts['loaded']} строк.")
+    return counts['loaded'], counts['rejected']
+
+
+def rejects_file_path(rejects_dir, csv_filename):
+    """Путь к файлу отбракованных строк для CSV-файла."""
+    return os.path.join(rejects_dir, os.path.basename(csv_filename) + '.rejects')
+
+
 def load_data_from_csv(cur, csv_filename, table_name):
     """
     Загрузка данных из CSV-файла в таблицу базы данных.
@@ -0,0 +1,57 @@
+import logging
+import time
+from database.connection_pool import get_connection
+from exporting_data.csv_export import export_data_from_historical
+from .csv_import import prepare_historical_load, publish_load_table, apply_historical_delta, staging_options
+from .parallel_loader import PortionLoader, reject_options
+
+
+def transfer_historical_to_monitoring(config, cur_dir_path, account_type, delta=False, state=None):
+    """
+    Выгрузка данных из исторической системы с одновременной загрузкой порций в базу мониторинга.
+    Каждая выгруженная порция сразу передается пулу загрузчиков через ограниченную очередь,
+    после фиксации загрузки файл порции удаляется.
+    :param config: Конфигурация подключений.
+    :param cur_dir_path: Текущая директория.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param delta: Инкрементальный режим: порции загружаются в таблицу historical_<type>_ils_delta.
+    :param state: Состояние обработки для сохранения контрольных точек (необязательно).
+    :return: True при успешной выгрузке и загрузке, иначе False.
+    """
+    start_time = time.time()
+    monitoring_conn = get_connection(config, 'monitoring_db')
+    logging.info("Подключение к целевой системе мониторинга установлено.")
+
+    from database.db_operations import DBOperations
+    db_ops = DBOperations(monitoring_conn, db_type=config['monitoring_db']['type'])
+
+    staging = staging_options(config)
+    with monitoring_conn:
+        # Таблица пересоздается, только если ни один файл еще не был загружен
+        table_name, load_table_name, checkpoint_scope, consumed_files = prepare_historical_load(
+            db_ops, account_type, delta=delta, state=state, **staging)
+
+        loader = PortionLoader(config, load_table_name, workers=config['processing']['loader_workers'],
+                               queue_size=config['processing']['loader_queue_size'], state=state,
+                               checkpoint_scope=checkpoint_scope, manifest_table=table_name,
+                               **reject_options(config)).start()
+        try:
+            export_result = export_data_from_historical(config, cur_dir_path, [account_type], state,
+                                                        on_portion=loader.submit, consumed_files=consumed_files)
+        finally:
+            load_result = loader.finish()
+
+        if not (export_result and load_result):
+            logging.error(f"Не удалось выгрузить и загрузить данные исторической системы по {account_type}.")
+            return False
+
+        publish_load_table(db_ops, table_name, **staging)
+        if delta:
+            apply_historical_delta(db_ops, account_type)
+
+    end_time = time.time()
+    rows_loaded = sum(item['rows'] for item in loader.stats)
+    logging.info(
+        f"Данные исторической системы по {account_type} загружены в таблицу {table_name}: {rows_loaded} строк "
+        f"из {len(loader.stats)} файлов. Время выполнения: {end_time - start_time:.2f} секунд.")
+    return True
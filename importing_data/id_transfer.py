@@ -0,0 +1,111 @@
+import logging
+import os
+import queue
+import threading
+import time
+from os import path
+from database.connection_pool import get_connection
+from database.db_schema import get_table_spec
+from utils.file_utils import clear_directory, create_directory
+from utils.stream_pipe import ChunkedFileWriter
+from utils.run_manifest import STAGE_IDS_EXPORT, STAGE_IDS_LOAD, record_rows
+from .csv_import import temp_data_dir, DELTA_SUFFIX
+
+
+def transfer_ids_to_historical(config, cur_dir_path, account_type, delta=False):
+    """
+    Передача идентификаторов лицевых счетов из базы мониторинга в историческую систему за один проход.
+    Идентификаторы выгружаются командой COPY (SELECT DISTINCT acc_id ...) TO STDOUT и записываются частями
+    по ids_chunk_rows строк; каждая заполненная часть сразу загружается в Netezza через внешнюю таблицу
+    (INSERT ... SELECT FROM EXTERNAL), пока выгрузка продолжается, и удаляется после загрузки. Идентификаторы
+    не загружаются в память. Количество выгруженных строк и сумма rowcount команд INSERT по частям записываются
+    в журнал запуска и сверяются между собой (без запроса COUNT(*) к Netezza).
+    :param config: Конфигурация подключений.
+    :param cur_dir_path: Текущая директория.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param delta: Инкрементальный режим: передаются идентификаторы из таблицы master_<type>_ils_delta.
+    :return: True при успешной передаче и совпадении количества выгруженных и загруженных строк, иначе False.
+    """
+    start_time = time.time()
+    monitoring_conn = get_connection(config, 'monitoring_db')
+    logging.info("Подключение к целевой системе мониторинга установлено.")
+    historical_conn = get_connection(config, 'historical_db')
+    logging.info("Подключение к базе исторической системы установлено.")
+
+    from database.db_operations import DBOperations
+    db_historical_ops = DBOperations(historical_conn, db_type=config['historical_db']['type'])
+
+    source_table = f'master_{account_type}_ils' + (DELTA_SUFFIX if delta else '')
+    table_ids = f'vlg_mic_ids_{account_type}_ils'
+    directory = path.join(cur_dir_path, temp_data_dir, f'ids_{account_type}_ils')
+    create_directory(directory)
+    clear_directory(directory)
+
+    chunks = queue.Queue(maxsize=config['processing']['loader_queue_size'])
+    loader_errors = []
+    loaded_rows = []
+
+    def loader():
+        """Загрузка заполненных частей файла в Netezza."""
+        while True:
+            chunk_path = chunks.get()
+            if chunk_path is None:
+                break
+            if loader_errors:
+                continue
+            rows_loaded = db_historical_ops.insert_to_netezza_from_select_external_csv(table_ids, chunk_path)
+            if rows_loaded is not None:
+                loaded_rows.append(rows_loaded)
+                os.remove(chunk_path)
+            else:
+                loader_errors.append(f"не удалось загрузить файл {chunk_path}")
+
+    def on_chunk(chunk_path, rows):
+        """Передача заполненной части загрузчику (ожидает освобождения места в очереди)."""
+        while True:
+            if loader_errors:
+                raise RuntimeError(f"Загрузка в таблицу {table_ids} прервана: {loader_errors[0]}")
+            try:
+                chunks.put(chunk_path, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    with monitoring_conn, historical_conn:
+        db_historical_ops.drop_table(table_ids)
+        db_historical_ops.ensure_table(get_table_spec(table_ids))
+
+        writer = ChunkedFileWriter(directory, f'ids_{account_type}_ils', config['processing']['ids_chunk_rows'],
+                                   on_chunk)
+        loader_thread = threading.Thread(target=loader, name=f'ids-loader-{account_type}', daemon=True)
+        loader_thread.start()
+        try:
+            with monitoring_conn.get_cursor() as cur:
+                cur.copy_expert(f"COPY (SELECT DISTINCT acc_id FROM {source_table}) TO STDOUT", writer)
+            writer.close()
+        except Exception as e:
+            loader_errors.append(str(e))
+            monitoring_conn.conn.rollback()
+        finally:
+            chunks.put(None)
+            loader_thread.join()
+
+        if loader_errors:
+            logging.error(f"Не удалось передать идентификаторы для {account_type} в историческую систему: "
+                          f"{loader_errors[0]}")
+            return False
+
+        # Сверка количества выгруженных и загруженных идентификаторов
+        rows_loaded = sum(loaded_rows)
+        record_rows(STAGE_IDS_EXPORT, f'ids_{account_type}_ils', exported=writer.rows_written)
+        record_rows(STAGE_IDS_LOAD, table_ids, loaded=rows_loaded)
+        if rows_loaded != writer.rows_written:
+            logging.error(f"Количество идентификаторов для {account_type} не совпадает: выгружено "
+                          f"{writer.rows_written}, загружено в таблицу {table_ids} {rows_loaded}.")
+            return False
+
+    end_time = time.time()
+    logging.info(
+        f"Идентификаторы для {account_type} переданы в таблицу {table_ids}: {writer.rows_written} строк из "
+        f"{writer.files_written} частей. Время выполнения: {end_time - start_time:.2f} секунд.")
+    return True
@@ -0,0 +1,240 @@
+import logging
+import os
+import queue
+import threading
+import time
+from database.connection_pool import get_connection
+from utils.file_utils import create_directory
+from utils.run_manifest import STAGE_MONITORING_LOAD, record_rows
+from .data_loader import copy_csv_to_table, load_csv_to_table_tolerant, rejects_file_path
+
+
+class PortionLoader:
+    """
+    Пул загрузчиков файлов порций в таблицу базы мониторинга.
+    Файлы передаются через ограниченную очередь, каждый загрузчик использует свое подключение и загружает файл
+    командой COPY. Пока очередь заполнена, передающая сторона ожидает, поэтому количество незагруженных файлов
+    на диске ограничено.
+    Режимы фиксации: 'per_file' - транзакция фиксируется после каждого файла, 'final' - транзакции загрузчиков
+    фиксируются после загрузки всех файлов, если ни один файл не завершился ошибкой (иначе откатываются).
+    В режиме 'final' каждый загрузчик фиксирует свою транзакцию отдельно, поэтому при ошибке фиксации одного
+    загрузчика файлы остальных остаются загруженными: загрузка завершается с ошибкой, контрольные точки
+    сохраняются только для зафиксированных файлов, и при возобновлении загружаются оставшиеся файлы.
+    Если задан каталог отбраковки (rejects_dir), ошибочные строки не прерывают загрузку, а записываются в файл
+    отбраковки (см. load_csv_to_table_tolerant).
+    """
+
+    def __init__(self, config, table_name, workers=2, queue_size=4, delete_loaded=True, commit_mode='per_file',
+                 state=None, checkpoint_scope=None, rejects_dir=None, max_rejected=None, manifest_table=None):
+        """
+        :param config: Конфигурация подключений.
+        :param table_name: Имя таблицы для загрузки.
+        :param workers: Количество загрузчиков (подключений к базе мониторинга).
+        :param queue_size: Максимальное количество файлов, ожидающих загрузки.
+        :param delete_loaded: Удалять файл после фиксации загрузки.
+        :param commit_mode: Режим фиксации транзакций: 'per_file' или 'final'.
+        :param state: Состояние обработки для сохранения контрольных точек по загруженным файлам (необязательно).
+        :param checkpoint_scope: Область контрольных точек загруженных файлов в состоянии обработки.
+        :param rejects_dir: Каталог файлов отбракованных строк (None - ошибка в строке прерывает загрузку).
+        :param max_rejected: Максимальное количество отбракованных строк в одном файле (None - без ограничения).
+        :param manifest_table: Имя таблицы в журнале запуска (по умолчанию table_name, для промежуточной таблицы -
+            имя основной таблицы).
+        """
+        if commit_mode not in ('per_file', 'final'):
+            raise ValueError(f"Неподдерживаемый режим фиксации: {commit_mode}. Используйте 'per_file' или 'final'.")
+        self.config = config
+        self.table_name = table_name
+        self.workers = workers
+        self.delete_loaded = delete_loaded
+        self.commit_mode = commit_mode
+        self.state = state
+        self.checkpoint_scope = checkpoint_scope
+        self.rejects_dir = rejects_dir
+        self.max_rejected = max_rejected
+        self.manifest_table = manifest_table or table_name
+        self.stats = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._errors = []
+        self._lock = threading.Lock()
+        self._barrier = threading.Barrier(workers + 1)
+        self._start_time = None
+
+    def start(self):
+        """Запуск загрузчиков."""
+        self._start_time = time.time()
+        if self.rejects_dir:
+            create_directory(self.rejects_dir)
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'portion-loader-{number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, csv_file_path):
+        """
+        Передача файла на загрузку. Ожидает освобождения места в очереди.
+        Если один из загрузчиков завершился с ошибкой, вызывает исключение, чтобы остановить выгрузку.
+        """
+        while True:
+            if self._errors:
+                raise RuntimeError(f"Загрузка в таблицу {self.table_name} прервана: {self._errors[0]}")
+            try:
+                self._queue.put(csv_file_path, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self):
+        """
+        Ожидание загрузки всех переданных файлов и остановка загрузчиков.
+        В режиме 'final' транзакции загрузчиков фиксируются только при отсутствии ошибок загрузки (ошибка
+        фиксации одного из загрузчиков не откатывает уже зафиксированные транзакции остальных).
+        :return: True, если все файлы загружены успешно, иначе False.
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        if self.commit_mode == 'final':
+            # Ожидание завершения загрузки всеми загрузчиками перед фиксацией
+            self._barrier.wait()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        return not self._errors
+
+    def log_report(self):
+        """Вывод в лог скорости загрузки по файлам и итогов загрузки."""
+        total_rows = total_rejected = 0
+        for item in sorted(self.stats, key=lambda item: item['file']):
+            total_rows += item['rows']
+            total_rejected += item['rejected']
+            rejected = f", отбраковано {item['rejected']}" if item['rejected'] else ''
+            logging.info(f"  {item['file']}: {item['rows']} строк за {item['seconds']:.2f} секунд "
+                         f"({item['rows'] / item['seconds'] if item['seconds'] > 0 else 0:.0f} строк/с){rejected}")
+        elapsed = time.time() - self._start_time if self._start_time else 0
+        logging.info(f"Загружено в таблицу {self.table_name}: {total_rows} строк из {len(self.stats)} файлов "
+                     f"за {elapsed:.2f} секунд ({total_rows / elapsed if elapsed > 0 else 0:.0f} строк/с, "
+                     f"загрузчиков: {self.workers}).")
+        if total_rejected:
+            logging.warning(f"Отбраковано строк при загрузке в таблицу {self.table_name}: {total_rejected} "
+                            f"(файлы отбраковки в каталоге {self.rejects_dir}).")
+
+    def _fail(self, error):
+        with self._lock:
+            self._errors.append(error)
+
+    def _worker(self):
+        """Загрузчик: получает файлы из очереди и загружает их в таблицу."""
+        connection = None
+        loaded_files = []
+        try:
+            connection = get_connection(self.config, 'monitoring_db')
+        except Exception as e:
+            self._fail(e)
+
+        try:
+            if connection is None:
+                self._drain()
+                return
+            while True:
+                csv_file_path = self._queue.get()
+                if csv_file_path is None:
+                    break
+                if self._errors:
+                    continue
+                try:
+                    loaded_files.append((csv_file_path, *self._load_file(connection, csv_file_path)))
+                except Exception as e:
+                    logging.error(f"Ошибка при загрузке файла {csv_file_path} в таблицу {self.table_name}: {e}")
+                    connection.conn.rollback()
+                    self._fail(e)
+        finally:
+            if self.commit_mode == 'final':
+                self._finalize(connection, loaded_files)
+            if connection is not None:
+                connection.close()
+
+    def _load_file(self, connection, csv_file_path):
+        """
+        Загрузка одного файла. В режиме 'per_file' загрузка повторяется по политике 'copy' при ошибках соединения
+        (незафиксированные строки откатываются), транзакция фиксируется без повторов, после фиксации сохраняется
+        контрольная точка. Если соединение оборвалось во время фиксации, контрольная точка не сохраняется, а при
+        возобновлении количество строк в таблице не совпадет с контрольными точками и загрузка начнется заново
+        (см. prepare_historical_load), поэтому строки файла не загружаются дважды.
+        :return: Кортеж (количество загруженных строк, количество отбракованных строк).
+        """
+        start_time = time.time()
+
+        def copy(cur):
+            if self.rejects_dir:
+                counts = load_csv_to_table_tolerant(
+                    cur, csv_file_path, self.table_name, rejects_file_path(self.rejects_dir, csv_file_path),
+                    max_rejected=self.max_rejected)
+            else:
+                counts = copy_csv_to_table(cur, csv_file_path, self.table_name), 0
+            return counts
+
+        if self.commit_mode == 'per_file':
+            rows_loaded, rows_rejected = connection.run_with_retry(copy, policy='copy')
+            connection.commit()
+            self._file_committed(csv_file_path, rows_loaded, rows_rejected)
+        else:
+            # Транзакция фиксируется после загрузки всех файлов, поэтому загрузка не повторяется
+            with connection.get_cursor() as cur:
+                rows_loaded, rows_rejected = copy(cur)
+        seconds = time.time() - start_time
+        file_name = os.path.basename(csv_file_path)
+        with self._lock:
+            self.stats.append({'file': file_name, 'rows': rows_loaded, 'rejected': rows_rejected, 'seconds': seconds})
+        logging.info(f"Файл {file_name} загружен в таблицу {self.table_name}: {rows_loaded} строк за "
+                     f"{seconds:.2f} секунд ({rows_loaded / seconds if seconds > 0 else 0:.0f} строк/с).")
+        return rows_loaded, rows_rejected
+
+    def _file_committed(self, csv_file_path, rows_loaded, rows_rejected=0):
+        """
+        Сохранение контрольной точки и количества строк в журнале запуска, удаление файла после фиксации его
+        загрузки.
+        """
+        record_rows(STAGE_MONITORING_LOAD, self.manifest_table, os.path.basename(csv_file_path), loaded=rows_loaded,
+                    rejected=rows_rejected)
+        if self.state:
+            self.state.mark_checkpoint(self.checkpoint_scope, os.path.basename(csv_file_path),
+                                       {'size': os.path.getsize(csv_file_path), 'rows': rows_loaded})
+        if self.delete_loaded:
+            os.remove(csv_file_path)
+
+    def _finalize(self, connection, loaded_files):
+        """
+        Фиксация или откат транзакции загрузчика после загрузки всех файлов (режим 'final').
+        Контрольные точки сохраняются только для файлов, транзакция которых зафиксирована.
+        """
+        self._barrier.wait()
+        if connection is None:
+            return
+        try:
+            if self._errors:
+                connection.conn.rollback()
+                return
+            connection.commit()
+            for csv_file_path, rows_loaded, rows_rejected in loaded_files:
+                self._file_committed(csv_file_path, rows_loaded, rows_rejected)
+        except Exception as e:
+            logging.error(f"Ошибка при фиксации загрузки в таблицу {self.table_name}: {e}")
+            self._fail(e)
+
+    def _drain(self):
+        """Освобождение очереди до сигнала завершения, чтобы не блокировать передающую сторону."""
+        while self._queue.get() is not None:
+            pass
+
+
+def reject_options(config):
+    """
+    Параметры отбраковки ошибочных строк для PortionLoader из конфигурации обработки.
+    :return: Словарь с ключами rejects_dir и max_rejected.
+    """
+    processing = config['processing']
+    if processing['loader_on_error'] != 'reject':
+        return {'rejects_dir': None, 'max_rejected': None}
+    return {'rejects_dir': processing['loader_rejects_dir'],
+            'max_rejected': processing['loader_max_rejected'] or None}
@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from database.connection_pool import get_connection
+from exporting_data.csv_export import build_master_query
+from utils.stream_pipe import BoundedPipe
+from database.db_schema import get_table_spec
+from utils.run_manifest import STAGE_MONITORING_LOAD, record_rows
+from .csv_import import prepare_master_table, publish_load_table, staging_options, DELTA_SUFFIX
+
+
+def stream_copy(source_cur, copy_out_query, target_cur, copy_in_query, chunk_size=1024 * 1024, max_chunks=16):
+    """
+    Потоковая передача данных между двумя базами PostgreSQL без промежуточного файла.
+    Выгрузка (COPY ... TO STDOUT) выполняется в отдельном потоке, загрузка (COPY ... FROM STDIN) - в текущем,
+    данные передаются через ограниченный канал в памяти.
+    :param source_cur: Курсор базы-источника.
+    :param copy_out_query: Запрос COPY ... TO STDOUT.
+    :param target_cur: Курсор базы-приемника.
+    :param copy_in_query: Запрос COPY ... FROM STDIN.
+    :param chunk_size: Размер блока данных канала (в байтах).
+    :param max_chunks: Максимальное количество блоков в канале.
+    :return: Количество переданных байтов.
+    """
+    pipe = BoundedPipe(chunk_size=chunk_size, max_chunks=max_chunks)
+    writer_errors = []
+
+    def writer():
+        try:
+            source_cur.copy_expert(copy_out_query, pipe)
+            pipe.close_writer()
+        except Exception as e:
+            writer_errors.append(e)
+            pipe.close_writer(error=e)
+
+    writer_thread = threading.Thread(target=writer, name='copy-out-writer', daemon=True)
+    writer_thread.start()
+    try:
+        target_cur.copy_expert(copy_in_query, pipe)
+    except Exception:
+        pipe.abort()
+        raise
+    finally:
+        writer_thread.join()
+
+    if writer_errors:
+        raise writer_errors[0]
+    return pipe.bytes_transferred
+
+
+def transfer_master_to_monitoring(config, account_type, binary=False, delta=False, delta_column=None, watermark=None):
+    """
+    Потоковая передача данных из мастер-системы в базу мониторинга без записи CSV-файла в temp_data.
+    :param config: Конфигурация подключений.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param binary: Использовать бинарный формат COPY (FORMAT binary) вместо CSV.
+        Типы столбцов запроса мастер-системы должны совпадать с типами столбцов таблицы мониторинга.
+    :param delta: Инкрементальный режим: данные передаются в таблицу изменений master_<type>_ils_delta.
+    :param delta_column: Столбец с отметкой о последнем изменении.
+    :param watermark: Значение отметки предыдущего запуска.
+    :return: True при успешной передаче, иначе False.
+    """
+    start_time = time.time()
+    monitoring_conn = get_connection(config, 'monitoring_db')
+    logging.info("Подключение к целевой системе мониторинга установлено.")
+
+    from database.db_operations import DBOperations
+    db_ops = DBOperations(monitoring_conn, db_type=config['monitoring_db']['type'])
+    table_name = f'master_{account_type}_ils' + (DELTA_SUFFIX if delta else '')
+    staging = staging_options(config)
+
+    with monitoring_conn:
+        load_table_name = prepare_master_table(db_ops, account_type, delta=delta, **staging)
+
+        query = build_master_query(account_type, delta_column, watermark)
+        columns = get_table_spec(table_name).column_list()
+        copy_format = "(FORMAT binary)" if binary else "WITH CSV DELIMITER ';'"
+        copy_out_query = f"COPY ({query}) TO STDOUT {copy_format}"
+        copy_in_query = f"COPY public.{load_table_name} ({columns}) FROM STDIN {copy_format}"
+
+        master_conn = get_connection(config, 'master_db')
+        logging.info("Подключение к мастер-системе установлено.")
+
+        with master_conn:
+            try:
+                with master_conn.get_cursor() as source_cur, monitoring_conn.get_cursor() as target_cur:
+                    bytes_transferred = stream_copy(source_cur, copy_out_query, target_cur, copy_in_query,
+                                                    chunk_size=config['processing']['stream_chunk_size'],
+                                                    max_chunks=config['processing']['stream_max_chunks'])
+                    rows_loaded = target_cur.rowcount
+                monitoring_conn.commit()
+                record_rows(STAGE_MONITORING_LOAD, table_name, loaded=rows_loaded)
+                publish_load_table(db_ops, table_name, **staging)
+            except Exception as e:
+                monitoring_conn.conn.rollback()
+                end_time = time.time()
+                logging.error(
+                    f"Не удалось передать данные по {account_type} из мастер-системы в мониторинг: {e}. "
+                    f"Время выполнения: {end_time - start_time:.2f} секунд.")
+                return False
+
+    end_time = time.time()
+    logging.info(
+        f"Потоковая передача данных по {account_type} в таблицу {table_name} завершена "
+        f"({rows_loaded} строк, {bytes_transferred} байт, формат {'binary' if binary else 'csv'}). "
+        f"Время выполнения: {end_time - start_time:.2f} секунд.")
+    return True
@@ -1,103 +1,199 @@
+import argparse
 import logging
-import json
 import sys
+from functools import partial
 from os import getcwd, path
 from utils.logger import setup_logger
 from importing_data.csv_import import import_data_to_monitoring, import_data_to_historical, \
-    import_data_from_historical_to_monitoring
+    import_data_from_historical_to_monitoring, merge_master_delta
+from importing_data.stream_transfer import transfer_master_to_monitoring
+from importing_data.historical_pipeline import transfer_historical_to_monitoring
+from importing_data.id_transfer import transfer_ids_to_historical
 from exporting_data.csv_export import export_data_from_master, export_ids_from_monitoring, export_data_from_historical
 from config import load_db_config
 from monitoring_data.checks import perform_checks_data
+from monitoring_data.check_registry import load_check_definitions, get_check_definitions, parse_check_ids
+from monitoring_data.vectorized_checks import check_engine_config
 from utils.file_utils import clear_directory
-
-STATE_FILE = 'processing_state.json'
-
-
-def read_processing_state():
-    """Чтение состояния обработки из JSON-файла."""
-    if path.exists(STATE_FILE):
-        with open(STATE_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-
-def write_processing_state(state):
-    """Запись состояния обработки в JSON-файл."""
-    with open(STATE_FILE, 'w') as f:
-        json.dump(state, f)
-
-
-def process_accounts(config, account_type):
-    """Обработка открытых или закрытых лицевых счетов."""
-    csv_filename = export_data_from_master(config, account_type)
-    if csv_filename:
-        return import_data_to_monitoring(config, csv_filename, account_type)
-    return False
+from utils.scheduler import Task, run_tasks
+from utils.processing_state import ProcessingState
+from database.connection_pool import close_all_pools
+from database.retry_policy import configure_retry_policies, log_retry_metrics
+from utils.run_manifest import configure_run_manifest, log_run_manifest
+
+ACCOUNT_TYPES = ('opening', 'closing')
+
+
+def process_accounts(config, account_type, watermark=None):
+    """
+    Обработка открытых или закрытых лицевых счетов.
+    В инкрементальном режиме возвращает словарь с новым значением отметки ('watermark').
+    """
+    delta = config['processing']['load_mode'] == 'delta'
+    delta_column = config['processing']['delta_columns'][account_type] if delta else None
+    transfer_mode = config['processing']['master_transfer_mode']
+    if transfer_mode in ('stream', 'stream_binary'):
+        result = transfer_master_to_monitoring(config, account_type, binary=transfer_mode == 'stream_binary',
+                                               delta=delta, delta_column=delta_column, watermark=watermark)
+    else:
+        csv_filename = export_data_from_master(config, account_type, delta_column=delta_column, watermark=watermark)
+        result = import_data_to_monitoring(config, csv_filename, account_type, delta=delta) if csv_filename else False
+
+    if result and delta:
+        new_watermark = merge_master_delta(config, account_type, delta_column)
+        return {'watermark': new_watermark or watermark}
+    return result
+
+
+def build_tasks(config, cur_dir_path, state):
+    """
+    Формирование графа задач обработки.
+    Ветки обработки открытых и закрытых лицевых счетов не зависят друг от друга и выполняются параллельно,
+    проверки запускаются после загрузки данных по обеим веткам.
+    :param state: Состояние обработки (отметки инкрементального режима и контрольные точки этапов).
+    """
+    watermarks = state.get('watermarks') or {}
+    delta = config['processing']['load_mode'] == 'delta'
+    # Проверки по файлам выгрузок (check_mode = engine) не требуют загрузки порций исторической системы в мониторинг
+    engine_checks = config['processing']['check_mode'] == 'engine'
+    if engine_checks:
+        # Параметры проверяются до запуска обработки, а не на этапе проверок
+        check_engine_config(config)
+    tasks = []
+    checks_depend_on = []
+    for account_type in ACCOUNT_TYPES:
+        account_types = [account_type]
+        tasks.append(Task(f'master:{account_type}',
+                          partial(process_accounts, config, account_type,
+                                  watermarks.get(account_type) if delta else None),
+                          description=f"Выгрузка из мастер-системы и загрузка в мониторинг ({account_type})"))
+        if config['processing']['ids_transfer_mode'] == 'stream':
+            # Извлечение идентификаторов и загрузка в историческую систему выполняются за один проход
+            tasks.append(Task(f'to_historical:{account_type}',
+                              partial(transfer_ids_to_historical, config, cur_dir_path, account_type, delta),
+                              depends_on=[f'master:{account_type}'],
+                              description=f"Передача идентификаторов из базы мониторинга в историческую систему "
+                                          f"({account_type})"))
+        else:
+            tasks.extend([
+                Task(f'ids:{account_type}', partial(export_ids_from_monitoring, config, account_types, delta),
+                     depends_on=[f'master:{account_type}'],
+                     description=f"Извлечение идентификаторов из базы мониторинга ({account_type})"),
+                Task(f'to_historical:{account_type}',
+                     partial(import_data_to_historical, config, cur_dir_path, account_types),
+                     depends_on=[f'ids:{account_type}'],
+                     description=f"Загрузка идентификаторов в историческую систему ({account_type})"),
+            ])
+        if config['processing']['stream_historical']:
+            # Выгрузка и загрузка порций исторической системы выполняются одновременно
+            tasks.append(Task(f'to_monitoring:{account_type}',
+                              partial(transfer_historical_to_monitoring, config, cur_dir_path, account_type, delta,
+                                      state),
+                              depends_on=[f'to_historical:{account_type}'],
+                              description=f"Выгрузка данных из исторической системы с загрузкой в мониторинг "
+                                          f"({account_type})"))
+        else:
+            tasks.append(Task(f'from_historical:{account_type}',
+                              partial(export_data_from_historical, config, cur_dir_path, account_types, state),
+                              depends_on=[f'to_historical:{account_type}'],
+                              description=f"Выгрузка данных из исторической системы ({account_type})"))
+            if engine_checks:
+                # Проверки выполняются по файлам порций, загрузка в мониторинг не требуется
+                checks_depend_on.append(f'from_historical:{account_type}')
+                continue
+            tasks.append(Task(f'to_monitoring:{account_type}',
+                              partial(import_data_from_historical_to_monitoring, config, cur_dir_path, account_types,
+                                      delta, state),
+                              depends_on=[f'from_historical:{account_type}'],
+                              description=f"Загрузка данных исторической системы в мониторинг ({account_type})"))
+        checks_depend_on.append(f'to_monitoring:{account_type}')
+    tasks.append(Task('checks', partial(perform_checks_data, config, state),
+                      depends_on=checks_depend_on,
+                      description="Проведение проверок и формирование отчета"))
+    return tasks
+
+
+def parse_args():
+    """Разбор параметров командной строки."""
+    parser = argparse.ArgumentParser(description="Мониторинг качества данных")
+    parser.add_argument('--checks', type=parse_check_ids,
+                        help="Повторное выполнение выбранных проверок по загруженным данным, например 2,5 или 1-3")
+    return parser.parse_args()
+
+
+def run_selected_checks(config, check_ids):
+    """
+    Выполнение выбранных проверок без этапов загрузки данных и без изменения состояния обработки.
+    :return: True при успешном выполнении всех выбранных проверок.
+    """
+    # Номера проверяются до подключения к базам данных
+    try:
+        get_check_definitions(check_ids)
+    except KeyError as e:
+        logging.error(e.args[0])
+        return False
+    logging.info(f"Выполнение проверок: {', '.join(map(str, check_ids))}.")
+    try:
+        return perform_checks_data(config, check_ids=check_ids)
+    finally:
+        close_all_pools()
+        log_retry_metrics()
 
 
 def main():
+    args = parse_args()
     # Настройка логирования
     setup_logger()
     # Загрузка конфигурации
     config = load_db_config()
+    configure_retry_policies(config['retry'])
+    # Дополнительные описания проверок
+    if config['processing']['checks_file']:
+        try:
+            load_check_definitions(config['processing']['checks_file'])
+        except ValueError as e:
+            logging.error(f"Не удалось загрузить описания проверок: {e}")
+            sys.exit(1)
+    if args.checks is not None:
+        if not run_selected_checks(config, args.checks):
+            sys.exit(1)
+        return
     cur_dir_path = getcwd()
     # Чтение состояния обработки
-    state = read_processing_state()
-    current_step = state.get('current_step', 0)
-    # Очистка временного каталога
-    if current_step == 0:
+    state = ProcessingState()
+    # Журнал количества строк по этапам сохраняется в состоянии обработки и восстанавливается при возобновлении
+    configure_run_manifest(state)
+    # Очистка временного каталога (при возобновлении сохраняются уже выгруженные файлы)
+    if state.is_fresh():
         clear_directory(path.join(cur_dir_path, 'temp_data'))
-    try:
-        if current_step < 1 and process_accounts(config, 'opening'):
-            write_processing_state({'current_step': 1})
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении 1-го этапа: {e}")
-        sys.exit(1)  # Завершение работы скрипта с кодом 1
-
-    try:
-        if current_step < 2 and process_accounts(config, 'closing'):
-            write_processing_state({'current_step': 2})
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении 2-го этапа: {e}")
-        sys.exit(1)  # Завершение работы скрипта с кодом 1
-
-    try:
-        if current_step < 3 and export_ids_from_monitoring(config):
-            write_processing_state({'current_step': 3})
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении 3-го этапа: {e}")
-        sys.exit(1)  # Завершение работы скрипта с кодом 1
-
-    try:
-        if current_step < 4 and import_data_to_historical(config, cur_dir_path):
-            write_processing_state({'current_step': 4})
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении 4-го этапа: {e}")
-        sys.exit(1)  # Завершение работы скрипта с кодом 1
 
-    try:
-        if current_step < 5 and export_data_from_historical(config, cur_dir_path):
-            write_processing_state({'current_step': 5})
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении 5-го этапа: {e}")
-        sys.exit(1)  # Завершение работы скрипта с кодом 1
+    def on_task_done(task_name, result):
+        """Сохранение выполненной задачи и новой отметки инкрементального режима в состоянии обработки."""
+        if isinstance(result, dict) and result.get('watermark'):
+            account_type = task_name.split(':')[1]
+            watermarks = state.get('watermarks') or {}
+            watermarks[account_type] = result['watermark']
+            state.set('watermarks', watermarks)
+        state.mark_task_done(task_name)
 
     try:
-        if current_step < 6 and import_data_from_historical_to_monitoring(config, cur_dir_path):
-            write_processing_state({'current_step': 6})
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении 6-го этапа: {e}")
-        sys.exit(1)  # Завершение работы скрипта с кодом 1
-
+        tasks = build_tasks(config, cur_dir_path, state)
+    except ValueError as e:
+        logging.error(f"Некорректные параметры обработки: {e}")
+        sys.exit(1)
     try:
-        if current_step < 7:
-            if perform_checks_data(config):
-                logging.info("Все этапы обработки уже выполнены. Сбрасываем состояние.")
-                write_processing_state({'current_step': 0})
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении 7-го этапа: {e}")
+        succeeded = run_tasks(tasks, max_workers=config['processing']['max_workers'],
+                              completed=state.completed_tasks(), on_task_done=on_task_done)
+    finally:
+        close_all_pools()
+        log_retry_metrics()
+        log_run_manifest()
+    if not succeeded:
+        logging.error("Обработка завершилась с ошибкой. Выполненные задачи сохранены в состоянии обработки.")
         sys.exit(1)  # Завершение работы скрипта с кодом 1
 
+    logging.info("Все этапы обработки выполнены. Сбрасываем состояние.")
+    state.reset()
     logging.info("Работа завершена!")
 
 
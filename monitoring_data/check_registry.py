@@ -0,0 +1,155 @@
+import argparse
+import json
+import logging
+from monitoring_data.reconciliation import FLAG_EXTRA_COLUMNS
+
+ACCOUNT_TYPES = ('opening', 'closing')
+
+
+class CheckDefinition:
+    """
+    Описание проверки: запрос (текст или имя запроса в database.queries), признак расхождения для режимов
+    reconciliation и engine, необходимость дополнения статусами интеграции и относительная стоимость.
+    """
+
+    def __init__(self, check_id, name, account_type, query=None, query_name=None, flag=None, integrating=True,
+                 cost=1):
+        """
+        :param check_id: Номер проверки (порядок в отчете, выбор проверок параметром --checks).
+        :param name: Имя проверки (имя файлов результата и описание в отчете).
+        :param account_type: Тип лицевых счетов ('opening' или 'closing').
+        :param query: Текст запроса проверки.
+        :param query_name: Имя запроса в database.queries (если query не задан).
+        :param flag: Признак расхождения в таблице расхождений (проверка доступна в режимах reconciliation и engine).
+        :param integrating: Дополнять результат статусами интеграции.
+        :param cost: Относительная стоимость проверки: более дорогие проверки запускаются раньше.
+        """
+        if account_type not in ACCOUNT_TYPES:
+            raise ValueError(f"Проверка {check_id}: неизвестный тип лицевых счетов {account_type}.")
+        if not query and not query_name and not flag:
+            raise ValueError(f"Проверка {check_id}: не задан запрос или признак расхождения.")
+        if flag and flag not in FLAG_EXTRA_COLUMNS:
+            raise ValueError(f"Проверка {check_id}: неизвестный признак расхождения {flag}.")
+        self.check_id = int(check_id)
+        self.name = name
+        self.account_type = account_type
+        self.query = query
+        self.query_name = query_name
+        self.flag = flag
+        self.integrating = integrating
+        self.cost = cost
+
+    @property
+    def description(self):
+        """Описание проверки для отчета и таблицы data_check_results."""
+        return self.name.replace('_', ' ').capitalize()
+
+    def sql(self):
+        """Текст запроса проверки (запросы database.queries загружаются при первом обращении)."""
+        if self.query:
+            return self.query
+        if self.query_name:
+            import database.queries as queries
+            return getattr(queries, self.query_name)
+        raise ValueError(f"Для проверки {self.check_id} не задан запрос.")
+
+    @classmethod
+    def from_dict(cls, data):
+        """Описание проверки из словаря (ключи - параметры конструктора, номер - 'id')."""
+        data = dict(data)
+        return cls(data.pop('id'), **data)
+
+
+# Реестр описаний проверок по номерам
+CHECK_DEFINITIONS = {}
+
+
+def register_check(definition):
+    """Добавление описания проверки в реестр (описание с тем же номером заменяется)."""
+    if definition.check_id in CHECK_DEFINITIONS:
+        logging.info(f"Описание проверки {definition.check_id} заменено.")
+    CHECK_DEFINITIONS[definition.check_id] = definition
+    return definition
+
+
+def load_check_definitions(file_path):
+    """
+    Загрузка описаний проверок из JSON-файла в реестр.
+    Файл содержит список объектов с ключами id, name, account_type и query, query_name или flag; необязательные
+    ключи - integrating и cost.
+    :return: Список загруженных описаний.
+    :raises ValueError: Файл не является JSON или описание проверки некорректно (неизвестный ключ, нет id).
+    """
+    with open(file_path, encoding='utf-8') as f:
+        entries = json.load(f)
+    definitions = []
+    for data in entries:
+        try:
+            definition = CheckDefinition.from_dict(data)
+        except KeyError as e:
+            raise ValueError(f"{file_path}: в описании проверки {data} отсутствует ключ {e}.") from e
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{file_path}: некорректное описание проверки {data}: {e}") from e
+        definitions.append(register_check(definition))
+    logging.info(f"Загружено описаний проверок из {file_path}: {len(definitions)}.")
+    return definitions
+
+
+def get_check_definitions(check_ids=None):
+    """
+    Описания проверок в порядке номеров.
+    :param check_ids: Номера выбранных проверок (по умолчанию все).
+    :raises KeyError: Проверка с указанным номером не зарегистрирована.
+    """
+    if check_ids:
+        missing_ids = sorted(set(check_ids) - set(CHECK_DEFINITIONS))
+        if missing_ids:
+            raise KeyError(f"Проверки {', '.join(map(str, missing_ids))} отсутствуют в реестре проверок.")
+        return [CHECK_DEFINITIONS[check_id] for check_id in sorted(set(check_ids))]
+    return [CHECK_DEFINITIONS[check_id] for check_id in sorted(CHECK_DEFINITIONS)]
+
+
+def parse_check_ids(value):
+    """
+    Номера проверок из строки вида '2,5' или '1-3,7' (тип параметра --checks).
+    :raises argparse.ArgumentTypeError: Не указано ни одной проверки или диапазон задан в обратном порядке.
+    """
+    check_ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = (int(number) for number in part.split('-', 1))
+            if first > last:
+                raise argparse.ArgumentTypeError(f"диапазон проверок {part} задан в обратном порядке")
+            check_ids.extend(range(first, last + 1))
+        else:
+            check_ids.append(int(part))
+    if not check_ids:
+        raise argparse.ArgumentTypeError(f"не указано ни одной проверки: '{value}'")
+    return check_ids
+
+
+# Проверки соответствия данных мастер-системы и исторической системы
+register_check(CheckDefinition(
+    1, 'открытые_лицевые_счета,_которые_отсутствуют_в_исторической_системе', 'opening',
+    query_name='check_query1', flag='missing_in_historical', cost=3))
+register_check(CheckDefinition(
+    2, "открытые_лицевые_счета,_у_которых_в_исторической_системе_статус_отличный_от_статуса_'Актуальный'", 'opening',
+    query_name='check_query2', flag='status_mismatch', cost=2))
+register_check(CheckDefinition(
+    3, 'открытые_лицевые_счета,_у_которых_другой_регион_открытия_в_исторической_системе', 'opening',
+    query_name='check_query3', flag='region_mismatch', cost=2))
+register_check(CheckDefinition(
+    4, 'закрытые_лицевые_счета,_которые_отсутствуют_в_исторической_системе', 'closing',
+    query_name='check_query4', flag='missing_in_historical', cost=3))
+register_check(CheckDefinition(
+    5, "закрытые_лицевые_счета,_у_которых_в_исторической_системе_статус_отличный_от_статусов_'Умер',_'Упразднен'",
+    'closing', query_name='check_query5', flag='status_mismatch', cost=2))
+register_check(CheckDefinition(
+    6, 'закрытые_лицевые_счета,_у_которых_другой_регион_закрытия_в_исторической_системе', 'closing',
+    query_name='check_query6', flag='region_mismatch', cost=2))
+register_check(CheckDefinition(
+    7, 'закрытые_лицевые_счета,_у_которых_другая_дата_смерти_в_исторической_системе', 'closing',
+    query_name='check_query7', flag='death_date_mismatch', cost=2))
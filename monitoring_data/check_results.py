@@ -0,0 +1,67 @@
+import logging
+import threading
+from datetime import datetime
+from database.db_schema import get_table_spec
+
+# Таблица результатов проверок (описание в реестре описаний таблиц)
+CHECK_RESULTS_TABLE = 'data_check_results'
+
+
+def new_run_id():
+    """Идентификатор запуска проверок (дата и время начала)."""
+    return datetime.now().strftime("%Y%m%d%H%M%S")
+
+
+class CheckResultWriter:
+    """
+    Буфер результатов проверок для таблицы data_check_results.
+    Результаты накапливаются во время проверок и записываются одной транзакцией методом flush,
+    вместе с каждым результатом сохраняются длительность проверки, идентификатор запуска и тип лицевых счетов.
+    Методы потокобезопасны.
+    """
+
+    def __init__(self, db_ops, run_id=None):
+        """
+        :param db_ops: DBOperations базы мониторинга.
+        :param run_id: Идентификатор запуска (по умолчанию дата и время создания).
+        """
+        self.db_ops = db_ops
+        self.run_id = run_id or new_run_id()
+        self._results = []
+        self._lock = threading.Lock()
+
+    def prepare_table(self):
+        """Создание таблицы результатов проверок и добавление недостающих столбцов."""
+        self.db_ops.ensure_table(get_table_spec(CHECK_RESULTS_TABLE))
+        return self
+
+    def add(self, check_description, record_count, duration=None, account_type=None):
+        """
+        Добавление результата проверки в буфер.
+        :param check_description: Описание проверки.
+        :param record_count: Количество записей.
+        :param duration: Длительность проверки (секунды).
+        :param account_type: Тип лицевых счетов ('opening' или 'closing').
+        """
+        with self._lock:
+            self._results.append((check_description, record_count,
+                                  round(duration, 3) if duration is not None else None, self.run_id, account_type))
+
+    def flush(self):
+        """
+        Запись накопленных результатов в таблицу одной транзакцией.
+        :return: Количество записанных результатов.
+        """
+        with self._lock:
+            results, self._results = self._results, []
+        try:
+            inserted = self.db_ops.insert_rows(
+                CHECK_RESULTS_TABLE, ['check_description', 'record_count', 'duration', 'run_id', 'account_type'],
+                results)
+        except Exception:
+            # Результаты возвращаются в буфер для повторной записи
+            with self._lock:
+                self._results[:0] = results
+            raise
+        logging.info(f"Записано результатов проверок: {inserted} (запуск {self.run_id}).")
+        return inserted
@@ -1,18 +1,257 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
+from functools import partial
 from os import path
-from database.db_connection import DatabaseConnection
-from exporting_data.report_export import perform_check_and_export
-from database.queries import check_query1, check_query2, check_query3, check_query4, check_query5, check_query6, \
-    check_query7
+from database.connection_pool import get_connection
+from exporting_data.csv_export import temp_data_dir
+from exporting_data.report_export import perform_check_and_export, export_check_result
+from importing_data.csv_import import DELTA_SUFFIX
+from monitoring_data.check_registry import ACCOUNT_TYPES, get_check_definitions
+from monitoring_data.check_results import CheckResultWriter
+from monitoring_data.reconciliation import build_reconciliation_table, reconciliation_check_query
+from monitoring_data.vectorized_checks import run_vectorized_reconciliation, frame_to_rows, check_engine_config
 from utils.file_utils import create_directory
+from utils.run_manifest import STAGE_MASTER_EXPORT, STAGE_MONITORING_LOAD, STAGE_IDS_EXPORT, STAGE_IDS_LOAD, \
+    STAGE_HISTORICAL_EXPORT, compare_rows, row_count, run_manifest
 
 
-def perform_checks_data(config):
-    """Проведение проверок и формирование отчета."""
+def perform_check_with_checkpoint(state, result_writer, run_check, definition):
+    """
+    Выполнение проверки с сохранением контрольной точки.
+    Проверка, выполненная при предыдущем запуске, не повторяется: строки отчета и результат берутся из состояния
+    обработки.
+    :param run_check: Функция выполнения проверки: run_check(строки отчета) -> количество записей.
+    :param definition: Описание проверки (CheckDefinition).
+    :return: Строки отчета проверки.
+    """
+    check_name = definition.name
+    checkpoint = state.get_checkpoint('checks', check_name) if state else None
+    if checkpoint:
+        logging.info(f"Проверка '{check_name}' выполнена ранее, пропускаем.")
+        result_writer.add(definition.description, checkpoint['record_count'], checkpoint['duration'],
+                          definition.account_type)
+        return checkpoint['report_lines']
+
+    check_report_lines = []
+    check_start_time = time.time()
+    count = run_check(check_report_lines)
+    duration = time.time() - check_start_time
+    result_writer.add(definition.description, count, duration, definition.account_type)
+    if state:
+        state.mark_checkpoint('checks', check_name, {'report_lines': check_report_lines, 'record_count': count,
+                                                     'duration': duration})
+    return check_report_lines
+
+
+def perform_checks(state, result_writer, checks, concurrency=1):
+    """
+    Выполнение проверок на пуле из concurrency потоков.
+    Проверки запускаются в порядке убывания стоимости (cost), строки отчета собираются в порядке списка проверок
+    независимо от порядка их завершения. Ошибка проверки не прерывает остальные: в отчет записывается сообщение
+    об ошибке, контрольная точка не сохраняется.
+    :param checks: Список проверок (функция выполнения, описание проверки).
+    :return: Кортеж (строки отчета, количество проверок с ошибкой).
+    """
+    report_lines = []
+    failed_checks = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='check') as executor:
+        futures = {}
+        for run_check, definition in sorted(checks, key=lambda check: -check[1].cost):
+            futures[definition.check_id] = executor.submit(perform_check_with_checkpoint, state, result_writer,
+                                                           run_check, definition)
+        for _, definition in checks:
+            try:
+                report_lines.extend(futures[definition.check_id].result())
+            except Exception as e:
+                logging.error(f"Ошибка при выполнении проверки '{definition.name}': {e}")
+                failed_checks += 1
+                report_lines.append(f"{definition.description}:")
+                report_lines.append(f"   - Ошибка выполнения проверки: {e}")
+    return report_lines, failed_checks
+
+
+def run_query_check(config, check_query, definition, report_lines):
+    """Выполнение проверки запросом на отдельном подключении из пула базы мониторинга."""
+    monitoring_conn = get_connection(config, 'monitoring_db')
+    from database.db_operations import DBOperations
+    db_ops = DBOperations(monitoring_conn, db_type=config['monitoring_db']['type'])
+    with monitoring_conn:
+        return perform_check_and_export(db_ops, config, check_query, definition.name, report_lines,
+                                        integrating=definition.integrating)
+
+
+def prepare_queries(config, definitions):
+    """
+    Проверки запросами из описаний проверок (режим queries).
+    :return: Список проверок (функция выполнения, описание проверки).
+    """
+    return [(partial(run_query_check, config, definition.sql(), definition), definition)
+            for definition in definitions]
+
+
+def prepare_reconciliation(state, db_ops, config, definitions):
+    """
+    Формирование таблиц расхождений для режима reconciliation (с сохранением контрольных точек).
+    Проверки без признака расхождения выполняются своими запросами.
+    :return: Список проверок (функция выполнения, описание проверки).
+    """
+    for account_type in sorted({definition.account_type for definition in definitions if definition.flag}):
+        if state and state.get_checkpoint('checks', f'reconciliation:{account_type}'):
+            logging.info(f"Таблица расхождений для {account_type} сформирована ранее, пропускаем.")
+            continue
+        rows = build_reconciliation_table(db_ops, account_type,
+                                          config['processing']['valid_statuses'][account_type])
+        if state:
+            state.mark_checkpoint('checks', f'reconciliation:{account_type}', {'rows': rows})
+    return [(partial(run_query_check, config,
+                     reconciliation_check_query(definition.account_type, definition.flag) if definition.flag
+                     else definition.sql(), definition), definition)
+            for definition in definitions]
+
+
+def prepare_engine(config, definitions):
+    """
+    Проверки по файлам выгрузок в temp_data без обращения к таблицам мониторинга (режим engine).
+    Расхождения вычисляются при первой проверке типа лицевых счетов сразу по всем признакам
+    (см. run_vectorized_reconciliation); проверки того же типа, выполняемые одновременно, ожидают вычисления.
+    Проверки без признака расхождения выполняются своими запросами.
+    :return: Список проверок (функция выполнения, описание проверки).
+    """
+    check_engine_config(config)
+    discrepancies = {}
+    locks = {account_type: threading.Lock() for account_type in ACCOUNT_TYPES}
+
+    def run_check(definition, report_lines):
+        account_type = definition.account_type
+        with locks[account_type]:
+            if account_type not in discrepancies:
+                discrepancies[account_type] = run_vectorized_reconciliation(
+                    temp_data_dir, account_type, config['processing']['valid_statuses'][account_type])
+        columns, rows = frame_to_rows(discrepancies[account_type][definition.flag])
+        return export_check_result(config, columns, [rows], definition.name, report_lines,
+                                   integrating=definition.integrating)
+
+    return [(partial(run_check, definition) if definition.flag
+             else partial(run_query_check, config, definition.sql(), definition), definition)
+            for definition in definitions]
+
+
+def manifest_totals():
+    """
+    Общее количество записей по журналу запуска: строки мастер-системы, загруженные в мониторинг, и строки,
+    выгруженные из таблиц исторической системы (None - количество не записано, например в инкрементальном режиме).
+    """
+    totals = {}
+    for account_type in ACCOUNT_TYPES:
+        totals[account_type] = row_count(STAGE_MONITORING_LOAD, f'master_{account_type}_ils', 'loaded')
+        totals[f'historical_{account_type}'] = row_count(STAGE_HISTORICAL_EXPORT,
+                                                         f'vlg_mic_historical_{account_type}_ils', 'exported')
+    return totals
+
+
+def count_totals(config, db_ops, keys):
+    """
+    Подсчет общего количества записей запросами COUNT(*) к таблицам мониторинга и исторической системы.
+    Подключение к исторической системе устанавливается, только если запрошены итоги исторической системы.
+    :param keys: Ключи итогов ('opening', 'historical_opening' и т.д., см. manifest_totals).
+    :return: Словарь {ключ: количество записей}.
+    """
+    counted = {}
+    for account_type in ACCOUNT_TYPES:
+        if account_type in keys:
+            counted[account_type] = db_ops.count_total_records(f'master_{account_type}_ils')
+    historical_keys = [account_type for account_type in ACCOUNT_TYPES if f'historical_{account_type}' in keys]
+    if historical_keys:
+        from database.db_operations import DBOperations
+        historical_conn = get_connection(config, 'historical_db')
+        db_ops_historical = DBOperations(historical_conn, db_type=config['historical_db']['type'])
+        with historical_conn:
+            for account_type in historical_keys:
+                counted[f'historical_{account_type}'] = db_ops_historical.count_total_records(
+                    f'vlg_mic_historical_{account_type}_ils')
+    return counted
+
+
+def collect_totals(config, db_ops, check_ids=None):
+    """
+    Общее количество записей для отчета и таблицы результатов.
+    Количество берется из журнала запуска; запросами COUNT(*) подсчитываются только итоги, отсутствующие в журнале
+    (итоги исторической системы - только при выполнении всех проверок). В режиме проверки количества строк
+    (processing.verify_counts) подсчитываются все итоги и сверяются с журналом запуска.
+    :return: Кортеж (словарь итогов, список расхождений с журналом запуска).
+    """
+    totals = manifest_totals()
+    verify = config['processing']['verify_counts']
+    keys = [key for key, value in totals.items()
+            if verify or (value is None and (key in ACCOUNT_TYPES or not check_ids))]
+    if not keys:
+        return totals, []
+    counted = count_totals(config, db_ops, keys)
+    mismatches = [f"{key}: журнал запуска {totals[key]}, COUNT(*) {value}" for key, value in counted.items()
+                  if totals[key] is not None and totals[key] != value]
+    totals.update(counted)
+    return totals, mismatches
+
+
+def manifest_consistency(delta=False):
+    """
+    Сверка количества строк между этапами обработки по журналу запуска: выгруженные из мастер-системы и загруженные
+    в мониторинг строки, выгруженные и загруженные в историческую систему идентификаторы, выгруженные из
+    исторической системы и загруженные (или отбракованные) в мониторинге строки. Этапы без записей не сверяются.
+    :param delta: Инкрементальный режим (загрузка в таблицы изменений).
+    :return: Список расхождений.
+    """
+    suffix = DELTA_SUFFIX if delta else ''
+    mismatches = []
+    for account_type in ACCOUNT_TYPES:
+        rules = [
+            ((STAGE_MASTER_EXPORT, f'master_{account_type}_ils', 'exported'),
+             (STAGE_MONITORING_LOAD, f'master_{account_type}_ils{suffix}', ('loaded',))),
+            ((STAGE_IDS_EXPORT, f'ids_{account_type}_ils', 'exported'),
+             (STAGE_IDS_LOAD, f'vlg_mic_ids_{account_type}_ils', ('loaded',))),
+            ((STAGE_HISTORICAL_EXPORT, f'vlg_mic_historical_{account_type}_ils', 'exported'),
+             (STAGE_MONITORING_LOAD, f'historical_{account_type}_ils{suffix}', ('loaded', 'rejected'))),
+        ]
+        for source, target in rules:
+            mismatch = compare_rows(source, target)
+            if mismatch:
+                mismatches.append(mismatch)
+    return mismatches
+
+
+def manifest_report_lines(mismatches):
+    """Строки отчета с количеством строк по этапам обработки и расхождениями количества строк."""
+    manifest = run_manifest()
+    if not manifest and not mismatches:
+        return []
+    report_lines = ["Количество строк по этапам обработки:"]
+    for stage, tables in manifest.items():
+        for table, counts in sorted(tables.items()):
+            report_lines.append(f"   - {stage} {table}: "
+                                f"{', '.join(f'{key} {value}' for key, value in counts.items())}")
+    if mismatches:
+        report_lines.append("Расхождения количества строк:")
+        report_lines.extend(f"   - {mismatch}" for mismatch in mismatches)
+    report_lines.append("=" * 30)
+    return report_lines
+
+
+def perform_checks_data(config, state=None, check_ids=None):
+    """
+    Проведение проверок и формирование отчета.
+    Проверки берутся из реестра проверок (monitoring_data/check_registry.py). При выборе проверок (check_ids)
+    отчет сохраняется в отдельный файл, итоговые количества записей в таблицу результатов не добавляются.
+    В режиме check_mode = reconciliation проверки выполняются по таблицам расхождений (см. prepare_reconciliation),
+    в режиме engine - по файлам выгрузок в temp_data (см. prepare_engine).
+    Общее количество записей берется из журнала запуска (utils/run_manifest.py), в отчет добавляется количество
+    строк по этапам обработки и расхождения между этапами (см. collect_totals, manifest_consistency).
+    При передаче состояния обработки выполненные проверки сохраняются как контрольные точки.
+    """
     start_time = time.time()
-    monitoring_conn = DatabaseConnection(config['monitoring_db'])
+    monitoring_conn = get_connection(config, 'monitoring_db')
     logging.info("Подключение к целевой системе мониторинга установлено.")
 
     from database.db_operations import DBOperations
@@ -24,92 +263,106 @@ def perform_checks_data(config):
     create_directory(result_directory)
 
     with monitoring_conn:
-        with monitoring_conn.get_cursor() as cur:
-            integrating_conn = DatabaseConnection(config['integrating_db'])
-            logging.info("Подключение к интеграционной базе установлено.")
-
-            db_ops_integrating = DBOperations(integrating_conn, db_type=config['integrating_db']['type'])
-
-            with integrating_conn:
-                with integrating_conn.get_cursor() as cur_integrating:
-                    # Создание таблицы для хранения проверок
-                    columns_data_check_results = {
-                        'id': 'SERIAL PRIMARY KEY',
-                        'check_description': 'TEXT',
-                        'record_count': 'INT',
-                        'created_at': 'DATE DEFAULT CURRENT_DATE',
-                    }
-                    db_ops.create_postgresql_table('data_check_results', columns_data_check_results, ['id'])
-
-                    report_lines = []
-                    report_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                    try:
-                        # Подсчет общего количества записей в таблицах
-                        total_opening_records = db_ops.count_total_records('master_opening_ils')
-                        total_closing_records = db_ops.count_total_records('master_closing_ils')
-
-                        historical_conn = DatabaseConnection(config['historical_db'])
-                        db_ops_historical = DBOperations(historical_conn, db_type=config['historical_db']['type'])
-                        with historical_conn:
-                            with historical_conn.get_cursor() as cur_historical:
-                                total_historical_opening_records = db_ops_historical.count_total_records(
-                                    'vlg_mic_historical_opening_ils')
-                                total_historical_closing_records = db_ops_historical.count_total_records(
-                                    'vlg_mic_historical_closing_ils')
-
-                        report_lines.append(
-                            "Проверка проводилась по данным полученным из ЕЦП ХОАД в сравнение с их состоянием в исторической системе (СПУ)")
-                        report_lines.append("по открытым лицевым счетам после 12.05.2024 и умершим после 12.05.2024")
-                        report_lines.append(f"Количество ИЛС открытых: {total_opening_records}")
-                        report_lines.append(f"Количество ИЛС умерших: {total_closing_records}")
-                        report_lines.append("=" * 30)
-
-                        db_ops.insert_check_result("Количество ИЛС открытых", total_opening_records)
-                        db_ops.insert_check_result("Количество ИЛС умерших", total_closing_records)
-
-                        db_ops.insert_check_result("Количество ИЛС открытых в исторической системе",
-                                                   total_historical_opening_records)
-                        db_ops.insert_check_result("Количество ИЛС умерших в исторической системе",
-                                                   total_historical_closing_records)
-
-                        # Выполнение проверок
-                        perform_check_and_export(db_ops, db_ops_integrating, cur, check_query1,
-                                                 'открытые_лицевые_счета,_которые_отсутствуют_в_исторической_системе',
-                                                 report_lines)
-                        perform_check_and_export(db_ops, db_ops_integrating, cur, check_query2,
-                                                 "открытые_лицевые_счета,_у_которых_в_исторической_системе_статус_отличный_от_статуса_'Актуальный'",
-                                                 report_lines)
-                        perform_check_and_export(db_ops, db_ops_integrating, cur, check_query3,
-                                                 'открытые_лицевые_счета,_у_которых_другой_регион_открытия_в_исторической_системе',
-                                                 report_lines)
-                        perform_check_and_export(db_ops, db_ops_integrating, cur, check_query4,
-                                                 'закрытые_лицевые_счета,_которые_отсутствуют_в_исторической_системе',
-                                                 report_lines)
-                        perform_check_and_export(db_ops, db_ops_integrating, cur, check_query5,
-                                                 "закрытые_лицевые_счета,_у_которых_в_исторической_системе_статус_отличный_от_статусов_'Умер',_'Упразднен'",
-                                                 report_lines)
-                        perform_check_and_export(db_ops, db_ops_integrating, cur, check_query6,
-                                                 'закрытые_лицевые_счета,_у_которых_другой_регион_закрытия_в_исторической_системе',
-                                                 report_lines)
-                        perform_check_and_export(db_ops, db_ops_integrating, cur, check_query7,
-                                                 'закрытые_лицевые_счета,_у_которых_другая_дата_смерти_в_исторической_системе',
-                                                 report_lines)
-
-                        # Формирование отчета
-                        report_file = path.join(result_directory, 'отчет.txt')  # Обновленный путь к отчету
-                        with open(report_file, 'w') as f:
-                            f.write("Отчет о проверках данных\n")
-                            f.write("=" * 30 + "\n")
-                            f.write(f"Дата формирования отчета: {report_date}\n")
-                            f.write("=" * 30 + "\n")
-                            for line in report_lines:
-                                f.write(line + "\n")
-                        end_time = time.time()
-                        logging.info(
-                            f"Отчет сохранен в '{report_file}'. Время выполнения: {end_time - start_time:.2f} секунд.")
-                        return True
-
-                    except Exception as e:
-                        logging.error(f"Ошибка при выполнении запросов: {e}")
-                        return False
+        # Создание таблицы для хранения проверок, результаты записываются одной транзакцией в конце
+        result_writer = CheckResultWriter(db_ops).prepare_table()
+
+        report_lines = []
+        report_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        delta = config['processing']['load_mode'] == 'delta'
+
+        try:
+            totals_checkpoint = state.get_checkpoint('checks', 'totals') if state else None
+            if totals_checkpoint:
+                logging.info("Общее количество записей подсчитано ранее, пропускаем.")
+                total_opening_records = totals_checkpoint['opening']
+                total_closing_records = totals_checkpoint['closing']
+                total_historical_opening_records = totals_checkpoint['historical_opening']
+                total_historical_closing_records = totals_checkpoint['historical_closing']
+                mismatches = totals_checkpoint['mismatches']
+            else:
+                # Количество записей берется из журнала запуска (COUNT(*) - только в режиме проверки или при
+                # отсутствии записей в журнале)
+                totals, mismatches = collect_totals(config, db_ops, check_ids)
+                mismatches += manifest_consistency(delta)
+                total_opening_records = totals['opening']
+                total_closing_records = totals['closing']
+                total_historical_opening_records = totals['historical_opening']
+                total_historical_closing_records = totals['historical_closing']
+
+                if state:
+                    state.mark_checkpoint('checks', 'totals', {
+                        'opening': total_opening_records,
+                        'closing': total_closing_records,
+                        'historical_opening': total_historical_opening_records,
+                        'historical_closing': total_historical_closing_records,
+                        'mismatches': mismatches})
+            for mismatch in mismatches:
+                logging.error(f"Количество строк не совпадает: {mismatch}.")
+
+            if not check_ids:
+                result_writer.add("Количество ИЛС открытых", total_opening_records,
+                                  account_type='opening')
+                result_writer.add("Количество ИЛС умерших", total_closing_records,
+                                  account_type='closing')
+                result_writer.add("Количество ИЛС открытых в исторической системе",
+                                  total_historical_opening_records, account_type='opening')
+                result_writer.add("Количество ИЛС умерших в исторической системе",
+                                  total_historical_closing_records, account_type='closing')
+                for account_type in ACCOUNT_TYPES:
+                    rows_rejected = row_count(STAGE_MONITORING_LOAD,
+                                              f'historical_{account_type}_ils' + (DELTA_SUFFIX if delta else ''),
+                                              'rejected')
+                    if rows_rejected:
+                        result_writer.add("Количество строк исторической системы, отбракованных при загрузке",
+                                          rows_rejected, account_type=account_type)
+
+            report_lines.append(
+                "Проверка проводилась по данным полученным из ЕЦП ХОАД в сравнение с их состоянием в исторической системе (СПУ)")
+            report_lines.append("по открытым лицевым счетам после 12.05.2024 и умершим после 12.05.2024")
+            report_lines.append(f"Количество ИЛС открытых: {total_opening_records}")
+            report_lines.append(f"Количество ИЛС умерших: {total_closing_records}")
+            report_lines.append("=" * 30)
+            if not check_ids:
+                report_lines.extend(manifest_report_lines(mismatches))
+
+            # Выполнение проверок
+            definitions = get_check_definitions(check_ids)
+            check_mode = config['processing']['check_mode']
+            if check_mode == 'reconciliation':
+                # Таблицы мастер-системы и исторической системы сравниваются за один проход на тип лицевых счетов
+                checks = prepare_reconciliation(state, db_ops, config, definitions)
+            elif check_mode == 'engine':
+                checks = prepare_engine(config, definitions)
+            else:
+                checks = prepare_queries(config, definitions)
+            # Проверки выполняются одновременно на отдельных подключениях из пулов баз мониторинга и интеграции
+            check_report_lines, failed_checks = perform_checks(state, result_writer, checks,
+                                                               config['processing']['check_concurrency'])
+            report_lines.extend(check_report_lines)
+
+            # Формирование отчета
+            report_name = f"отчет_проверки_{'_'.join(str(d.check_id) for d in definitions)}" if check_ids else 'отчет'
+            report_file = path.join(result_directory, f'{report_name}.txt')  # Обновленный путь к отчету
+            with open(report_file, 'w') as f:
+                f.write("Отчет о проверках данных\n")
+                f.write("=" * 30 + "\n")
+                f.write(f"Дата формирования отчета: {report_date}\n")
+                f.write("=" * 30 + "\n")
+                for line in report_lines:
+                    f.write(line + "\n")
+            # Итоги и результаты выполненных проверок сохранены в контрольных точках и при повторном запуске
+            # добавляются в таблицу результатов заново, поэтому при ошибке проверок они не записываются
+            if not failed_checks or not state:
+                result_writer.flush()
+            end_time = time.time()
+            logging.info(
+                f"Отчет сохранен в '{report_file}'. Время выполнения: {end_time - start_time:.2f} секунд.")
+            if failed_checks:
+                # При повторном запуске выполняются только проверки с ошибкой
+                logging.error(f"Проверок завершилось с ошибкой: {failed_checks}.")
+                return False
+            return True
+
+        except Exception as e:
+            logging.error(f"Ошибка при выполнении запросов: {e}")
+            return False
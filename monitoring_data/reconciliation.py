@@ -0,0 +1,118 @@
+import logging
+import time
+from database.db_schema import get_table_spec
+
+# Сравниваемые столбцы по типам лицевых счетов (с одинаковыми именами в таблицах обеих систем) и признаки расхождений
+COMPARED_COLUMNS = {
+    'opening': {'opening_region': 'region_mismatch'},
+    'closing': {'closing_region': 'region_mismatch', 'death_date': 'death_date_mismatch'},
+}
+
+# Столбцы выгрузки по признакам расхождений (кроме столбцов мастер-системы)
+FLAG_EXTRA_COLUMNS = {
+    'missing_in_historical': [],
+    'status_mismatch': ['historical_acc_sts'],
+    'region_mismatch': ['historical_{account_type}_region'],
+    'death_date_mismatch': ['historical_death_date'],
+}
+
+
+def reconciliation_table_name(account_type):
+    """Имя таблицы расхождений для типа лицевых счетов."""
+    return f'reconciliation_{account_type}_ils'
+
+
+def _master_columns(account_type):
+    """Столбцы таблицы мастер-системы, кроме acc_id."""
+    return [column for column in get_table_spec(f'master_{account_type}_ils').columns if column != 'acc_id']
+
+
+def build_reconciliation_query(account_type, valid_statuses, master_table=None, historical_table=None):
+    """
+    Запрос расхождений мастер-системы и исторической системы за один проход (FULL OUTER JOIN по acc_id).
+    Возвращает только строки хотя бы с одним признаком расхождения, в порядке столбцов таблицы расхождений.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param valid_statuses: Коды допустимых статусов (acc_sts) в исторической системе.
+    :param master_table: Таблица мастер-системы (по умолчанию master_<type>_ils).
+    :param historical_table: Таблица исторической системы (по умолчанию historical_<type>_ils).
+    """
+    if not valid_statuses:
+        raise ValueError(f"Не заданы коды допустимых статусов исторической системы для {account_type}.")
+    master_columns = _master_columns(account_type)
+    statuses = ', '.join(str(int(status)) for status in valid_statuses)
+
+    select_columns = ['COALESCE(m.acc_id, h.acc_id) AS acc_id']
+    select_columns += [f'm.{column}' for column in master_columns]
+    select_columns.append('h.acc_sts AS historical_acc_sts')
+    select_columns += [f'h.{column} AS historical_{column}' for column in sorted(COMPARED_COLUMNS[account_type])]
+    select_columns += [
+        'h.acc_id IS NOT NULL AND m.acc_id IS NULL AS missing_in_master',
+        'm.acc_id IS NOT NULL AND h.acc_id IS NULL AS missing_in_historical',
+        # Отсутствующий статус считается расхождением
+        f'm.acc_id IS NOT NULL AND h.acc_id IS NOT NULL AND COALESCE(h.acc_sts NOT IN ({statuses}), TRUE) '
+        f'AS status_mismatch',
+    ]
+    flags = ['missing_in_master', 'missing_in_historical', 'status_mismatch']
+    for column, flag in COMPARED_COLUMNS[account_type].items():
+        select_columns.append(
+            f'm.acc_id IS NOT NULL AND h.acc_id IS NOT NULL AND m.{column} IS DISTINCT FROM h.{column} AS {flag}')
+        flags.append(flag)
+
+    columns_sql = ',\n               '.join(select_columns)
+    return f"""
+    SELECT * FROM (
+        SELECT {columns_sql}
+        FROM {master_table or f'master_{account_type}_ils'} AS m
+        FULL OUTER JOIN {historical_table or f'historical_{account_type}_ils'} AS h ON m.acc_id = h.acc_id
+    ) AS r
+    WHERE {' OR '.join(flags)}"""
+
+
+def reconciliation_columns(account_type):
+    """Столбцы таблицы расхождений в порядке столбцов запроса build_reconciliation_query."""
+    return (['acc_id'] + _master_columns(account_type) + ['historical_acc_sts']
+            + [f'historical_{column}' for column in sorted(COMPARED_COLUMNS[account_type])]
+            + ['missing_in_master', 'missing_in_historical', 'status_mismatch']
+            + list(COMPARED_COLUMNS[account_type].values()))
+
+
+def build_reconciliation_table(db_ops, account_type, valid_statuses):
+    """
+    Формирование таблицы расхождений reconciliation_<type>_ils в базе мониторинга.
+    Таблицы мастер-системы и исторической системы читаются один раз, в таблицу сохраняются только строки
+    с расхождениями; проверки по типу лицевых счетов выполняются запросами к этой таблице.
+    :param db_ops: DBOperations базы мониторинга.
+    :param account_type: Тип лицевых счетов ('opening' или 'closing').
+    :param valid_statuses: Коды допустимых статусов (acc_sts) в исторической системе.
+    :return: Количество строк с расхождениями.
+    """
+    start_time = time.time()
+    table_name = reconciliation_table_name(account_type)
+    select_query = build_reconciliation_query(account_type, valid_statuses)
+    db_ops.drop_table(table_name)
+    db_ops.ensure_table(get_table_spec(table_name))
+    rows = db_ops.insert_from_select(table_name, select_query, reconciliation_columns(account_type))
+    end_time = time.time()
+    logging.info(f"Таблица расхождений {table_name} сформирована: {rows} строк. "
+                 f"Время выполнения: {end_time - start_time:.2f} секунд.")
+    return rows
+
+
+def check_result_columns(account_type, flag):
+    """
+    Столбцы результата проверки по признаку расхождения: acc_id, столбцы мастер-системы и значения исторической
+    системы, по которым найдено расхождение.
+    """
+    if flag not in FLAG_EXTRA_COLUMNS:
+        raise ValueError(f"Неизвестный признак расхождения: {flag}")
+    return (['acc_id'] + _master_columns(account_type)
+            + [column.format(account_type=account_type) for column in FLAG_EXTRA_COLUMNS[flag]])
+
+
+def reconciliation_check_query(account_type, flag):
+    """Запрос проверки к таблице расхождений: строки с признаком flag (столбцы см. check_result_columns)."""
+    return f"""
+    SELECT {', '.join(check_result_columns(account_type, flag))}
+    FROM {reconciliation_table_name(account_type)}
+    WHERE {flag};
+    """
@@ -0,0 +1,205 @@
+import locale
+import logging
+import time
+from os import listdir, path
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from database.db_schema import get_table_spec
+from monitoring_data.reconciliation import COMPARED_COLUMNS, check_result_columns
+
+# Типы pandas для типов столбцов из описаний таблиц (database/db_schema.py): идентификатор - int64, целые
+# с пропусками - Int32, даты (DATE) читаются как datetime64, остальные столбцы - object
+SQL_DTYPES = {'BIGINT': 'int64', 'INT': 'Int32'}
+# Строковые столбцы с повторяющимися значениями читаются как category
+CATEGORY_COLUMNS = ('opening_region', 'closing_region', 'registration_reason', 'closing_reason')
+
+
+def column_dtypes(table_name):
+    """
+    Типы столбцов таблицы при чтении CSV-файлов по описанию таблицы из реестра.
+    :return: Кортеж (словарь {столбец: тип pandas} для столбцов, кроме дат, список столбцов дат).
+    """
+    dtypes, date_columns = {}, []
+    for column, sql_type in get_table_spec(table_name).columns.items():
+        base_type = sql_type.split('(')[0].split()[0].upper()
+        if base_type == 'DATE':
+            date_columns.append(column)
+        elif column in CATEGORY_COLUMNS:
+            dtypes[column] = 'category'
+        else:
+            dtypes[column] = SQL_DTYPES.get(base_type, 'object')
+    return dtypes, date_columns
+
+
+def check_engine_config(config):
+    """
+    Проверка, что при check_mode = engine сохраняются файлы выгрузок, по которым вычисляются расхождения:
+    файл мастер-системы (master_transfer_mode = csv) и файлы порций исторической системы (stream_historical =
+    false) с полными данными (load_mode = full), и заданы коды допустимых статусов исторической системы.
+    :raises ValueError: Режим engine несовместим с параметрами обработки.
+    """
+    processing = config['processing']
+    problems = []
+    if processing['master_transfer_mode'] != 'csv':
+        problems.append("master_transfer_mode = csv")
+    if processing['stream_historical']:
+        problems.append("stream_historical = false")
+    if processing['load_mode'] == 'delta':
+        problems.append("load_mode = full")
+    for account_type, statuses in processing['valid_statuses'].items():
+        if not statuses:
+            problems.append(f"valid_statuses_{account_type} (коды допустимых статусов)")
+    if problems:
+        raise ValueError(f"Режим проверок engine требует параметров: {', '.join(problems)}.")
+
+
+def read_csv_header(file_path, encoding):
+    """
+    Имена столбцов из заголовка CSV-файла в нижнем регистре (Netezza записывает заголовок внешней таблицы
+    в верхнем регистре).
+    """
+    with open(file_path, encoding=encoding) as f:
+        return [name.strip().strip('"').lower() for name in f.readline().rstrip('\r\n').split(';')]
+
+
+def read_table_csv(file_path, table_name, encoding=None):
+    """
+    Чтение CSV-файла выгрузки (разделитель ';', с заголовком) со столбцами таблицы table_name.
+    Имена столбцов заголовка сравниваются без учета регистра. Типы столбцов берутся из описания таблицы
+    (см. column_dtypes), даты читаются как datetime64.
+    :param encoding: Кодировка файла (по умолчанию кодировка системы, как при загрузке файлов в мониторинг).
+    """
+    encoding = encoding or locale.getpreferredencoding(False)
+    columns = list(get_table_spec(table_name).columns)
+    dtypes, date_columns = column_dtypes(table_name)
+    return pd.read_csv(file_path, sep=';', header=0, names=read_csv_header(file_path, encoding), usecols=columns,
+                       dtype=dtypes, parse_dates=date_columns, date_format='ISO8601', encoding=encoding)
+
+
+def concat_frames(frames):
+    """Объединение таблиц с общими категориями для столбцов category (pd.concat привел бы их к object)."""
+    if len(frames) == 1:
+        return frames[0]
+    data = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            data[column] = union_categoricals(parts, ignore_order=True)
+        else:
+            data[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(data)
+
+
+def load_master_frame(temp_directory, account_type):
+    """Данные мастер-системы из файла temp_data/master_<type>_ils.csv."""
+    file_path = path.join(temp_directory, f'master_{account_type}_ils.csv')
+    if not path.exists(file_path):
+        raise FileNotFoundError(f"Файл выгрузки мастер-системы {file_path} не найден "
+                                f"(требуется master_transfer_mode = csv).")
+    return read_table_csv(file_path, f'master_{account_type}_ils')
+
+
+def load_historical_frame(temp_directory, account_type):
+    """Данные исторической системы из файлов порций temp_data/vlg_mic_historical_<type>_ils/*.csv."""
+    directory = path.join(temp_directory, f'vlg_mic_historical_{account_type}_ils')
+    files = sorted(f for f in listdir(directory) if f.endswith('.csv')) if path.isdir(directory) else []
+    if not files:
+        raise FileNotFoundError(f"Файлы порций исторической системы в {directory} не найдены "
+                                f"(требуется stream_historical = false).")
+    return concat_frames([read_table_csv(path.join(directory, f), f'historical_{account_type}_ils')
+                          for f in files])
+
+
+def _aligned_codes(master_values, historical_values):
+    """Коды категорий двух столбцов в общем наборе категорий (пропуск - код -1)."""
+    categories = master_values.cat.categories.union(historical_values.cat.categories)
+    return (master_values.cat.set_categories(categories).cat.codes.to_numpy(),
+            historical_values.cat.set_categories(categories).cat.codes.to_numpy())
+
+
+def compute_discrepancies(master, historical, account_type, valid_statuses):
+    """
+    Вычисление расхождений мастер-системы и исторической системы по всем признакам за один проход.
+    Строки исторической системы упорядочиваются по acc_id, для каждой строки мастер-системы соответствующая
+    строка находится двоичным поиском; сравнения выполняются над массивами целиком. Пропуски сравниваются как
+    в IS DISTINCT FROM (два пропуска равны), пустой статус считается расхождением. При повторах acc_id
+    в исторической системе используется первая строка.
+    :param master: Данные мастер-системы (load_master_frame).
+    :param historical: Данные исторической системы (load_historical_frame).
+    :param valid_statuses: Коды допустимых статусов (acc_sts) в исторической системе.
+    :return: Словарь {признак расхождения: DataFrame со столбцами check_result_columns}.
+    """
+    if not valid_statuses:
+        raise ValueError(f"Не заданы коды допустимых статусов исторической системы для {account_type}.")
+    historical = historical.sort_values('acc_id', kind='stable').drop_duplicates('acc_id').reset_index(drop=True)
+    historical_ids = historical['acc_id'].to_numpy()
+    master_ids = master['acc_id'].to_numpy()
+
+    positions = np.searchsorted(historical_ids, master_ids)
+    found = positions < len(historical_ids)
+    found[found] = historical_ids[positions[found]] == master_ids[found]
+    # Номера найденных строк мастер-системы и соответствующих строк исторической системы
+    master_rows = np.flatnonzero(found)
+    historical_rows = positions[master_rows]
+
+    def found_mask(condition):
+        mask = np.zeros(len(master), dtype=bool)
+        mask[master_rows] = condition
+        return mask
+
+    statuses = historical['acc_sts'].take(historical_rows)
+    masks = {
+        'missing_in_historical': ~found,
+        'status_mismatch': found_mask(~statuses.isin(valid_statuses).to_numpy(dtype=bool)),
+    }
+    for column, flag in COMPARED_COLUMNS[account_type].items():
+        if isinstance(master[column].dtype, pd.CategoricalDtype):
+            master_codes, historical_codes = _aligned_codes(master[column], historical[column])
+        else:
+            # Даты сравниваются как целые числа (NaT - одно и то же значение)
+            master_codes = master[column].to_numpy().view('i8')
+            historical_codes = historical[column].to_numpy().view('i8')
+        masks[flag] = found_mask(master_codes[master_rows] != historical_codes[historical_rows])
+
+    discrepancies = {}
+    for flag, mask in masks.items():
+        columns = check_result_columns(account_type, flag)
+        result = master.loc[mask, [column for column in columns if column in master.columns]].copy()
+        for column in columns:
+            if column not in result.columns:
+                historical_column = column[len('historical_'):]
+                result[column] = historical[historical_column].take(positions[mask]).to_numpy()
+        discrepancies[flag] = result[columns].reset_index(drop=True)
+    return discrepancies
+
+
+def frame_to_rows(frame):
+    """
+    Преобразование результата в (столбцы, строки) в виде, возвращаемом драйвером базы данных: даты - date,
+    пропуски - None.
+    """
+    frame = frame.copy()
+    for column in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].dt.date
+    frame = frame.astype(object).where(frame.notna(), None)
+    return list(frame.columns), list(frame.itertuples(index=False, name=None))
+
+
+def run_vectorized_reconciliation(temp_directory, account_type, valid_statuses):
+    """
+    Расхождения по типу лицевых счетов по файлам выгрузок в temp_data, без загрузки в базу мониторинга.
+    :return: Словарь {признак расхождения: DataFrame}.
+    """
+    start_time = time.time()
+    master = load_master_frame(temp_directory, account_type)
+    historical = load_historical_frame(temp_directory, account_type)
+    load_time = time.time()
+    discrepancies = compute_discrepancies(master, historical, account_type, valid_statuses)
+    end_time = time.time()
+    counts = ', '.join(f"{flag}: {len(frame)}" for flag, frame in discrepancies.items())
+    logging.info(f"Расхождения для {account_type} вычислены по файлам ({len(master)} строк мастер-системы, "
+                 f"{len(historical)} строк исторической системы): {counts}. Время чтения файлов: "
+                 f"{load_time - start_time:.2f} секунд, вычисления: {end_time - load_time:.2f} секунд.")
+    return discrepancies
@@ -0,0 +1,59 @@
+import numpy as np
+
+# Количество идентификаторов в одной порции при итерации порциями
+DEFAULT_CHUNK_SIZE = 100000
+
+
+class AccIdSet:
+    """
+    Множество идентификаторов лицевых счетов (acc_id) в виде отсортированного массива NumPy int64 без повторов.
+    Один идентификатор занимает 8 байт; разность множеств выполняется над массивами целиком.
+    """
+
+    def __init__(self, ids=None):
+        """
+        :param ids: Идентификаторы (последовательность или массив, порядок и повторы не важны).
+        """
+        if ids is None:
+            ids = np.empty(0, dtype=np.int64)
+        self._ids = np.unique(np.asarray(ids, dtype=np.int64))
+
+    @classmethod
+    def _from_sorted(cls, array):
+        """Создание множества из уже отсортированного массива без повторов (без копирования)."""
+        id_set = cls.__new__(cls)
+        id_set._ids = array
+        return id_set
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """
+        Построение множества из порций идентификаторов (например, собранных из порций строк курсора).
+        :param chunks: Итератор порций: массивов или списков чисел.
+        """
+        # Повторы удаляются в каждой порции, чтобы не держать в памяти лишние значения
+        arrays = [np.unique(np.asarray(chunk, dtype=np.int64)) for chunk in chunks if len(chunk)]
+        if not arrays:
+            return cls()
+        return cls(np.concatenate(arrays))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk.tolist()
+
+    def __repr__(self):
+        return f"AccIdSet({len(self)} идентификаторов)"
+
+    def difference(self, other):
+        """Идентификаторы, отсутствующие в другом множестве."""
+        return self._from_sorted(np.setdiff1d(self._ids, other._ids, assume_unique=True))
+
+    __sub__ = difference
+
+    def chunks(self, size=DEFAULT_CHUNK_SIZE):
+        """Итерация порциями по size идентификаторов (массивы NumPy, например, для пакетных SQL-запросов)."""
+        for start in range(0, len(self._ids), size):
+            yield self._ids[start:start + size]
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
+STATE_FILE = 'processing_state.json'
+
+# Соответствие номеров этапов из прежнего формата состояния ('current_step') выполненным задачам
+LEGACY_STEP_TASKS = {
+    1: ['master:opening'],
+    2: ['master:closing'],
+    3: ['ids:opening', 'ids:closing'],
+    4: ['to_historical:opening', 'to_historical:closing'],
+    5: ['from_historical:opening', 'from_historical:closing'],
+    6: ['to_monitoring:opening', 'to_monitoring:closing'],
+}
+
+
+def read_processing_state(state_file=STATE_FILE):
+    """Чтение состояния обработки из JSON-файла."""
+    if os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+        # Преобразование состояния из прежнего формата с номером этапа
+        if 'current_step' in state:
+            current_step = state.pop('current_step')
+            state['completed_tasks'] = [task for step, tasks in LEGACY_STEP_TASKS.items() if step <= current_step
+                                        for task in tasks]
+        return state
+    return {}
+
+
+def write_processing_state(state, state_file=STATE_FILE):
+    """
+    Атомарная запись состояния обработки в JSON-файл.
+    Состояние записывается во временный файл в том же каталоге, который затем переименовывается в файл состояния,
+    поэтому при сбое во время записи сохраняется предыдущая версия состояния.
+    """
+    directory = os.path.dirname(os.path.abspath(state_file))
+    fd, temp_path = tempfile.mkstemp(prefix='.processing_state_', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, state_file)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class ProcessingState:
+    """
+    Состояние обработки с контрольными точками внутри этапов.
+    Контрольные точки сгруппированы по областям (например, 'offset:opening' - выгруженные порции,
+    'loaded:historical_opening_ils' - загруженные файлы, 'checks' - выполненные проверки).
+    Методы потокобезопасны, каждое изменение сразу сохраняется в файл.
+    """
+
+    def __init__(self, state_file=STATE_FILE):
+        self.state_file = state_file
+        self._lock = threading.RLock()
+        self._state = read_processing_state(state_file)
+
+    def get(self, key, default=None):
+        """Получение значения из состояния."""
+        with self._lock:
+            return self._state.get(key, default)
+
+    def set(self, key, value):
+        """Изменение значения в состоянии с сохранением в файл."""
+        with self._lock:
+            self._state[key] = value
+            self.save()
+
+    def save(self):
+        """Сохранение состояния в файл."""
+        with self._lock:
+            write_processing_state(self._state, self.state_file)
+
+    def is_fresh(self):
+        """Проверка, что обработка начинается с начала (нет выполненных задач и контрольных точек)."""
+        with self._lock:
+            return not self._state.get('completed_tasks') and not self._state.get('checkpoints')
+
+    def completed_tasks(self):
+        """Список выполненных задач."""
+        with self._lock:
+            return list(self._state.get('completed_tasks', []))
+
+    def mark_task_done(self, task_name):
+        """Отметка о выполнении задачи."""
+        with self._lock:
+            self._state.setdefault('completed_tasks', []).append(task_name)
+            self.save()
+
+    def get_checkpoints(self, scope):
+        """Все контрольные точки области в виде словаря {ключ: сведения}."""
+        with self._lock:
+            return dict(self._state.get('checkpoints', {}).get(scope, {}))
+
+    def get_checkpoint(self, scope, key):
+        """Сведения контрольной точки или None, если она не пройдена."""
+        with self._lock:
+            return self._state.get('checkpoints', {}).get(scope, {}).get(str(key))
+
+    def mark_checkpoint(self, scope, key, info=True):
+        """
+        Отметка о прохождении контрольной точки.
+        :param scope: Область контрольных точек.
+        :param key: Ключ контрольной точки внутри области.
+        :param info: Сведения для проверки результата при возобновлении (например, имя файла и количество строк).
+        """
+        with self._lock:
+            self._state.setdefault('checkpoints', {}).setdefault(scope, {})[str(key)] = info
+            self.save()
+
+    def clear_checkpoints(self, scope):
+        """Удаление контрольных точек области."""
+        with self._lock:
+            if self._state.get('checkpoints', {}).pop(scope, None) is not None:
+                self.save()
+
+    def reset(self):
+        """Сброс выполненных задач и контрольных точек после завершения обработки (отметки сохраняются)."""
+        with self._lock:
+            self._state['completed_tasks'] = []
+            self._state.pop('checkpoints', None)
+            self.save()
+        logging.info("Состояние обработки сброшено.")
+
+
+def is_file_checkpoint_valid(checkpoint, consumed_files=None):
+    """
+    Проверка, что файл, записанный в контрольной точке, существует и не изменился.
+    :param checkpoint: Сведения контрольной точки с ключами 'file' и 'size'.
+    :param consumed_files: Имена файлов, которые уже загружены и удалены (такие файлы считаются выгруженными).
+    """
+    if not checkpoint or not isinstance(checkpoint, dict) or 'file' not in checkpoint:
+        return False
+    file_path = checkpoint['file']
+    if consumed_files and os.path.basename(file_path) in consumed_files:
+        return True
+    return os.path.exists(file_path) and os.path.getsize(file_path) == checkpoint.get('size')
@@ -0,0 +1,130 @@
+import logging
+import threading
+
+# Этапы обработки, по которым учитывается количество строк
+STAGE_MASTER_EXPORT = 'master_export'
+STAGE_MONITORING_LOAD = 'monitoring_load'
+STAGE_IDS_EXPORT = 'ids_export'
+STAGE_IDS_LOAD = 'ids_load'
+STAGE_HISTORICAL_EXPORT = 'historical_export'
+
+# Счетчики строк по частям (файлам, порциям) таблицы
+COUNTERS = ('exported', 'loaded', 'rejected')
+
+# Префикс областей контрольных точек, в которых сохраняется журнал запуска
+CHECKPOINT_PREFIX = 'manifest'
+
+_manifest_lock = threading.Lock()
+_manifest = {}
+_state = None
+
+
+def _scope(stage, table):
+    return f"{CHECKPOINT_PREFIX}:{stage}:{table}"
+
+
+def configure_run_manifest(state=None):
+    """
+    Подключение журнала запуска к состоянию обработки.
+    Количество строк сохраняется в контрольных точках областей 'manifest:<этап>:<таблица>', поэтому при
+    возобновлении обработки учитываются части, обработанные при предыдущем запуске, а после завершения обработки
+    журнал сбрасывается вместе с остальными контрольными точками.
+    :param state: Состояние обработки (без него журнал ведется только в памяти).
+    """
+    global _state
+    with _manifest_lock:
+        _state = state
+        _manifest.clear()
+        checkpoints = (state.get('checkpoints') or {}) if state else {}
+        for scope, parts in checkpoints.items():
+            prefix, _, name = scope.partition(':')
+            if prefix == CHECKPOINT_PREFIX:
+                stage, _, table = name.partition(':')
+                _manifest.setdefault(stage, {})[table] = {part: dict(counts) for part, counts in parts.items()}
+
+
+def record_rows(stage, table, part='', exported=None, loaded=None, rejected=None):
+    """
+    Запись количества строк части таблицы на этапе обработки.
+    Повторная запись той же части (например, при повторной выгрузке порции) заменяет переданные счетчики.
+    :param stage: Этап обработки (STAGE_*).
+    :param table: Таблица (или файл) этапа.
+    :param part: Часть таблицы - имя файла или порции (по умолчанию таблица целиком).
+    :param exported: Количество выгруженных строк.
+    :param loaded: Количество загруженных строк.
+    :param rejected: Количество строк, отклоненных при загрузке.
+    """
+    values = {'exported': exported, 'loaded': loaded, 'rejected': rejected}
+    with _manifest_lock:
+        counts = _manifest.setdefault(stage, {}).setdefault(table, {}).setdefault(str(part), {})
+        counts.update({key: value for key, value in values.items() if value is not None})
+        if _state is not None:
+            _state.mark_checkpoint(_scope(stage, table), part, dict(counts))
+
+
+def clear_rows(stage, table):
+    """Удаление записей таблицы на этапе (таблица выгружается или загружается заново)."""
+    with _manifest_lock:
+        _manifest.get(stage, {}).pop(table, None)
+        if _state is not None:
+            _state.clear_checkpoints(_scope(stage, table))
+
+
+def table_rows(stage, table):
+    """
+    Количество строк таблицы на этапе по всем частям.
+    :return: Словарь {счетчик: количество} по записанным счетчикам или None, если по таблице нет записей.
+    """
+    with _manifest_lock:
+        parts = _manifest.get(stage, {}).get(table)
+        if not parts:
+            return None
+        return {key: sum(counts[key] for counts in parts.values() if key in counts)
+                for key in COUNTERS if any(key in counts for counts in parts.values())}
+
+
+def row_count(stage, table, counter):
+    """Значение счетчика таблицы на этапе или None, если оно не записано."""
+    return (table_rows(stage, table) or {}).get(counter)
+
+
+def run_manifest():
+    """Копия журнала запуска: {этап: {таблица: {счетчик: количество}}}."""
+    with _manifest_lock:
+        tables = {stage: list(stage_tables) for stage, stage_tables in _manifest.items()}
+    manifest = {}
+    for stage, names in tables.items():
+        for table in names:
+            counts = table_rows(stage, table)
+            if counts:
+                manifest.setdefault(stage, {})[table] = counts
+    return manifest
+
+
+def compare_rows(source, target):
+    """
+    Сверка количества строк двух этапов.
+    :param source: Кортеж (этап, таблица, счетчик) - например, выгруженные строки.
+    :param target: Кортеж (этап, таблица, счетчики) - сумма счетчиков должна совпадать с source, например
+        загруженные и отклоненные строки.
+    :return: Описание расхождения или None, если количества совпадают или одно из них не записано.
+    """
+    source_stage, source_table, source_counter = source
+    target_stage, target_table, target_counters = target
+    expected = row_count(source_stage, source_table, source_counter)
+    target_counts = table_rows(target_stage, target_table)
+    if expected is None or not target_counts or not any(key in target_counts for key in target_counters):
+        return None
+    actual = sum(target_counts.get(key, 0) for key in target_counters)
+    if actual == expected:
+        return None
+    return (f"{source_stage} {source_table} ({source_counter}): {expected}, {target_stage} {target_table} "
+            f"({' + '.join(target_counters)}): {actual}")
+
+
+def log_run_manifest():
+    """Вывод в лог количества строк по этапам обработки."""
+    for stage, tables in run_manifest().items():
+        for table, counts in sorted(tables.items()):
+            logging.info(f"Количество строк ({stage}, {table}): "
+                         f"{', '.join(f'{key} {value}' for key, value in counts.items())}.")
@@ -0,0 +1,109 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Task:
+    """Задача конвейера обработки с зависимостями от других задач."""
+
+    def __init__(self, name, func, depends_on=None, description=None):
+        """
+        :param name: Уникальное имя задачи.
+        :param func: Функция без аргументов, возвращающая True при успешном выполнении.
+        :param depends_on: Список имен задач, которые должны быть выполнены до запуска данной задачи.
+        :param description: Описание задачи для логирования (по умолчанию имя задачи).
+        """
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on or [])
+        self.description = description or name
+
+
+def validate_tasks(tasks):
+    """Проверка графа задач: уникальность имен, наличие зависимостей и отсутствие циклов."""
+    tasks_by_name = {}
+    for task in tasks:
+        if task.name in tasks_by_name:
+            raise ValueError(f"Задача {task.name} объявлена более одного раза.")
+        tasks_by_name[task.name] = task
+
+    for task in tasks:
+        for dependency in task.depends_on:
+            if dependency not in tasks_by_name:
+                raise ValueError(f"Задача {task.name} зависит от неизвестной задачи {dependency}.")
+
+    # Поиск циклов обходом в глубину
+    visited, in_progress = set(), set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in in_progress:
+            raise ValueError(f"Обнаружена циклическая зависимость задач: {name}.")
+        in_progress.add(name)
+        for dependency in tasks_by_name[name].depends_on:
+            visit(dependency)
+        in_progress.discard(name)
+        visited.add(name)
+
+    for name in tasks_by_name:
+        visit(name)
+    return tasks_by_name
+
+
+def run_tasks(tasks, max_workers=2, completed=None, on_task_done=None):
+    """
+    Выполнение задач с учетом зависимостей на ограниченном пуле потоков.
+    Независимые задачи выполняются параллельно, задачи, зависящие от неуспешных, не запускаются.
+    :param tasks: Список задач Task.
+    :param max_workers: Максимальное количество одновременно выполняемых задач.
+    :param completed: Множество имен задач, выполненных ранее (такие задачи пропускаются).
+    :param on_task_done: Функция, вызываемая в основном потоке с именем и результатом успешно выполненной задачи.
+    :return: True, если все задачи выполнены успешно, иначе False.
+    """
+    tasks_by_name = validate_tasks(tasks)
+    done = set(name for name in (completed or []) if name in tasks_by_name)
+    failed = set()
+    pending = [task for task in tasks if task.name not in done]
+    running = {}
+
+    for name in done:
+        logging.info(f"Задача '{tasks_by_name[name].description}' выполнена ранее, пропускаем.")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # Задачи, зависящие от неуспешных, не будут запущены
+            for task in list(pending):
+                if any(dependency in failed for dependency in task.depends_on):
+                    logging.error(f"Задача '{task.description}' пропущена из-за ошибки в зависимых задачах.")
+                    failed.add(task.name)
+                    pending.remove(task)
+
+            # Запуск задач, все зависимости которых выполнены
+            for task in list(pending):
+                if all(dependency in done for dependency in task.depends_on):
+                    logging.info(f"Запуск задачи '{task.description}'.")
+                    running[executor.submit(task.func)] = task
+                    pending.remove(task)
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"Ошибка при выполнении задачи '{task.description}': {e}")
+                    result = False
+
+                if result:
+                    logging.info(f"Задача '{task.description}' выполнена.")
+                    done.add(task.name)
+                    if on_task_done:
+                        on_task_done(task.name, result)
+                else:
+                    logging.error(f"Задача '{task.description}' завершилась с ошибкой.")
+                    failed.add(task.name)
+
+    return not failed and len(done) == len(tasks_by_name)
@@ -0,0 +1,187 @@
+import os
+import queue
+import threading
+
+# Признак завершения записи в канал
+_EOF = object()
+
+
+class PipeAborted(Exception):
+    """Передача данных через канал прервана другой стороной."""
+
+
+class BoundedPipe:
+    """
+    Ограниченный канал в памяти для передачи потока байтов между двумя потоками.
+    Пишущая сторона используется как файл для COPY ... TO STDOUT, читающая - как файл для COPY ... FROM STDIN.
+    Объем данных в памяти ограничен значением max_chunks * chunk_size.
+    """
+
+    def __init__(self, chunk_size=1024 * 1024, max_chunks=16):
+        """
+        :param chunk_size: Размер блока данных, передаваемого между потоками (в байтах).
+        :param max_chunks: Максимальное количество блоков в очереди.
+        """
+        self.chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._write_buffer = bytearray()
+        self._read_buffer = b''
+        self._read_offset = 0
+        self._eof = False
+        self._aborted = threading.Event()
+        self._writer_error = None
+        self.bytes_transferred = 0
+
+    # Пишущая сторона
+
+    def write(self, data):
+        """Запись данных в канал (вызывается курсором при COPY ... TO STDOUT)."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._write_buffer += data
+        if len(self._write_buffer) >= self.chunk_size:
+            self._put(bytes(self._write_buffer))
+            self._write_buffer = bytearray()
+        return len(data)
+
+    def close_writer(self, error=None):
+        """
+        Завершение записи в канал.
+        :param error: Исключение пишущей стороны, которое будет передано читающей стороне.
+        """
+        if self._aborted.is_set():
+            return
+        if error is None and self._write_buffer:
+            self._put(bytes(self._write_buffer))
+        self._write_buffer = bytearray()
+        self._writer_error = error
+        self._put(_EOF)
+
+    def _put(self, item):
+        """Помещение блока в очередь с проверкой прерывания со стороны читателя."""
+        while True:
+            if self._aborted.is_set():
+                raise PipeAborted("Чтение из канала прервано.")
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    # Читающая сторона
+
+    def read(self, size=-1):
+        """Чтение данных из канала (вызывается курсором при COPY ... FROM STDIN)."""
+        if size is None or size < 0:
+            size = self.chunk_size
+        while not self._eof and self._read_offset >= len(self._read_buffer):
+            item = self._queue.get()
+            if item is _EOF:
+                self._eof = True
+                if self._writer_error is not None:
+                    raise PipeAborted(f"Запись в канал прервана: {self._writer_error}")
+            else:
+                self._read_buffer = item
+                self._read_offset = 0
+        if self._eof and self._read_offset >= len(self._read_buffer):
+            return b''
+        data = self._read_buffer[self._read_offset:self._read_offset + size]
+        self._read_offset += len(data)
+        self.bytes_transferred += len(data)
+        return data
+
+    def readline(self, size=-1):
+        """Чтение строки из канала."""
+        line = bytearray()
+        while size is None or size < 0 or len(line) < size:
+            data = self.read(1)
+            if not data:
+                break
+            line += data
+            if data == b'\n':
+                break
+        return bytes(line)
+
+    def abort(self):
+        """Прерывание передачи со стороны читателя: пишущая сторона получит исключение PipeAborted."""
+        self._aborted.set()
+        # Освобождение очереди, чтобы разблокировать пишущую сторону
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class ChunkedFileWriter:
+    """
+    Файл для COPY ... TO STDOUT, записывающий поток строк в последовательность файлов по chunk_rows строк.
+    После заполнения очередного файла вызывается обработчик on_chunk(путь к файлу, количество строк), поэтому
+    файлы можно загружать, пока выгрузка продолжается.
+    """
+
+    def __init__(self, directory, file_base, chunk_rows, on_chunk):
+        """
+        :param directory: Каталог файлов.
+        :param file_base: Начало имени файлов (файлы называются <file_base>_<номер>.csv).
+        :param chunk_rows: Количество строк в одном файле.
+        :param on_chunk: Обработчик заполненного файла.
+        """
+        self.directory = directory
+        self.file_base = file_base
+        self.chunk_rows = chunk_rows
+        self.on_chunk = on_chunk
+        self.rows_written = 0
+        self.files_written = 0
+        self._file = None
+        self._file_path = None
+        self._file_rows = 0
+        self._tail = b''
+
+    def write(self, data):
+        """Запись данных (вызывается курсором при COPY ... TO STDOUT)."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        size = len(data)
+        data = self._tail + data
+        lines_end = data.rfind(b'\n') + 1
+        self._tail = data[lines_end:]
+        self._write_lines(data[:lines_end])
+        return size
+
+    def close(self):
+        """Завершение записи: последний неполный файл также передается обработчику."""
+        if self._tail:
+            self._write_lines(self._tail + b'\n')
+            self._tail = b''
+        self._finish_file()
+
+    def _write_lines(self, lines):
+        """Запись полных строк с переходом к следующему файлу после каждых chunk_rows строк."""
+        while lines:
+            if self._file is None:
+                self.files_written += 1
+                self._file_path = os.path.join(self.directory, f"{self.file_base}_{self.files_written}.csv")
+                self._file = open(self._file_path, 'wb')
+                self._file_rows = 0
+            free_rows = self.chunk_rows - self._file_rows
+            if lines.count(b'\n') <= free_rows:
+                part, lines = lines, b''
+            else:
+                position = -1
+                for _ in range(free_rows):
+                    position = lines.index(b'\n', position + 1)
+                part, lines = lines[:position + 1], lines[position + 1:]
+            self._file.write(part)
+            rows = part.count(b'\n')
+            self._file_rows += rows
+            self.rows_written += rows
+            if self._file_rows >= self.chunk_rows:
+                self._finish_file()
+
+    def _finish_file(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self.on_chunk(self._file_path, self._file_rows)